@@ -0,0 +1,12 @@
+## benchmarks for the analysis pipeline, run them from the repo root, e.g.
+##   python -m benchmarks.run_benchmarks --countries 200 2000 --output bench_results.json
+##   python -m benchmarks.bench_curve_fit
+##   python -m benchmarks.bench_startup --repeat 5
+##   python -m benchmarks.bench_streaming --countries 2000 --days 200
+##   python -m benchmarks.bench_payload --days 1500 --html-dir payload_html
+##   python -m benchmarks.bench_rolling --countries 200 2000
+##   python -m benchmarks.bench_backends --countries 200 2000
+##   python -m benchmarks.bench_service --countries 500 --clients 8 --requests 2000
+##   python -m benchmarks.bench_fetch --countries 2000 --days 200
+##   python -m benchmarks.bench_validation --countries 200 2000 --chunksize 50000
+##   python -m benchmarks.bench_rollup --countries 200 2000 --thresholds 500
@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import tempfile
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.backends import BACKENDS, build_frames, check_parity
+from vaccinations.instrument import StageRecorder
+
+
+## the threads each engine runs its queries on (pandas is always one)
+def _threads(backend):
+    if backend == 'polars':
+        import polars as pl
+
+        return pl.thread_pool_size()
+    if backend == 'duckdb':
+        import duckdb
+
+        return duckdb.connect().execute("SELECT current_setting('threads')").fetchone()[0]
+    return 1
+
+
+## the frame build on each backend over synthetic datasets: wall and cpu seconds of each step
+## (cpu above wall is the engine running on more than one core), and whether the frames match the pandas build
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'the frame build on the pandas, polars and duckdb backends')
+    parser.add_argument('--countries', type = int, nargs = '+', default = [200, 2000])
+    parser.add_argument('--days', type = int, default = 250)
+    parser.add_argument('--backends', nargs = '+', default = list(BACKENDS), choices = BACKENDS)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    report = []
+    for n_countries in args.countries:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_dataset(directory, n_countries = n_countries, n_days = args.days, seed = args.seed)
+            parity = check_parity(paths, args.backends)
+
+            for backend in parity:
+                recorder = StageRecorder()
+                with recorder.stage('build_frames') as record:
+                    frames = build_frames(paths, backend, recorder = recorder)
+                    record['rows'] = len(frames['full_df'])
+                report.append({
+                    'countries': n_countries,
+                    'rows': record['rows'],
+                    'backend': backend,
+                    'cpus': os.cpu_count(),
+                    'threads': _threads(backend),
+                    'wall_seconds': record['wall_seconds'],
+                    'cpu_seconds': record['cpu_seconds'],
+                    'stages': {stage['stage']: {'wall_seconds': stage['wall_seconds'], 'cpu_seconds': stage['cpu_seconds']}
+                               for stage in recorder.stages if stage['depth'] == 1},
+                    'matches_pandas': not parity[backend]['mismatches']
+                })
+
+    print(json.dumps(report, indent = 2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
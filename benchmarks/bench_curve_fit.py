@@ -0,0 +1,75 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from vaccinations.forecast import PARAM_COLS, curve_func, fit_curves, fit_quadratic_batch
+
+
+## synthetic people vaccinated per hundred curves, shaped like the real ones: a noisy, mostly increasing parabola per series
+def synthetic_series(n_series, n_days, seed = 0):
+    rng = np.random.default_rng(seed)
+    days = np.tile(np.arange(n_days), n_series)
+    series = np.repeat(np.arange(n_series), n_days)
+    a = rng.uniform(0.05, 0.8, n_series)[series]
+    b = rng.uniform(-0.004, 0.01, n_series)[series]
+    noise = rng.normal(0, 0.3, n_series * n_days)
+    return pd.DataFrame({
+        'country': series,
+        'vaccination_day_number': days,
+        'people_vaccinated_per_hundred': np.clip(a * days + b * days**2 + noise, 0, None)
+    })
+
+
+## the loop the analysis script used to run: re-slice the frame and call curve_fit for each series
+def serial_curve_fit(df):
+    from scipy.optimize import curve_fit
+
+    results = {}
+    for country in df['country'].unique():
+        country_df = df[df['country'] == country]
+        popt, pcov = curve_fit(curve_func, xdata = np.array(country_df['vaccination_day_number']), ydata = np.array(country_df['people_vaccinated_per_hundred']))
+        results[country] = popt
+    return pd.DataFrame(results, index = PARAM_COLS).transpose()
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'compare the per-country curve_fit loop with the batched quadratic fit')
+    parser.add_argument('--series', type = int, nargs = '+', default = [100, 1000, 10000])
+    parser.add_argument('--days', type = int, default = 90)
+    parser.add_argument('--serial-limit', type = int, default = 2000, help = 'skip the serial loop above this many series')
+    parser.add_argument('--workers', type = int, default = None, help = 'also time the process pool curve_fit backend with this many workers')
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_series in args.series:
+        df = synthetic_series(n_series, args.days)
+        batch, batch_time = timed(fit_quadratic_batch, df)
+        row = {'series': n_series, 'days': args.days, 'batch_seconds': batch_time}
+
+        if n_series <= args.serial_limit:
+            serial, serial_time = timed(serial_curve_fit, df)
+            row['serial_seconds'] = serial_time
+            row['speedup'] = serial_time / batch_time
+            row['max_abs_param_diff'] = float(np.abs(batch[PARAM_COLS].to_numpy() - serial.loc[batch.index, PARAM_COLS].to_numpy()).max())
+
+        if args.workers is not None:
+            pooled, pooled_time = timed(fit_curves, df, max_workers = args.workers)
+            row['pool_seconds'] = pooled_time
+
+        results.append(row)
+        print(json.dumps(row))
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import filecmp
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.cache import load_frames
+from vaccinations.fetch import ConnectionPool, fetch_sources, source_urls
+from vaccinations.stand_in import start_server
+
+
+## the daily fetch against the local stand-in server, over a synthetic dataset, one scenario after another:
+##   - cold: nothing local yet, every file is downloaded
+##   - unchanged: every file is a 304, nothing is downloaded or written, and the frames come straight out of the cache
+##   - new_day: the vaccinations file gains a day upstream, only it is downloaded (and the frames rebuilt)
+##   - cut_off: the next day's download drops halfway, the old file stays in place, and the next fetch (resumed) only asks for the rest
+##   - no_validators: a server without ETag / Last-Modified sends every file again, but identical content leaves the local files alone
+## each scenario reports the statuses, the bytes the server sent, the fetch and load_frames seconds, and whether the local files match upstream
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'conditional, resumable fetch of the source csvs against the local stand-in server')
+    parser.add_argument('--countries', type = int, default = 2000)
+    parser.add_argument('--days', type = int, default = 200)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        published, local, cache_dir = (os.path.join(directory, name) for name in ['published', 'local', 'cache'])
+        upstream = write_dataset(published, n_countries = args.countries, n_days = args.days, seed = args.seed)
+        paths = {name: os.path.join(local, os.path.basename(path)) for name, path in upstream.items()}
+        state_path = os.path.join(local, 'fetch_state.json')
+        server, base_url = start_server(published)
+        pool = ConnectionPool()
+
+        def scenario(name):
+            sent_before = server.bytes_sent
+            start = time.perf_counter()
+            results = fetch_sources(source_urls(base_url, paths), paths, state_path, pool = pool)
+            fetch_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            if all(os.path.exists(path) for path in paths.values()):
+                load_frames(paths, cache_dir)
+            report.append({
+                'scenario': name,
+                'statuses': {source: result['status'] for source, result in results.items()},
+                'bytes_sent': server.bytes_sent - sent_before,
+                'fetch_seconds': fetch_seconds,
+                'load_frames_seconds': time.perf_counter() - start,
+                'connections_opened': pool.opened,
+                'matches_upstream': all(filecmp.cmp(paths[source], upstream[source], shallow = False) for source in paths)
+            })
+
+        ## upstream only ever re-uploads the vaccinations file, with another day on it
+        def publish_day(n_days):
+            new_paths = write_dataset(os.path.join(directory, f'day_{n_days}'), n_countries = args.countries, n_days = n_days, seed = args.seed)
+            shutil.copyfile(new_paths['vaccinations'], upstream['vaccinations'])
+
+        scenario('cold')
+        scenario('unchanged')
+        publish_day(args.days + 1)
+        scenario('new_day')
+
+        publish_day(args.days + 2)
+        server.cut_next[os.path.basename(upstream['vaccinations'])] = os.path.getsize(upstream['vaccinations']) // 2
+        scenario('cut_off')
+        scenario('resumed')
+
+        server.validators = False
+        scenario('no_validators')
+        server.shutdown()
+        pool.close()
+
+    print(json.dumps(report, indent = 2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import write_dataset
+from vaccinations import charts
+from vaccinations.chart_data import SeriesStore
+from vaccinations.downsample import COMPACT_LINES, LineOptions, payload_report, write_timed_html
+from vaccinations.pipeline import build_frames
+
+
+## the line chart settings to compare, from drawing every point to the compact mode
+SETTINGS = {
+    'full': LineOptions(),
+    'webgl': LineOptions(webgl_threshold = 0),
+    'shared_x': LineOptions(shared_x = True),
+    'lttb_1000': LineOptions(max_points = 1000),
+    'lttb_300': LineOptions(max_points = 300),
+    'compact': COMPACT_LINES
+}
+
+
+## builds the top-n countries line chart over a long synthetic history with each setting,
+## reporting the build time and payload of each (and, with --html-dir, writing each one out with a render timer for a browser)
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'payload size and build time of the multi-country line charts with each downsampling setting')
+    parser.add_argument('--countries', type = int, default = 60)
+    parser.add_argument('--days', type = int, default = 1500)
+    parser.add_argument('--top', type = int, default = 50)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--html-dir', default = None, help = 'write each version of the chart here as html, showing how long it took to draw')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        frames = build_frames(write_dataset(directory, n_countries = args.countries, n_days = args.days, seed = args.seed))
+    adjusted_df, total_vacc_df = frames['adjusted_df'], frames['total_vacc_df']
+    store = SeriesStore.from_frame(adjusted_df)
+
+    report = {}
+    for name, options in SETTINGS.items():
+        start = time.perf_counter()
+        fig = charts.top_countries_figure(total_vacc_df, store, n = args.top, time_period = 'date', pop_adjusted = True, line_options = options)
+        build_seconds = time.perf_counter() - start
+        report[name] = {'options': options._asdict(), 'build_seconds': build_seconds, **payload_report(fig)}
+
+        if args.html_dir is not None:
+            os.makedirs(args.html_dir, exist_ok = True)
+            write_timed_html(fig, os.path.join(args.html_dir, f'top_countries_{name}.html'))
+
+    print(json.dumps({'rows': len(adjusted_df), 'settings': report}, indent = 2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
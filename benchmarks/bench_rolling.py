@@ -0,0 +1,53 @@
+import argparse
+import json
+import tempfile
+
+import pandas as pd
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.instrument import StageRecorder
+from vaccinations.pipeline import build_frames
+from vaccinations.rolling import RollingWindows, rolling_metrics
+
+
+## what a daily refresh of the rolling metrics costs: recomputing them over the whole history for each new day,
+## against adding just that day to a RollingWindows, for the last few days of a synthetic dataset
+## (and checks both give the same metrics for those days)
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'full recompute vs incremental update of the rolling-window metrics')
+    parser.add_argument('--countries', type = int, nargs = '+', default = [200, 2000])
+    parser.add_argument('--days', type = int, default = 300)
+    parser.add_argument('--new-days', type = int, default = 5)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    report = []
+    for n_countries in args.countries:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_dataset(directory, n_countries = n_countries, n_days = args.days, seed = args.seed)
+            adjusted_df = build_frames(paths)['adjusted_df']
+
+        cut = adjusted_df['date'].max() - pd.Timedelta(days = args.new_days)
+        recorder = StageRecorder()
+        windows = recorder.run('from_frame', RollingWindows.from_frame, adjusted_df[adjusted_df['date'] <= cut])
+        for date in sorted(adjusted_df.loc[adjusted_df['date'] > cut, 'date'].unique()):
+            history = adjusted_df[adjusted_df['date'] <= date]
+            full = recorder.run('full_recompute', rolling_metrics, history)
+            new = recorder.run('incremental_update', windows.update, history[history['date'] == date])
+            pd.testing.assert_frame_equal(new, full.loc[new.index], check_dtype = False)
+
+        seconds = {name: [stage['wall_seconds'] for stage in recorder.stages if stage['stage'] == name] for name in ['full_recompute', 'incremental_update']}
+        report.append({
+            'countries': n_countries,
+            'rows': len(adjusted_df),
+            'from_frame_seconds': recorder.stages[0]['wall_seconds'],
+            'full_recompute_seconds_per_day': sum(seconds['full_recompute']) / len(seconds['full_recompute']),
+            'incremental_update_seconds_per_day': sum(seconds['incremental_update']) / len(seconds['incremental_update'])
+        })
+
+    print(json.dumps(report, indent = 2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.pipeline import build_frames
+from vaccinations.rollup import ProgressRollup
+from vaccinations.summary import add_daily_rates
+
+
+## an interactive sweep over min_pop thresholds (as a slider on the progress treemap would do), and ranking every continent for its bar chart:
+## filtering and grouping / sorting the progress dataframe each time, against looking the same answers up in a ProgressRollup built once
+## (and checks both give the same continent totals and rankings)
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'min_pop sweeps and continent rankings, re-filtering the dataframe vs the precomputed rollup')
+    parser.add_argument('--countries', type = int, nargs = '+', default = [200, 2000])
+    parser.add_argument('--days', type = int, default = 60)
+    parser.add_argument('--thresholds', type = int, default = 500, help = 'how many min_pop values to sweep over')
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    metric = 'total_per_hundred'
+    report = []
+    for n_countries in args.countries:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_dataset(directory, n_countries = n_countries, n_days = args.days, seed = args.seed)
+            progress_df = add_daily_rates(build_frames(paths)['total_vacc_df'])
+        thresholds = np.random.default_rng(args.seed).uniform(0, progress_df['population'].max(), args.thresholds)
+
+        start = time.perf_counter()
+        rollup = ProgressRollup.from_frame(progress_df)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        filtered = []
+        for min_pop in thresholds:
+            chart_df = progress_df[progress_df['population'] >= min_pop]
+            filtered.append(chart_df.groupby('continent', sort = False)[metric].agg(['size', 'sum']))
+        filter_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        looked_up = [rollup.continent_totals(metric, min_pop) for min_pop in thresholds]
+        rollup_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sorted_dfs = [progress_df[progress_df['continent'] == cont].sort_values(by = 'average_daily_percent_vaccinated', ascending = False)
+                      for cont in progress_df['continent'].dropna().unique()]
+        sort_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        rankings = [rollup.ranking(cont) for cont in rollup.continents if cont is not None]
+        ranking_seconds = time.perf_counter() - start
+
+        totals_match = all(len(totals) == len(groups) and all(groups.loc[cont, 'size'] == count and np.isclose(groups.loc[cont, 'sum'], value)
+                                                              for cont, (count, value) in totals.items())
+                           for groups, totals in zip(filtered, looked_up))
+        rankings_match = all(a['average_daily_percent_vaccinated'].tolist() == b['average_daily_percent_vaccinated'].tolist()
+                             for a, b in zip(sorted_dfs, rankings))
+        report.append({
+            'countries': len(progress_df),
+            'build_seconds': build_seconds,
+            'filter_microseconds_per_threshold': filter_seconds / len(thresholds) * 1e6,
+            'rollup_microseconds_per_threshold': rollup_seconds / len(thresholds) * 1e6,
+            'sort_seconds_all_continents': sort_seconds,
+            'ranking_seconds_all_continents': ranking_seconds,
+            'totals_match': bool(totals_match),
+            'rankings_match': bool(rankings_match)
+        })
+
+    print(json.dumps(report, indent = 2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+import urllib.parse
+
+import numpy as np
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.pipeline import build_frames
+from vaccinations.service import QueryService
+
+
+## a mix of dashboard queries, drawn from a few dozen argument combinations so most of them repeat
+def _queries(vaccines, countries, rng):
+    pool = [f'/top_countries?n={n}&time_period={period}&pop_adjusted={adjusted}'
+            for n in (10, 25, 50) for period in ('date', 'vaccination_day_number') for adjusted in ('true', 'false')]
+    pool += [f'/avg_progress?vals={vals}&min_pop={min_pop}' for vals in ('total', 'average') for min_pop in (1000000, 10000000, 50000000)]
+    pool += ['/vaccine_map?' + urllib.parse.urlencode({'vaccine': vaccine}) for vaccine in vaccines[:5]]
+    pool += ['/country?' + urllib.parse.urlencode({'name': country}) for country in countries[:10]]
+    return lambda: rng.choice(pool)
+
+
+async def _get(reader, writer, target, method = 'GET'):
+    writer.write(f'{method} {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+## clients each send their share of requests over one keep-alive connection, and halfway through one of them posts /reload
+## (with the loader already pointing at a newer dataset), so the swap happens while the others are mid-stream
+async def _run(service, next_query, n_clients, n_requests, switch):
+    started = asyncio.Event()
+    server = asyncio.create_task(service.serve(port = 0, started = started))
+    await started.wait()
+
+    latencies, statuses = [], []
+
+    async def client(i):
+        reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+        for j in range(n_requests // n_clients):
+            if i == 0 and j == n_requests // n_clients // 2:
+                switch()
+                statuses.append((await _get(reader, writer, '/reload', 'POST'))[0])
+            start = time.perf_counter()
+            status, _ = await _get(reader, writer, next_query())
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses.append(status)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(n_clients)))
+    seconds = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+    stats = (await _get(reader, writer, '/stats'))[1]
+    writer.close()
+    server.cancel()
+    return latencies, statuses, seconds, stats
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'latency of the query service with and without its LRU cache, across a hot swap of the data')
+    parser.add_argument('--countries', type = int, default = 500)
+    parser.add_argument('--days', type = int, default = 200)
+    parser.add_argument('--clients', type = int, default = 8)
+    parser.add_argument('--requests', type = int, default = 2000)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        ## the day before and the day of the refresh
+        frames = [build_frames(write_dataset(f'{directory}/{days}', n_countries = args.countries, n_days = days, seed = args.seed))
+                  for days in (args.days - 1, args.days)]
+
+        for cache_size in (0, 1024):
+            current = {'frames': frames[0]}
+            service = QueryService(lambda: current['frames'], cache_size = cache_size)
+            next_query = _queries(sorted(frames[0]['adjusted_df']['vaccines'].astype(str).str.split(', ').explode().unique()),
+                                  frames[0]['total_vacc_df']['country'].astype(str).tolist(), random.Random(args.seed))
+            latencies, statuses, seconds, stats = asyncio.run(_run(service, next_query, args.clients, args.requests,
+                                                                   lambda: current.update(frames = frames[1])))
+            report.append({
+                'cache_size': cache_size,
+                'requests': len(latencies),
+                'failed': sum(status != 200 for status in statuses),
+                'reloads': stats['reloads'],
+                'requests_per_second': len(latencies) / seconds,
+                'client_p50_ms': float(np.percentile(latencies, 50)),
+                'client_p99_ms': float(np.percentile(latencies, 99)),
+                'cache': stats['cache'],
+                'server_latency': stats['latency']
+            })
+
+    print(json.dumps(report, indent = 2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
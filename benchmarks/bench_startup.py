@@ -0,0 +1,64 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+
+## measures the cold start of the data-only pipeline: a fresh interpreter importing vaccinations.pipeline and running it headless
+## each run is its own subprocess, so nothing is already imported or warmed up from a previous run
+## the child also reports which of the heavy optional packages ended up imported, which for a headless run should be none of them
+HEAVY_MODULES = ['plotly', 'scipy']
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import vaccinations.pipeline as pipeline
+imported = time.perf_counter()
+if {run}:
+    pipeline.run(headless = True, use_cache = {use_cache})
+finished = time.perf_counter()
+print(json.dumps({{
+    'import_seconds': imported - start,
+    'run_seconds': finished - imported,
+    'heavy_modules': [name for name in {heavy} if name in sys.modules]
+}}))
+'''
+
+
+def cold_start(run = True, use_cache = True):
+    code = CHILD.format(run = run, use_cache = use_cache, heavy = HEAVY_MODULES)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, check = True).stdout
+    total = time.perf_counter() - start
+    return {**json.loads(output.strip().splitlines()[-1]), 'process_seconds': total}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'time a cold start of the headless pipeline in fresh interpreters')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--import-only', action = 'store_true', help = 'only time importing the pipeline, without running it')
+    parser.add_argument('--no-cache', action = 'store_true', help = 'rebuild the frames from the csvs on each run')
+    args = parser.parse_args(argv)
+
+    ## one untimed run first, so the on-disk cache is warm for the timed ones
+    if not args.import_only and not args.no_cache:
+        cold_start()
+
+    runs = [cold_start(run = not args.import_only, use_cache = not args.no_cache) for _ in range(args.repeat)]
+    report = {
+        name: {'median': statistics.median(run[name] for run in runs), 'min': min(run[name] for run in runs)}
+        for name in ['import_seconds', 'run_seconds', 'process_seconds']
+    }
+    report['heavy_modules'] = sorted({name for run in runs for name in run['heavy_modules']})
+    print(json.dumps(report, indent = 2))
+
+    if report['heavy_modules']:
+        print(f'warning: a headless run imported {", ".join(report["heavy_modules"])}')
+
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.instrument import StageRecorder
+from vaccinations.pipeline import build_frames
+from vaccinations.streaming import write_enriched
+
+
+## compares the in-memory build of adjusted_df / total_vacc_df with the chunked streaming one on a synthetic dataset:
+## the peak memory each one allocates (tracemalloc), how long each takes, and that both give the same summary
+## the times are under tracemalloc, which slows the allocation-heavy csv writing of the streaming runs down several times over
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'peak memory and time of the in-memory vs the streaming enrichment')
+    parser.add_argument('--countries', type = int, default = 2000)
+    parser.add_argument('--days', type = int, default = 200)
+    parser.add_argument('--chunksize', type = int, nargs = '+', default = [20000, 100000])
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    recorder = StageRecorder(trace_memory = True)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_dataset(directory, n_countries = args.countries, n_days = args.days, seed = args.seed)
+        frames = recorder.run('in_memory', build_frames, paths)
+        for chunksize in args.chunksize:
+            total_vacc_df = recorder.run(f'streaming chunksize {chunksize}', write_enriched, paths, os.path.join(directory, 'adjusted_df.csv'), chunksize)
+            pd.testing.assert_frame_equal(total_vacc_df, frames['total_vacc_df'])
+    recorder.close()
+
+    report = {
+        'rows': len(frames['adjusted_df']),
+        'stages': [{name: stage[name] for name in ['stage', 'wall_seconds', 'traced_peak_mb']} for stage in recorder.stages]
+    }
+    print(json.dumps(report, indent = 2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.instrument import StageRecorder
+from vaccinations.loading import read_population, read_vaccinations
+from vaccinations.validation import RowValidator
+
+
+## what the validation pass adds to a build: checking the raw rows of a synthetic dataset (with some duplicates, drops in
+## total_vaccinations and an unknown country planted in it) as one frame, and chunk by chunk as streaming.py does,
+## next to the time it takes to read the file in the first place
+## (and checks that both ways flag the same rows, and that every planted duplicate and the unknown country's rows are caught)
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'cost of the vectorized validation pass, whole file and chunked, against reading the file')
+    parser.add_argument('--countries', type = int, nargs = '+', default = [200, 2000])
+    parser.add_argument('--days', type = int, default = 250)
+    parser.add_argument('--chunksize', type = int, default = 50000)
+    parser.add_argument('--bad-rows', type = int, default = 100, help = 'how many of each kind of bad row to plant')
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    report = []
+    for n_countries in args.countries:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_dataset(directory, n_countries = n_countries, n_days = args.days, seed = args.seed)
+
+            ## the planted rows stay in (country, date) order, so the chunked pass has to flag exactly what the whole one does
+            raw = pd.read_csv(paths['vaccinations'])
+            rng = np.random.default_rng(args.seed)
+            halved = rng.choice(len(raw), args.bad_rows, replace = False)
+            raw.loc[halved, 'total_vaccinations'] = raw.loc[halved, 'total_vaccinations'] // 2
+            duplicated = rng.choice(len(raw), args.bad_rows, replace = False)
+            raw = pd.concat([raw, raw.iloc[duplicated]]).sort_index(kind = 'stable').reset_index(drop = True)
+            unknown = raw['country'] == raw['country'].iloc[-1]
+            raw.loc[unknown, 'country'] = 'Nowhere'
+            raw.to_csv(paths['vaccinations'], index = False)
+
+            continents = pd.read_csv(paths['continents'])
+            pop_dict = read_population(paths['population'])
+            recorder = StageRecorder()
+            df = recorder.run('read_vaccinations', read_vaccinations, paths['vaccinations'])
+            validator = RowValidator(continents, pop_dict, os.path.join(directory, 'quarantine', 'whole.csv'))
+            flags = recorder.run('validate_whole', validator.check, df)
+            recorder.run('write_quarantine', validator.close)
+
+            chunked = RowValidator(continents, pop_dict)
+            with recorder.stage('validate_chunked'):
+                chunk_flags = pd.concat([chunked.check(chunk) for chunk in read_vaccinations(paths['vaccinations'], chunksize = args.chunksize)])
+
+        seconds = {stage['stage']: stage['wall_seconds'] for stage in recorder.stages}
+        report.append({
+            'countries': n_countries,
+            'rows': len(df),
+            'read_seconds': seconds['read_vaccinations'],
+            'validate_seconds': seconds['validate_whole'],
+            'validate_over_read': seconds['validate_whole'] / seconds['read_vaccinations'],
+            'write_quarantine_seconds': seconds['write_quarantine'],
+            'read_and_validate_chunked_seconds': seconds['validate_chunked'],
+            'flagged_rows': int(flags.any(axis = 1).sum()),
+            'checks': validator.summary()['checks'],
+            'chunked_matches': bool(flags.equals(chunk_flags)),
+            'duplicates_found': int(flags['duplicate_row'].sum()) == args.bad_rows,
+            'unknown_country_found': bool(flags.loc[unknown.to_numpy(), ['missing_continent', 'missing_population']].all().all())
+        })
+
+    print(json.dumps(report, indent = 2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
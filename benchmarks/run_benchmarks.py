@@ -0,0 +1,114 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.chart_data import SeriesStore
+from vaccinations.cube import ProgressCube
+from vaccinations.enrichment import enrich_progress
+from vaccinations.forecast import completion_results, fit_quadratic_batch
+from vaccinations.pipeline import load
+from vaccinations.summary import summarize_countries
+from vaccinations.vaccine_index import VaccineIndex
+
+
+## runs one stage, recording its wall time and the peak memory it allocated (tracemalloc also sees numpy's buffers)
+## tracing slows allocation-heavy stages like csv parsing down several times over, so the stage is timed untraced first
+## and then run a second time under tracemalloc for the memory figure (pass memory = False to skip that)
+def run_stage(results, name, func, *args, memory = True, **kwargs):
+    start = time.perf_counter()
+    output = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        func(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / 1024**2
+
+    results.append({'stage': name, 'seconds': seconds, 'peak_mb': peak_mb})
+    return output
+
+
+def load_stage(paths):
+    frames = load(paths)
+    return frames['full_df'], frames['continents'], frames['pop_dict']
+
+
+## the top countries line chart, one trace per country read straight from the series store
+def figure_stage(adjusted_df, total_vacc_df, n = 50):
+    from vaccinations import charts
+
+    store = SeriesStore.from_frame(adjusted_df)
+    return charts.top_countries_figure(total_vacc_df, store, n = n, time_period = 'date', pop_adjusted = False)
+
+
+## times every stage of the pipeline on one synthetic dataset
+def run_pipeline(paths, figures = True, memory = True):
+    results = []
+    full_df, continents, pop_dict = run_stage(results, 'load_merge', load_stage, paths, memory = memory)
+    vacc_index = run_stage(results, 'vaccine_index', VaccineIndex.from_frame, full_df, memory = memory)
+    adjusted_df = run_stage(results, 'enrich', enrich_progress, full_df, memory = memory)
+    run_stage(results, 'progress_cube', ProgressCube.from_frame, adjusted_df, vacc_index, memory = memory)
+    total_vacc_df = run_stage(results, 'summary', summarize_countries, adjusted_df, pop_dict, continents, memory = memory)
+    predictable = adjusted_df[adjusted_df['country'].isin(total_vacc_df.loc[total_vacc_df['predictable'], 'country'])]
+    params = run_stage(results, 'curve_fit', fit_quadratic_batch, predictable, memory = memory)
+    run_stage(results, 'completion', completion_results, params, total_vacc_df, memory = memory)
+    if figures:
+        run_stage(results, 'figures', figure_stage, adjusted_df, total_vacc_df, memory = memory)
+
+    return {'rows': len(full_df), 'stages': results, 'total_seconds': sum(stage['seconds'] for stage in results)}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'time each stage of the analysis pipeline on synthetic data, writing the results as json')
+    parser.add_argument('--countries', type = int, nargs = '+', default = [200, 2000])
+    parser.add_argument('--days', type = int, default = 120)
+    parser.add_argument('--vaccines', type = int, default = 10)
+    parser.add_argument('--max-set-size', type = int, default = 3)
+    parser.add_argument('--zero-rate', type = float, default = 0.3)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--no-figures', action = 'store_true', help = 'skip the figure stage (e.g. if plotly is not installed)')
+    parser.add_argument('--no-memory', action = 'store_true', help = 'skip the second, tracemalloc-traced run of each stage')
+    parser.add_argument('--output', default = None, help = 'json file to write the results to (printed to stdout otherwise)')
+    args = parser.parse_args(argv)
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec = 'seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'runs': []
+    }
+
+    for n_countries in args.countries:
+        scale = {'countries': n_countries, 'days': args.days, 'vaccines': args.vaccines, 'max_set_size': args.max_set_size, 'zero_rate': args.zero_rate, 'seed': args.seed}
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_dataset(directory, n_countries = n_countries, n_days = args.days, n_vaccines = args.vaccines,
+                                  max_set_size = args.max_set_size, zero_rate = args.zero_rate, seed = args.seed)
+            run = run_pipeline(paths, figures = not args.no_figures, memory = not args.no_memory)
+        report['runs'].append({'scale': scale, **run})
+
+    output = json.dumps(report, indent = 2)
+    if args.output is None:
+        print(output)
+    else:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok = True)
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+## a pool of vaccine names to draw each synthetic country's set of vaccines from
+VACCINE_POOL = ['Pfizer/BioNTech', 'Moderna', 'Oxford/AstraZeneca', 'Sputnik V', 'Sinopharm/Beijing', 'Sinovac', 'Sinopharm/Wuhan', 'Covaxin', 'EpiVacCorona', 'Johnson&Johnson']
+CONTINENTS = ['Africa', 'Asia', 'Europe', 'North America', 'Oceania', 'South America']
+
+
+## builds a dataset shaped like country_vaccinations.csv at any scale, along with matching continent and population tables
+##   - n_countries / n_days: size of the history (every country reports every day from its own start date)
+##   - n_vaccines: how many vaccines from the pool (or made up ones past the end of it) the sets are drawn from
+##   - max_set_size: the largest number of vaccines a single country uses
+##   - zero_rate: share of days a country doesn't report, which show up as missing values like in the real data
+## the cumulative columns grow like the real rollouts (roughly quadratic, never decreasing), so every stage has realistic work to do
+def generate(n_countries = 200, n_days = 120, n_vaccines = 10, max_set_size = 3, zero_rate = 0.3, seed = 0):
+    rng = np.random.default_rng(seed)
+    countries = np.array([f'Country {i:05d}' for i in range(n_countries)])
+    vaccines = VACCINE_POOL[:n_vaccines] + [f'Vaccine {i}' for i in range(len(VACCINE_POOL), n_vaccines)]
+
+    sets = []
+    for _ in range(n_countries):
+        size = rng.integers(1, min(max_set_size, n_vaccines) + 1)
+        sets.append(', '.join(sorted(rng.choice(vaccines, size = size, replace = False))))
+    population = rng.integers(50_000, 300_000_000, n_countries)
+
+    ## each country starts vaccinating on its own day and reports every day from then on
+    start = rng.integers(0, max(n_days // 3, 1), n_countries)
+    lengths = n_days - start
+    country_idx = np.repeat(np.arange(n_countries), lengths)
+    day_number = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    dates = pd.Timestamp('2020-12-15') + pd.to_timedelta(start[country_idx] + day_number, unit = 'D')
+
+    rate = rng.uniform(0.01, 0.6, n_countries)[country_idx]
+    accel = rng.uniform(0, 0.01, n_countries)[country_idx]
+    per_hundred = rate * day_number + accel * day_number**2
+    people_per_hundred = per_hundred * rng.uniform(0.6, 0.9, n_countries)[country_idx]
+    fully_per_hundred = np.clip(per_hundred - people_per_hundred, 0, None)
+    pop = population[country_idx]
+
+    total = np.round(per_hundred * pop / 100)
+    people = np.round(people_per_hundred * pop / 100)
+    fully = np.round(fully_per_hundred * pop / 100)
+    daily = np.diff(total, prepend = 0)
+    daily[day_number == 0] = total[day_number == 0]
+
+    df = pd.DataFrame({
+        'country': countries[country_idx],
+        'iso_code': np.char.add('C', np.char.zfill(country_idx.astype(str), 5)),
+        'date': dates.strftime('%Y-%m-%d'),
+        'total_vaccinations': total,
+        'people_vaccinated': people,
+        'people_fully_vaccinated': fully,
+        'daily_vaccinations_raw': daily,
+        'daily_vaccinations': daily,
+        'total_vaccinations_per_hundred': np.round(per_hundred, 2),
+        'people_vaccinated_per_hundred': np.round(people_per_hundred, 2),
+        'people_fully_vaccinated_per_hundred': np.round(fully_per_hundred, 2),
+        'daily_vaccinations_per_million': np.round(daily / pop * 1e6),
+        'vaccines': np.array(sets)[country_idx],
+        'source_name': 'Synthetic',
+        'source_website': 'https://example.com'
+    })
+
+    ## days a country didn't report come through with the progress columns missing, except its first day
+    missing = (rng.random(len(df)) < zero_rate) & (day_number > 0)
+    df.loc[missing, ['total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated', 'daily_vaccinations_raw',
+                     'total_vaccinations_per_hundred', 'people_vaccinated_per_hundred', 'people_fully_vaccinated_per_hundred']] = np.nan
+
+    continents = pd.DataFrame({'Country': countries, 'Continent': rng.choice(CONTINENTS, n_countries)})
+    population_df = pd.DataFrame({'Country (or dependency)': countries, 'Population (2020)': population})
+
+    return df, continents, population_df
+
+
+## writes the synthetic dataset out as the three csvs the pipeline reads, and returns their paths in the loading.SOURCE_PATHS layout
+def write_dataset(directory, **kwargs):
+    os.makedirs(directory, exist_ok = True)
+    df, continents, population_df = generate(**kwargs)
+    paths = {
+        'vaccinations': os.path.join(directory, 'country_vaccinations.csv'),
+        'continents': os.path.join(directory, 'country_continents.csv'),
+        'population': os.path.join(directory, 'population_by_country_2020.csv')
+    }
+    df.to_csv(paths['vaccinations'], index = False)
+    continents.to_csv(paths['continents'], index = False)
+    population_df.to_csv(paths['population'], index = False)
+    return paths
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.backends import BACKENDS, build_frames
+from vaccinations.loading import SOURCE_PATHS
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _assert_matches_pandas(paths, backend):
+    if backend != 'pandas':
+        pytest.importorskip(backend)
+    expected = build_frames(paths, 'pandas')
+    try:
+        frames = build_frames(paths, backend)
+    except ImportError as error:
+        ## e.g. polars hands its frames over to pandas through pyarrow
+        pytest.skip(f'the {backend} backend is missing a dependency ({error})')
+    for name, frame in expected.items():
+        pd.testing.assert_frame_equal(frames[name], frame)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backend_matches_pandas_on_bundled_csv(backend):
+    paths = {name: os.path.join(REPO_ROOT, path) for name, path in SOURCE_PATHS.items()}
+    if not os.path.exists(paths['vaccinations']):
+        pytest.skip('country_vaccinations.csv is not here')
+    _assert_matches_pandas(paths, backend)
+
+
+## the synthetic file rewritten day by day (every country's rows interleaved with the others'), with a few rows shuffled out of order
+## and a country that isn't in the continents file, so grouping by first appearance and keeping file order within a country both matter
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backend_matches_pandas_on_interleaved_rows(backend, tmp_path):
+    paths = write_dataset(str(tmp_path), n_countries = 40, n_days = 45, seed = 3)
+    raw = pd.read_csv(paths['vaccinations'], dtype = str, keep_default_na = False)
+    raw = raw.sort_values(by = ['date', 'country'], kind = 'stable').reset_index(drop = True)
+    swapped = 2 * np.random.default_rng(3).choice(len(raw) // 2 - 1, 20, replace = False)
+    order = np.arange(len(raw))
+    order[swapped], order[swapped + 1] = order[swapped + 1], order[swapped]
+    raw = raw.iloc[order]
+    raw.loc[raw['country'] == raw['country'].iloc[-1], 'country'] = 'Nowhere'
+    raw.to_csv(paths['vaccinations'], index = False)
+
+    _assert_matches_pandas(paths, backend)
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from vaccinations.chart_data import cached_figure, frame_version
+
+
+## a figure built from a module level frame (as the analysis script's top_countries_figure is) is rebuilt once that frame is reassigned
+def test_cached_figure_rebuilds_when_frame_changes():
+    frames = {'summary': pd.DataFrame({'country': ['A', 'B'], 'total_vaccinations': [10, 20]})}
+    builds = []
+
+    @cached_figure(lambda: ('store', frame_version(frames['summary'])))
+    def figure(n = 1):
+        builds.append(n)
+        return frames['summary'].head(n)['country'].tolist()
+
+    assert figure(n = 1) == ['A'] and figure(n = 1) == ['A']
+    assert len(builds) == 1
+
+    frames['summary'] = frames['summary'].sort_values(by = 'total_vaccinations', ascending = False)
+    assert figure(n = 1) == ['B']
+    assert len(builds) == 2
@@ -0,0 +1,83 @@
+import os
+
+import pandas as pd
+import pytest
+
+from vaccinations.cube import CUBE_METRICS, ProgressCube
+from vaccinations.enrichment import enrich_progress
+from vaccinations.loading import SOURCE_PATHS, VACCINATION_DTYPES, prepare_vaccinations, read_vaccinations
+from vaccinations.vaccine_index import VaccineIndex
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+## a small file in the kaggle layout, with the countries' rows interleaved:
+##   - Aland (Moderna, Pfizer/BioNTech): missing values and zeros between reported ones, and no row on 2021-01-05
+##   - Borduria (Moderna): nothing reported at all, on dates of its own past the others'
+##   - Carpania (Pfizer/BioNTech, Sinovac): every value reported, every other day
+def _write_synthetic(directory):
+    rows = []
+    aland = [None, 0, 10, None, 0, 25, 30, 0]
+    for day, total in zip([1, 2, 3, 4, 6, 7, 8, 9], aland):
+        rows.append({'country': 'Aland', 'date': f'2021-01-{day:02d}', 'vaccines': 'Moderna, Pfizer/BioNTech', 'total_vaccinations': total,
+                     'people_vaccinated': None if total is None else total // 2, 'people_fully_vaccinated': 0 if day < 5 else 3})
+        rows.append({'country': 'Borduria', 'date': f'2021-01-{day + 5:02d}', 'vaccines': 'Moderna'})
+        if day % 2 == 0:
+            rows.append({'country': 'Carpania', 'date': f'2021-01-{day:02d}', 'vaccines': 'Pfizer/BioNTech, Sinovac', 'total_vaccinations': 100 * day,
+                         'people_vaccinated': 60 * day, 'people_fully_vaccinated': 20 * day})
+
+    raw = pd.DataFrame(rows, columns = ['date'] + list(VACCINATION_DTYPES))
+    raw['iso_code'] = raw['country'].str[:3]
+    paths = {'vaccinations': os.path.join(directory, 'country_vaccinations.csv'), 'continents': os.path.join(directory, 'country_continents.csv')}
+    raw.to_csv(paths['vaccinations'], index = False)
+    pd.DataFrame({'Country': ['Aland', 'Borduria', 'Carpania'], 'Continent': ['Europe', 'Europe', 'Africa']}).to_csv(paths['continents'], index = False)
+    return paths
+
+
+def _adjusted_df(paths):
+    return enrich_progress(prepare_vaccinations(read_vaccinations(paths['vaccinations']), pd.read_csv(paths['continents'])))
+
+
+## what the progress charts did before the cube: filter adjusted_df down to each vaccine's countries (or each set's rows) and group by date
+def _groupby_series(adjusted_df, vacc_index, metric, name, by):
+    if by == 'vaccine':
+        vacc_df = adjusted_df[vacc_index.row_mask(adjusted_df['country'], name)]
+    else:
+        vacc_df = adjusted_df[adjusted_df['vaccines'] == name]
+    return vacc_df.groupby('date')[[metric]].sum().reset_index()
+
+
+def _assert_matches_groupby(adjusted_df):
+    vacc_index = VaccineIndex.from_frame(adjusted_df)
+    cube = ProgressCube.from_frame(adjusted_df, vacc_index)
+    assert cube.vaccines == list(vacc_index.vaccines)
+    assert cube.vaccine_sets == list(adjusted_df['vaccines'].unique())
+
+    for metric in CUBE_METRICS:
+        for by in ['vaccine', 'vaccine_set']:
+            series = {name: _groupby_series(adjusted_df, vacc_index, metric, name, by) for name in cube.names[by]}
+            for name, expected in series.items():
+                pd.testing.assert_frame_equal(cube.series(metric, name, by = by), expected)
+
+            ## and the table is those series pivoted out to one column each, over every date in the frame
+            pivot = pd.concat({name: expected.set_index('date')[metric] for name, expected in series.items()}, axis = 1, sort = True).reindex(cube.dates)
+            pd.testing.assert_frame_equal(cube.table(metric, by = by), pivot, check_names = False)
+
+
+def test_cube_matches_groupby_on_synthetic_frame(tmp_path):
+    adjusted_df = _adjusted_df(_write_synthetic(str(tmp_path)))
+    _assert_matches_groupby(adjusted_df)
+
+    ## the cases the frame is there for: Borduria's dates only count towards Moderna, at 0, and Aland's missing day isn't made up
+    cube = ProgressCube.from_frame(adjusted_df)
+    moderna = cube.series('total_vaccinations', 'Moderna')
+    assert moderna.loc[moderna['date'] > '2021-01-09', 'total_vaccinations'].eq(0).all()
+    assert pd.Timestamp('2021-01-05') not in cube.series('total_vaccinations', 'Moderna, Pfizer/BioNTech', by = 'vaccine_set')['date'].tolist()
+
+
+def test_cube_matches_groupby_on_bundled_csv():
+    paths = {name: os.path.join(REPO_ROOT, path) for name, path in SOURCE_PATHS.items()}
+    if not os.path.exists(paths['vaccinations']):
+        pytest.skip('country_vaccinations.csv is not here')
+    _assert_matches_groupby(_adjusted_df(paths))
@@ -0,0 +1,103 @@
+import os
+
+import pandas as pd
+import pytest
+
+from vaccinations.enrichment import COLS_TO_FFILL, enrich_progress
+from vaccinations.loading import SOURCE_PATHS, prepare_vaccinations, read_vaccinations
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+## the old notebook's replace(to_replace = 0, method = 'ffill'), one value at a time (method = was removed in pandas 2):
+## a 0 takes the value before it, leading zeros have nothing before them and stay 0
+def _ffill_zeros(series):
+    values, last = [], None
+    for value in series.tolist():
+        if value == 0 and last is not None:
+            value = last
+        values.append(value)
+        last = value
+    return pd.Series(values, index = series.index, dtype = series.dtype)
+
+
+def _days_since_start(date, first_date):
+    if (date <= first_date):
+        return 0
+    else:
+        delta = date - first_date
+        return delta.days
+
+
+## the per-country loop enrich_progress replaced: slice each country out (in order of first appearance), adjust it, stitch them back together
+def _loop_enrich(full_df, cols_to_ffill = COLS_TO_FFILL):
+    country_dfs = []
+    for country in full_df['country'].unique():
+        country_df = full_df[full_df['country'] == country].copy()
+        c_first_vaccination = min(country_df['date'])
+        c_total_vaccinations = max(country_df['total_vaccinations'])
+        c_total_people_vaccinated = max(country_df['people_vaccinated'])
+
+        for col in cols_to_ffill:
+            country_df[col] = _ffill_zeros(country_df[col])
+
+        country_df['vaccination_day_number'] = country_df['date'].apply(_days_since_start, first_date = c_first_vaccination)
+        country_df['percent_total_vaccinations'] = country_df['total_vaccinations'] / c_total_vaccinations
+        country_df['percent_people_vaccinated'] = country_df['people_vaccinated'] / c_total_people_vaccinated
+        country_dfs.append(country_df)
+
+    return pd.concat(country_dfs, axis = 0)
+
+
+## a small file in the kaggle layout, with the countries' rows interleaved:
+##   - Aland: leading zeros, then zeros (and gaps) between reported values
+##   - Borduria: nothing reported at all
+##   - Carpania: every value reported
+def _write_synthetic(directory):
+    rows = []
+    aland = [None, 0, 10, None, 0, 25, 30, 0]
+    for day, total in enumerate(aland):
+        rows.append({'country': 'Aland', 'date': f'2021-01-{day + 1:02d}', 'total_vaccinations': total,
+                     'people_vaccinated': None if total is None else total // 2, 'people_fully_vaccinated': 0 if day < 5 else 3,
+                     'total_vaccinations_per_hundred': None if total is None else total / 100})
+        rows.append({'country': 'Borduria', 'date': f'2021-01-{day + 3:02d}'})
+        if day % 2 == 0:
+            rows.append({'country': 'Carpania', 'date': f'2021-01-{day + 2:02d}', 'total_vaccinations': 100 * (day + 1),
+                         'people_vaccinated': 60 * (day + 1), 'people_fully_vaccinated': 20 * (day + 1), 'total_vaccinations_per_hundred': day + 1.5})
+
+    raw = pd.DataFrame(rows)
+    for col in ['iso_code', 'vaccines', 'source_name', 'source_website']:
+        raw[col] = raw['country'].str[:3] if col != 'vaccines' else 'Moderna, Pfizer/BioNTech'
+    for col in ['total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated', 'daily_vaccinations_raw', 'daily_vaccinations',
+                'total_vaccinations_per_hundred', 'people_vaccinated_per_hundred', 'people_fully_vaccinated_per_hundred', 'daily_vaccinations_per_million']:
+        if col not in raw:
+            raw[col] = None
+    paths = {'vaccinations': os.path.join(directory, 'country_vaccinations.csv'), 'continents': os.path.join(directory, 'country_continents.csv')}
+    raw.to_csv(paths['vaccinations'], index = False)
+    pd.DataFrame({'Country': ['Aland', 'Borduria', 'Carpania'], 'Continent': ['Europe', 'Europe', 'Africa']}).to_csv(paths['continents'], index = False)
+    return paths
+
+
+def _full_df(paths):
+    return prepare_vaccinations(read_vaccinations(paths['vaccinations']), pd.read_csv(paths['continents']))
+
+
+def test_enrich_progress_matches_loop_on_synthetic_frame(tmp_path):
+    full_df = _full_df(_write_synthetic(str(tmp_path)))
+    adjusted_df = enrich_progress(full_df)
+
+    pd.testing.assert_frame_equal(adjusted_df, _loop_enrich(full_df))
+    ## the cases the frame is there for
+    aland = adjusted_df[adjusted_df['country'] == 'Aland']
+    assert aland['total_vaccinations'].tolist() == [0, 0, 10, 10, 10, 25, 30, 30]
+    assert (adjusted_df.loc[adjusted_df['country'] == 'Borduria', COLS_TO_FFILL] == 0).all().all()
+
+
+def test_enrich_progress_matches_loop_on_bundled_csv():
+    paths = {name: os.path.join(REPO_ROOT, path) for name, path in SOURCE_PATHS.items()}
+    if not os.path.exists(paths['vaccinations']):
+        pytest.skip('country_vaccinations.csv is not here')
+    full_df = _full_df(paths)
+
+    pd.testing.assert_frame_equal(enrich_progress(full_df), _loop_enrich(full_df))
@@ -0,0 +1,52 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from vaccinations.export import MANIFEST_NAME, FigureSpec, export_figures, figure_specs, spec_hash
+from vaccinations.loading import SOURCE_PATHS
+from vaccinations.pipeline import build_frames
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _spec(name, number = None, values = (1, 2)):
+    import plotly.graph_objects as go
+
+    return FigureSpec(name, lambda: pd.DataFrame({'value': list(values)}), lambda: go.Figure(go.Bar(y = list(values))), number = number)
+
+
+## a figure showing up between the others (e.g. one more continent) doesn't move or re-render the ones after it
+def test_export_keys_figures_by_name(tmp_path):
+    figs_dir = str(tmp_path)
+    first = export_figures([_spec('map', 1), _spec('bars Europe'), _spec('scatter', 30)], figs_dir, formats = ('html',), max_workers = 1)
+    assert sorted(first['rendered']) == ['Fig_1', 'Fig_30', 'bars_Europe']
+
+    second = export_figures([_spec('map', 1), _spec('bars Europe'), _spec('bars Oceania'), _spec('scatter', 30)], figs_dir, formats = ('html',), max_workers = 1)
+    assert second['rendered'] == ['bars_Oceania']
+    assert sorted(second['skipped']) == ['Fig_1', 'Fig_30', 'bars_Europe']
+
+    with open(os.path.join(figs_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    assert manifest['scatter']['file'] == 'Fig_30' and manifest['bars Oceania']['file'] == 'bars_Oceania'
+
+
+def test_readme_numbers_and_ranked_hash():
+    paths = {name: os.path.join(REPO_ROOT, path) for name, path in SOURCE_PATHS.items()}
+    if not os.path.exists(paths['vaccinations']):
+        pytest.skip('country_vaccinations.csv is not here')
+    frames = build_frames(paths)
+    specs = {spec.name: spec for spec in figure_specs(frames)}
+
+    assert specs['continent_bars North America'].number == 25 and specs['continent_bars Africa'].number == 29
+    assert specs['continent_bars Oceania'].number is None
+    assert sorted(spec.number for spec in specs.values() if spec.number is not None) == list(range(1, 30))
+
+    ## the same top countries ranked the other way round draw a different chart, so they hash differently
+    total_vacc_df = frames['total_vacc_df'].copy()
+    total_vacc_df.loc[[0, 1], 'total_vaccinations'] = total_vacc_df.loc[[1, 0], 'total_vaccinations'].to_numpy()
+    swapped = {spec.name: spec for spec in figure_specs({**frames, 'total_vacc_df': total_vacc_df})}
+    name = 'top_countries 30 date per_hundred'
+    assert spec_hash(specs[name], 'code') != spec_hash(swapped[name], 'code')
@@ -0,0 +1,51 @@
+import os
+import socket
+import threading
+
+from vaccinations.fetch import fetch_sources, load_state, source_urls
+from vaccinations.stand_in import start_server
+
+
+## a server that answers every connection with something that isn't http, so the client gets an http.client.BadStatusLine
+def _start_garbage_server():
+    listener = socket.create_server(('127.0.0.1', 0))
+
+    def serve():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            with connection:
+                connection.recv(1 << 16)
+                connection.sendall(b'not http at all\r\n\r\n')
+
+    threading.Thread(target = serve, daemon = True).start()
+    return listener, f'http://127.0.0.1:{listener.getsockname()[1]}/'
+
+
+## one source breaking the http exchange doesn't take the others down with it, and what they fetched is saved
+def test_http_error_keeps_state_of_other_sources(tmp_path):
+    published, local = tmp_path / 'published', tmp_path / 'local'
+    published.mkdir()
+    local.mkdir()
+    paths = {}
+    for name in ['vaccinations', 'continents']:
+        (published / f'{name}.csv').write_text(f'a,b\n1,{name}\n')
+        paths[name] = str(local / f'{name}.csv')
+
+    server, base_url = start_server(str(published))
+    listener, garbage_url = _start_garbage_server()
+    try:
+        urls = source_urls(base_url, paths)
+        urls['continents'] = garbage_url + 'continents.csv'
+        state_path = str(tmp_path / 'state.json')
+        results = fetch_sources(urls, paths, state_path = state_path)
+    finally:
+        server.shutdown()
+        listener.close()
+
+    assert results['vaccinations']['status'] == 'changed' and results['continents']['status'] == 'failed'
+    assert os.path.exists(paths['vaccinations']) and not os.path.exists(paths['continents'])
+    state = load_state(state_path)
+    assert state['vaccinations']['etag'] and 'continents' not in state
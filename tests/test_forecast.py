@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+from vaccinations.forecast import solve_completion_days
+
+
+## straight lines (a = 1, b = 0) that cross the target at a given day, as a day-by-day loop over x = 0 to horizon - 1 would see them:
+## a country counts when the first whole day at or past its crossing is before the horizon
+def test_completion_days_keep_whole_day_horizon():
+    crossings = [0.0, 363.5, 364.0, 364.5, 365.0]
+    params = pd.DataFrame({'a': 1.0, 'b': 0.0, 'c': [100 - day for day in crossings]}, index = pd.Index(list('vwxyz'), name = 'country'))
+    params.loc['v', 'c'] = 120.0
+    ## and a parabola that starts above the target (its discriminant is negative, but it is there on day 0)
+    params.loc['u'] = [1.0, 1.0, 120.0]
+
+    solved = solve_completion_days(params, target = 100, horizon = 365)
+
+    assert solved['reaches_target'].tolist() == [True, True, True, False, False, True]
+    assert solved.loc['u', 'days_until_target'] == 0
+    loop_days = [next((x for x in range(365) if row.a * x + row.b * x**2 + row.c >= 100), None) for row in params.itertuples()]
+    assert [day is not None for day in loop_days] == solved['reaches_target'].tolist()
+    np.testing.assert_allclose(solved['days_until_target'].iloc[1:3], [363.5, 364.0])
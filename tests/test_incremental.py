@@ -0,0 +1,139 @@
+import os
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_dataset
+from vaccinations import incremental
+from vaccinations.instrument import StageRecorder
+from vaccinations.loading import read_population
+from vaccinations.pipeline import build_frames, predict
+
+
+FRAME_NAMES = ['full_df', 'adjusted_df', 'total_vacc_df']
+
+
+## a synthetic dataset, with the raw rows kept as the strings they were written as so that rewriting them doesn't change a byte
+@pytest.fixture
+def dataset(tmp_path):
+    paths = write_dataset(str(tmp_path / 'data'), n_countries = 30, n_days = 60, seed = 1)
+    raw = pd.read_csv(paths['vaccinations'], dtype = str, keep_default_na = False)
+    return paths, raw, str(tmp_path / 'checkpoint')
+
+
+def _write(raw, path, mode = 'w'):
+    raw.to_csv(path, index = False, header = mode == 'w', mode = mode)
+
+
+## the incremental frames (and what predict makes of them) against a full build of the same file
+## returns them along with the names of the steps the refresh went through
+def _assert_matches_full_build(paths, checkpoint_dir):
+    recorder = StageRecorder()
+    refreshed = build_frames(paths, recorder = recorder, checkpoint_dir = checkpoint_dir)
+    recorder.close()
+    full = build_frames(paths)
+    for name in FRAME_NAMES:
+        pd.testing.assert_frame_equal(refreshed[name], full[name])
+
+    pop_dict = read_population(paths['population'])
+    refreshed_predictions = predict({**refreshed, 'pop_dict': pop_dict}, forecast_cache = None)
+    full_predictions = predict({**full, 'pop_dict': pop_dict}, forecast_cache = None)
+    pd.testing.assert_frame_equal(refreshed_predictions['rolling_df'], full_predictions['rolling_df'])
+    ## the fits come from the same sums added up in a different order, so they agree to rounding (final_date to well under a second)
+    refreshed_results, full_results = refreshed_predictions['country_results_df'], full_predictions['country_results_df']
+    pd.testing.assert_frame_equal(refreshed_results.drop('final_date', axis = 1), full_results.drop('final_date', axis = 1), check_exact = False, rtol = 1e-9)
+    assert ((refreshed_results['final_date'] - full_results['final_date']).abs() < pd.Timedelta(seconds = 1)).all()
+    return refreshed, {stage['stage'] for stage in recorder.stages}
+
+
+def test_appended_rows_match_full_build(dataset, monkeypatch):
+    paths, raw, checkpoint_dir = dataset
+    ## a few days appended one at a time, so the parts pile up and get compacted along the way
+    monkeypatch.setattr(incremental, 'COMPACT_PARTS', 3)
+    dates = sorted(raw['date'].unique())
+    cutoff = dates[-6]
+    _write(raw[raw['date'] <= cutoff], paths['vaccinations'])
+    assert 'enrich_progress' in _assert_matches_full_build(paths, checkpoint_dir)[1]
+
+    for date in dates[-5:]:
+        _write(raw[raw['date'] == date], paths['vaccinations'], mode = 'a')
+        steps = _assert_matches_full_build(paths, checkpoint_dir)[1]
+        assert 'read_appended_rows' in steps and not steps & {'read_vaccinations', 'enrich_progress'}
+    assert len(os.listdir(os.path.join(checkpoint_dir, 'parts'))) < 3
+
+    ## unchanged, straight from the checkpoint
+    assert not _assert_matches_full_build(paths, checkpoint_dir)[1] & {'read_appended_rows', 'read_vaccinations', 'enrich_delta'}
+
+
+def test_appended_new_country_matches_full_build(dataset):
+    paths, raw, checkpoint_dir = dataset
+    newcomer = raw['country'] == raw['country'].iloc[-1]
+    _write(raw[~newcomer], paths['vaccinations'])
+    _assert_matches_full_build(paths, checkpoint_dir)
+
+    _write(raw[newcomer], paths['vaccinations'], mode = 'a')
+    steps = _assert_matches_full_build(paths, checkpoint_dir)[1]
+    assert 'read_appended_rows' in steps and 'enrich_progress' not in steps
+
+
+## the kaggle re-upload: each country's new days land at the end of its own block, and a new country shows up between the others
+def test_rewritten_file_matches_full_build(dataset):
+    paths, raw, checkpoint_dir = dataset
+    dates = sorted(raw['date'].unique())
+    newcomer = raw['country'] == raw['country'].unique()[10]
+    _write(raw[(raw['date'] <= dates[-4]) & ~newcomer], paths['vaccinations'])
+    _assert_matches_full_build(paths, checkpoint_dir)
+
+    _write(raw, paths['vaccinations'])
+    refreshed, steps = _assert_matches_full_build(paths, checkpoint_dir)
+    assert 'enrich_delta' in steps and 'enrich_progress' not in steps
+    assert refreshed['adjusted_df'].index.is_unique
+
+
+## the parts already written, by name, with what identifies the file each one is
+def _parts(checkpoint_dir):
+    parts_dir = os.path.join(checkpoint_dir, 'parts')
+    return {name: (os.stat(os.path.join(parts_dir, name)).st_ino, os.stat(os.path.join(parts_dir, name)).st_mtime_ns) for name in os.listdir(parts_dir)}
+
+
+## day after day of re-uploads, each adding a day to the end of every country's block: only the new rows get written,
+## the parts already there are left alone until the rows are split into more than COMPACT_RUNS runs
+def test_rewritten_file_only_writes_new_rows(dataset, monkeypatch):
+    paths, raw, checkpoint_dir = dataset
+    n_countries = raw['country'].nunique()
+    monkeypatch.setattr(incremental, 'COMPACT_RUNS', 4 * n_countries)
+    dates = sorted(raw['date'].unique())
+    _write(raw[raw['date'] <= dates[-5]], paths['vaccinations'])
+    _assert_matches_full_build(paths, checkpoint_dir)
+
+    for date in dates[-4:-1]:
+        before = _parts(checkpoint_dir)
+        _write(raw[raw['date'] <= date], paths['vaccinations'])
+        steps = _assert_matches_full_build(paths, checkpoint_dir)[1]
+        assert 'enrich_delta' in steps and 'enrich_progress' not in steps
+        after = _parts(checkpoint_dir)
+        assert len(after) == len(before) + 1 and all(after[name] == before[name] for name in before)
+
+    ## the next one splits the rows too many times, so everything gets folded back into one part
+    _write(raw, paths['vaccinations'])
+    _assert_matches_full_build(paths, checkpoint_dir)
+    assert len(_parts(checkpoint_dir)) == 1
+
+
+## rows that can't be slotted in after what is checkpointed fall back to a full rebuild
+@pytest.mark.parametrize('change', ['late_row', 'revised_row'])
+def test_unslottable_rows_rebuild(dataset, change):
+    paths, raw, checkpoint_dir = dataset
+    dates = sorted(raw['date'].unique())
+    _write(raw[raw['date'] <= dates[-3]], paths['vaccinations'])
+    _assert_matches_full_build(paths, checkpoint_dir)
+
+    if change == 'late_row':
+        ## a day that was missing for the first country turns up after the file has moved on
+        late = raw[raw['country'] == raw['country'].iloc[0]].iloc[[1]].assign(date = '2020-01-01')
+        _write(pd.concat([raw[raw['date'] > dates[-3]], late]), paths['vaccinations'], mode = 'a')
+    else:
+        revised = raw[raw['date'] <= dates[-2]].copy()
+        revised.loc[revised.index[5], 'total_vaccinations'] = '1.0'
+        _write(revised, paths['vaccinations'])
+    assert 'enrich_progress' in _assert_matches_full_build(paths, checkpoint_dir)[1]
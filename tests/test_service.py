@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import write_dataset
+from vaccinations.pipeline import build_frames
+from vaccinations.service import QueryIndex, QueryService
+
+
+@pytest.fixture(scope = 'module')
+def frames(tmp_path_factory):
+    paths = write_dataset(str(tmp_path_factory.mktemp('data')), n_countries = 20, n_days = 30, seed = 2)
+    return build_frames(paths)
+
+
+## every country using the vaccine comes with the same line vaccine_progress_figure draws for it
+def test_vaccine_map_has_each_countrys_line(frames):
+    index = QueryIndex.from_frames(frames)
+    vaccine = index.vacc_index.vaccines[0]
+    answer = index.vaccine_map(vaccine)
+
+    assert answer['countries'] == index.vacc_index.countries_for(vaccine)
+    assert [line['country'] for line in answer['lines']] == answer['countries']
+    adjusted_df = frames['adjusted_df']
+    for line in answer['lines']:
+        country_df = adjusted_df[adjusted_df['country'] == line['country']]
+        assert line['x'] == country_df['date'].dt.strftime('%Y-%m-%d').tolist()
+        assert np.allclose(line['y'], country_df['total_vaccinations_per_hundred'].astype('float64'), equal_nan = True)
+
+
+## sends raw requests to a running service, returning the status line of each answer
+async def _statuses(frames, requests):
+    service = QueryService(load = lambda: frames)
+    started = asyncio.Event()
+    server = asyncio.create_task(service.serve(port = 0, started = started))
+    await started.wait()
+    statuses = []
+    try:
+        for request in requests:
+            reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+            writer.write(request)
+            await writer.drain()
+            statuses.append((await reader.readline()).decode().strip())
+            writer.close()
+    finally:
+        server.cancel()
+    return statuses
+
+
+@pytest.mark.parametrize('content_length', ['abc', '-5'])
+def test_bad_content_length_gets_400(frames, content_length):
+    requests = [f'POST /reload HTTP/1.1\r\nContent-Length: {content_length}\r\n\r\n'.encode(),
+                b'GET /stats HTTP/1.1\r\nConnection: close\r\n\r\n']
+    bad, good = asyncio.run(_statuses(frames, requests))
+    assert bad.startswith('HTTP/1.1 400') and good.startswith('HTTP/1.1 200')
+
+
+## a request line or header past the stream's limit (64KiB) is answered rather than dropping the connection without a word
+@pytest.mark.parametrize('request_', ['GET /stats?pad={} HTTP/1.1\r\n\r\n', 'GET /stats HTTP/1.1\r\nX-Pad: {}\r\n\r\n'])
+def test_overlong_request_gets_400(frames, request_):
+    requests = [request_.format('x' * (1 << 17)).encode(), b'GET /stats HTTP/1.1\r\nConnection: close\r\n\r\n']
+    bad, good = asyncio.run(_statuses(frames, requests))
+    assert bad.startswith('HTTP/1.1 400') and good.startswith('HTTP/1.1 200')
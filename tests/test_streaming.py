@@ -0,0 +1,57 @@
+import os
+
+import pandas as pd
+import pytest
+
+from vaccinations.enrichment import enrich_progress
+from vaccinations.loading import SOURCE_PATHS, VACCINATION_DTYPES, prepare_vaccinations, read_vaccinations
+from vaccinations.streaming import stream_enriched
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+## a small file in the kaggle layout, grouped by country:
+##   - Aland: a leading missing value and zero, then zeros and gaps between reported values, and a day missing from its dates
+##   - Borduria: nothing reported at all
+##   - Carpania: every value reported
+def _write_synthetic(directory):
+    rows = []
+    aland = [None, 0, 10, None, 0, 25, 30, 0]
+    for day, total in zip([1, 2, 3, 4, 6, 7, 8, 9], aland):
+        rows.append({'country': 'Aland', 'date': f'2021-01-{day:02d}', 'total_vaccinations': total,
+                     'people_vaccinated': None if total is None else total // 2, 'people_fully_vaccinated': 0 if day < 5 else 3,
+                     'total_vaccinations_per_hundred': None if total is None else total / 100})
+    for day in range(5):
+        rows.append({'country': 'Borduria', 'date': f'2021-01-{day + 3:02d}'})
+    for day in range(6):
+        rows.append({'country': 'Carpania', 'date': f'2021-01-{day + 2:02d}', 'total_vaccinations': 100 * (day + 1),
+                     'people_vaccinated': 60 * (day + 1), 'people_fully_vaccinated': 20 * (day + 1), 'total_vaccinations_per_hundred': day + 1.5})
+
+    raw = pd.DataFrame(rows, columns = ['date'] + list(VACCINATION_DTYPES))
+    raw['iso_code'] = raw['country'].str[:3]
+    raw['vaccines'] = 'Moderna, Pfizer/BioNTech'
+    paths = {'vaccinations': os.path.join(directory, 'country_vaccinations.csv'), 'continents': os.path.join(directory, 'country_continents.csv')}
+    raw.to_csv(paths['vaccinations'], index = False)
+    pd.DataFrame({'Country': ['Aland', 'Borduria', 'Carpania'], 'Continent': ['Europe', 'Europe', 'Africa']}).to_csv(paths['continents'], index = False)
+    return paths
+
+
+## the chunks stitched back together against reading the whole file and enriching it at once
+def _assert_matches_one_shot(paths, chunksize):
+    continents = pd.read_csv(paths['continents'])
+    streamed = pd.concat(stream_enriched(paths['vaccinations'], continents, chunksize = chunksize))
+    pd.testing.assert_frame_equal(streamed, enrich_progress(prepare_vaccinations(read_vaccinations(paths['vaccinations']), continents)))
+
+
+## chunks of 3 and 5 split every country across a chunk edge, at different points
+@pytest.mark.parametrize('chunksize', [1, 3, 5, 100])
+def test_stream_matches_one_shot_on_synthetic_frame(tmp_path, chunksize):
+    _assert_matches_one_shot(_write_synthetic(str(tmp_path)), chunksize)
+
+
+def test_stream_matches_one_shot_on_bundled_csv():
+    paths = {name: os.path.join(REPO_ROOT, path) for name, path in SOURCE_PATHS.items()}
+    if not os.path.exists(paths['vaccinations']):
+        pytest.skip('country_vaccinations.csv is not here')
+    _assert_matches_one_shot(paths, 997)
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from vaccinations.loading import VACCINATION_DTYPES, read_vaccinations
+from vaccinations.validation import CHECKS, RowValidator, validate
+
+
+## a small file in the kaggle layout with one row for each thing the checks look for (and a few clean ones),
+## returned with the checks each row should fail
+##   - Aland and Borduria have 1000 people, Nowhere isn't in either lookup and Nopop has a continent but no population
+def _write_synthetic(directory):
+    rows = [
+        ({'country': 'Aland', 'date': '2021-01-01', 'total_vaccinations': 10, 'total_vaccinations_per_hundred': 1.0}, []),
+        ({'country': 'Aland', 'date': '2021-01-02', 'total_vaccinations': 20, 'total_vaccinations_per_hundred': 2.0}, []),
+        ({'country': 'Aland', 'date': '2021-01-02', 'total_vaccinations': 20, 'total_vaccinations_per_hundred': 2.0}, ['duplicate_row']),
+        ({'country': 'Aland', 'date': '2021-01-03', 'total_vaccinations': 15, 'total_vaccinations_per_hundred': 1.5}, ['non_monotonic']),
+        ({'country': 'Borduria', 'date': '2021-01-01', 'total_vaccinations': 10, 'daily_vaccinations': -3}, ['negative_count']),
+        ({'country': 'Borduria', 'date': '2021-01-02', 'total_vaccinations': 20, 'total_vaccinations_per_hundred': 5.0}, ['per_hundred_mismatch']),
+        ({'country': 'Nowhere', 'date': '2021-01-01', 'total_vaccinations': 10}, ['missing_continent', 'missing_population']),
+        ({'country': 'Nopop', 'date': '2021-01-01', 'total_vaccinations': 10}, ['missing_population'])
+    ]
+    raw = pd.DataFrame([row for row, _ in rows], columns = ['date'] + list(VACCINATION_DTYPES))
+    path = str(directory / 'country_vaccinations.csv')
+    raw.to_csv(path, index = False)
+
+    expected = pd.DataFrame([[check in failed for check in CHECKS] for _, failed in rows], columns = CHECKS)
+    continents = pd.DataFrame({'Country': ['Aland', 'Borduria', 'Nopop'], 'Continent': ['Europe', 'Europe', 'Africa']})
+    pop_dict = pd.DataFrame({'Country': ['Aland', 'Borduria'], 'Population': [1000, 1000]})
+    return path, expected, continents, pop_dict
+
+
+def test_each_check_flags_its_row(tmp_path):
+    path, expected, continents, pop_dict = _write_synthetic(tmp_path)
+    flags, summary = validate(read_vaccinations(path), continents, pop_dict)
+
+    pd.testing.assert_frame_equal(flags, expected)
+    assert summary['flagged_rows'] == 6
+    assert summary['countries']['missing_population'] == ['Nopop', 'Nowhere']
+
+
+## chunks of a file in date order per country get the whole file's flags, carrying one last date per country rather than every date
+@pytest.mark.parametrize('chunksize', [1, 2, 3])
+def test_ordered_chunks_match_whole_file(tmp_path, chunksize):
+    path, expected, continents, pop_dict = _write_synthetic(tmp_path)
+    validator = RowValidator(continents, pop_dict)
+    flags = pd.concat([validator.check(chunk) for chunk in read_vaccinations(path, chunksize = chunksize)])
+
+    pd.testing.assert_frame_equal(flags, expected)
+    assert len(validator.seen) == 0 and len(validator.last_day) == 4
+
+
+## with the rows in any order, the duplicates across chunks are still the ones the whole file has
+@pytest.mark.parametrize('chunksize', [1, 2, 3])
+def test_unordered_chunks_find_the_same_duplicates(tmp_path, chunksize):
+    path, _, continents, pop_dict = _write_synthetic(tmp_path)
+    pd.read_csv(path).iloc[::-1].to_csv(path, index = False)
+    whole_flags, _ = validate(read_vaccinations(path), continents, pop_dict)
+
+    validator = RowValidator(continents, pop_dict, ordered = False)
+    flags = pd.concat([validator.check(chunk) for chunk in read_vaccinations(path, chunksize = chunksize)])
+    pd.testing.assert_series_equal(flags['duplicate_row'], whole_flags['duplicate_row'])
+    assert flags['duplicate_row'].sum() == 1
@@ -0,0 +1,2 @@
+## reusable building blocks for the covid vaccination analysis
+## the main walkthrough lives in Covid_Vaccination_Analysis.py, which imports from here
@@ -0,0 +1,235 @@
+import argparse
+import functools
+import io
+import time
+
+import pandas as pd
+
+from vaccinations.enrichment import COLS_TO_FFILL
+from vaccinations.instrument import StageRecorder, timed
+from vaccinations.loading import COUNT_COLS, SOURCE_PATHS, VACCINATION_DTYPES, read_population
+from vaccinations.summary import finish_summary
+
+
+## the build of full_df, adjusted_df and total_vacc_df (read -> merge continents -> enrich -> summarize) on a choice of engine:
+##   - pandas: pipeline.build_frames, single threaded
+##   - polars: a lazy query over the csv, run on polars' multi-threaded columnar engine
+##   - duckdb: the same steps as sql, run in an embedded duckdb database (also multi-threaded)
+## every backend does the same steps, whatever the engine:
+##   1. read the vaccination columns (skipping the source columns), counts as floats, rates as float32 and date as a date
+##   2. left join the continents on country, filling the missing numbers with 0
+##   3. group the rows by country in order of first appearance (keeping file order within a country), forward fill the progression
+##      variables over zeros, and add vaccination_day_number and the percent columns
+##   4. aggregate one row per country, which summary.finish_summary turns into total_vacc_df (with the population and continent)
+## and the frames come back as pandas dataframes with exactly the same columns, index, dtypes and values as the pandas build
+## (check_parity checks that). polars and duckdb are only imported when their backend is used
+##
+## from the command line:
+##   python -m vaccinations.backends --backends pandas polars duckdb          (times each backend and checks it against pandas)
+BACKENDS = ('pandas', 'polars', 'duckdb')
+
+CATEGORY_COLS = [col for col, dtype in VACCINATION_DTYPES.items() if dtype == 'category']
+RATE_COLS = [col for col, dtype in VACCINATION_DTYPES.items() if dtype == 'float32']
+
+
+## builds the frames on the given backend, with each step timed as a stage of recorder when one is passed in
+def build_frames(paths = SOURCE_PATHS, backend = 'pandas', cols_to_ffill = COLS_TO_FFILL, recorder = None):
+    if backend == 'pandas':
+        from vaccinations.pipeline import build_frames as build_pandas
+
+        return build_pandas(paths, cols_to_ffill, recorder)
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown backend: {backend}, must be one of {", ".join(BACKENDS)}')
+
+    continents = timed(recorder, 'read_continents', pd.read_csv, paths['continents'])
+    pop_dict = timed(recorder, 'read_population', read_population, paths['population'])
+    build = _polars_frames if backend == 'polars' else _duckdb_frames
+    full_df, adjusted_df, country_df = timed(recorder, f'{backend}_build', build, paths['vaccinations'], continents, cols_to_ffill)
+
+    full_df, adjusted_df = timed(recorder, 'to_pandas_schema', _to_pandas_schema, full_df, adjusted_df)
+    country_df = country_df.set_index('country').astype({'total_vaccinations': 'Int64', 'total_per_hundred': 'float32', 'day_started': _date_dtype(),
+                                                         'days_since_starting': 'int64', 'n_rows': 'int64'})
+    total_vacc_df = timed(recorder, 'finish_summary', finish_summary, country_df, pop_dict, continents)
+    return {'full_df': full_df, 'adjusted_df': adjusted_df, 'total_vacc_df': total_vacc_df}
+
+
+## the vaccination columns of the csv, in file order
+def _vaccination_cols(path):
+    return [col for col in pd.read_csv(path, nrows = 0).columns if col == 'date' or col in VACCINATION_DTYPES]
+
+
+## the dtype read_csv parses dates into (datetime64[ns] before pandas 2, finer or coarser units after)
+@functools.lru_cache(maxsize = 1)
+def _date_dtype():
+    return pd.read_csv(io.StringIO('date\n2021-01-01'), parse_dates = ['date'])['date'].dtype
+
+
+## the engines hand back categoricals (made in the engine, so the strings never go through python objects), floats and dates,
+## these get the same compact types as the pandas build (nullable integer counts, float32 rates, read_csv's date dtype)
+def _to_pandas_schema(full_df, adjusted_df):
+    ## (polars' enums come back as ordered categoricals, read_csv's aren't)
+    types = {col: pd.CategoricalDtype(full_df[col].cat.categories) for col in CATEGORY_COLS + ['Continent']}
+    types.update({col: 'Int64' for col in COUNT_COLS})
+    types.update({col: 'float32' for col in RATE_COLS})
+    types['date'] = _date_dtype()
+
+    full_df = full_df.astype(types)
+    adjusted_df = adjusted_df.astype({'row': 'int64'}).set_index('row').astype({**types, 'vaccination_day_number': 'int64'})
+    adjusted_df.index.name = None
+
+    ## the percent columns are divided here rather than in the engine, so 0 / 0 comes out however this pandas does it (NA or NaN)
+    for col in ['total_vaccinations', 'people_vaccinated']:
+        adjusted_df[f'percent_{col}'] = adjusted_df[col] / adjusted_df.pop(f'max_{col}').astype('Int64')
+    return full_df, adjusted_df
+
+
+def _polars_frames(path, continents, cols_to_ffill):
+    import polars as pl
+
+    cols = _vaccination_cols(path)
+    schema = {col: (pl.Float64 if col in COUNT_COLS else pl.Float32 if col in RATE_COLS else pl.Utf8) for col in cols}
+    numeric_cols = COUNT_COLS + RATE_COLS
+
+    full = pl.scan_csv(path, schema_overrides = schema).select(cols).with_row_index('row') \
+        .with_columns(pl.col('date').str.to_date('%Y-%m-%d')) \
+        .join(pl.from_pandas(continents[['Country', 'Continent']]).lazy(), left_on = 'country', right_on = 'Country', how = 'left') \
+        .sort('row') \
+        .with_columns([pl.col(col).fill_null(0) for col in numeric_cols]) \
+        .collect()
+
+    ## the text columns as enums of their sorted values, which to_pandas turns into categoricals like read_csv's
+    full = full.with_columns([pl.col(col).cast(pl.Enum(sorted(full[col].drop_nulls().unique().to_list()))) for col in CATEGORY_COLS + ['Continent']])
+
+    adjusted = full.lazy().with_columns(pl.col('row').min().over('country').alias('first_row')).sort(['first_row', 'row']) \
+        .with_columns([pl.when(pl.col(col) == 0).then(None).otherwise(pl.col(col)).forward_fill().over('country').fill_null(0).alias(col) for col in cols_to_ffill]) \
+        .with_columns(
+            (pl.col('date') - pl.col('date').min().over('country')).dt.total_days().clip(lower_bound = 0).alias('vaccination_day_number'),
+            pl.col('total_vaccinations').max().over('country').alias('max_total_vaccinations'),
+            pl.col('people_vaccinated').max().over('country').alias('max_people_vaccinated')
+        )
+
+    summary = adjusted.group_by('country', maintain_order = True).agg(
+        pl.col('total_vaccinations').max(),
+        pl.col('total_vaccinations_per_hundred').max().alias('total_per_hundred'),
+        pl.col('date').min().alias('day_started'),
+        pl.col('vaccination_day_number').max().alias('days_since_starting'),
+        pl.col('people_vaccinated_per_hundred').max().alias('people_per_hundred'),
+        pl.len().alias('n_rows')
+    )
+
+    ## the two queries share full_df, collect_all runs them together
+    adjusted, summary = pl.collect_all([adjusted.drop('first_row'), summary])
+    return full.drop('row').to_pandas(), adjusted.to_pandas(), summary.to_pandas()
+
+
+def _duckdb_frames(path, continents, cols_to_ffill):
+    import duckdb
+
+    cols = _vaccination_cols(path)
+    types = {col: ('DOUBLE' if col in COUNT_COLS else 'FLOAT' if col in RATE_COLS else 'DATE' if col == 'date' else 'VARCHAR') for col in cols}
+    numeric_cols = COUNT_COLS + RATE_COLS
+    other_cols = [col for col in cols + ['Continent'] if col not in cols_to_ffill]
+
+    quoted = ', '.join(f'"{col}"' for col in cols)
+    filled_numbers = ', '.join(f'coalesce(v."{col}", 0) AS "{col}"' if col in numeric_cols else f'v."{col}"' for col in cols)
+    other = ', '.join(f'"{col}"' for col in other_cols)
+    forward_filled = ', '.join(f'coalesce(last_value(nullif("{col}", 0) IGNORE NULLS) OVER w, 0) AS "{col}"' for col in cols_to_ffill)
+
+    ## the rows are numbered as they are read (the join doesn't keep them in file order)
+    con = duckdb.connect()
+    con.register('continents_df', continents[['Country', 'Continent']])
+    con.execute(f"""
+        CREATE TEMP TABLE full_rows AS
+        SELECT v.row, {filled_numbers}, c."Continent"
+        FROM (SELECT row_number() OVER () - 1 AS row, {quoted} FROM read_csv(?, header = true, types = {types!r})) v
+        LEFT JOIN continents_df c ON v.country = c."Country"
+    """, [path])
+
+    con.execute(f"""
+        CREATE TEMP TABLE adjusted_rows AS
+        WITH filled AS (
+            SELECT row, min(row) OVER (PARTITION BY country) AS first_row, {other}, {forward_filled}
+            FROM full_rows
+            WINDOW w AS (PARTITION BY country ORDER BY row ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+        )
+        SELECT *, greatest(date_diff('day', min(date) OVER (PARTITION BY country), date), 0) AS vaccination_day_number,
+               max(total_vaccinations) OVER (PARTITION BY country) AS max_total_vaccinations,
+               max(people_vaccinated) OVER (PARTITION BY country) AS max_people_vaccinated
+        FROM filled
+    """)
+
+    ## the text columns as enums of their sorted values, which come back as categoricals like read_csv's
+    for col in CATEGORY_COLS + ['Continent']:
+        con.execute(f'CREATE TYPE "{col}_enum" AS ENUM (SELECT DISTINCT "{col}" FROM full_rows WHERE "{col}" IS NOT NULL ORDER BY "{col}")')
+    typed = ', '.join(f'"{col}"::"{col}_enum" AS "{col}"' if col in CATEGORY_COLS else f'"{col}"' for col in cols)
+
+    full_df = con.execute(f'SELECT {typed}, "Continent"::"Continent_enum" AS "Continent" FROM full_rows ORDER BY row').df()
+    adjusted_df = con.execute(f"""
+        SELECT row, {typed}, "Continent"::"Continent_enum" AS "Continent", vaccination_day_number, max_total_vaccinations, max_people_vaccinated
+        FROM adjusted_rows ORDER BY first_row, row
+    """).df()
+    country_df = con.execute("""
+        SELECT country, max(total_vaccinations) AS total_vaccinations, max(total_vaccinations_per_hundred) AS total_per_hundred,
+               min(date) AS day_started, max(vaccination_day_number) AS days_since_starting,
+               max(people_vaccinated_per_hundred) AS people_per_hundred, count(*) AS n_rows
+        FROM adjusted_rows GROUP BY country ORDER BY min(first_row)
+    """).df()
+    con.close()
+    return full_df, adjusted_df, country_df
+
+
+## builds the frames on each backend and checks they come out identical to the pandas build
+## returns the seconds each backend took, and the frames that didn't match (with why) for any backend that differs
+def check_parity(paths = SOURCE_PATHS, backends = BACKENDS, cols_to_ffill = COLS_TO_FFILL):
+    start = time.perf_counter()
+    expected = build_frames(paths, 'pandas', cols_to_ffill)
+    results = {'pandas': {'seconds': time.perf_counter() - start, 'mismatches': {}}}
+
+    for backend in backends:
+        if backend == 'pandas':
+            continue
+        start = time.perf_counter()
+        try:
+            frames = build_frames(paths, backend, cols_to_ffill)
+        except ImportError as error:
+            print(f'skipping the {backend} backend, it is not installed ({error})')
+            continue
+        results[backend] = {'seconds': time.perf_counter() - start, 'mismatches': {}}
+
+        for name, frame in expected.items():
+            try:
+                pd.testing.assert_frame_equal(frames[name], frame)
+            except AssertionError as error:
+                results[backend]['mismatches'][name] = str(error)
+
+    return results
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'build the frames on each backend, timing them and checking they match the pandas build')
+    parser.add_argument('--backends', nargs = '+', default = list(BACKENDS), choices = BACKENDS)
+    parser.add_argument('--vaccinations', default = SOURCE_PATHS['vaccinations'])
+    parser.add_argument('--continents', default = SOURCE_PATHS['continents'])
+    parser.add_argument('--population', default = SOURCE_PATHS['population'])
+    parser.add_argument('--profile-stages', action = 'store_true', help = 'also print the time each step of each backend took')
+    args = parser.parse_args(argv)
+
+    paths = {'vaccinations': args.vaccinations, 'continents': args.continents, 'population': args.population}
+    results = check_parity(paths, args.backends)
+    for backend, result in results.items():
+        status = 'matches pandas' if not result['mismatches'] else 'differs from pandas in ' + ', '.join(result['mismatches'])
+        print(f'{backend}: {result["seconds"]:.3f}s, {status}')
+        for name, error in result['mismatches'].items():
+            print(f'  {name}: {error}')
+
+    if args.profile_stages:
+        for backend in results:
+            recorder = StageRecorder()
+            build_frames(paths, backend, recorder = recorder)
+            print(f'{backend}:\n{recorder.summary()}')
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from vaccinations.loading import SOURCE_PATHS
+
+
+## parsing the csvs, merging in the continents and building the adjusted and summary dataframes happens on every run
+## even though the source files only change once a day, so here we keep the built frames on disk in a columnar format
+## the cache is keyed on the source files: a hit is decided on size + modified time first, falling back to a content hash
+## (so a re-download of identical data still counts as a hit)
+CACHE_DIR = '.cache'
+
+## bump this whenever the way the frames are built changes, so old caches get rebuilt
+CACHE_VERSION = 5
+
+## the repeated string columns are stored as categoricals and the metrics as float32
+CATEGORICAL_COLS = ['country', 'iso_code', 'vaccines', 'continent', 'Continent']
+
+
+def _file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+## compact typed version of a frame for the cache
+## feather files need a default index, so the index is dropped (the cached frames are only ever used positionally)
+def to_columnar(df):
+    df = df.reset_index(drop = True).infer_objects()
+    for col in df.columns:
+        if col in CATEGORICAL_COLS:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str)).astype('category')
+        elif df[col].dtype == np.float64:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+## checks each source file against the manifest, only hashing files whose size or modified time moved
+## returns the up-to-date source entries and whether they all match what the cache was built from
+def _check_sources(paths, manifest):
+    cached_sources = manifest.get('sources', {}) if manifest else {}
+    sources = {}
+    fresh = manifest is not None and manifest.get('version') == CACHE_VERSION
+    for name, path in paths.items():
+        signature = _signature(path)
+        cached = cached_sources.get(name)
+        if cached is not None and cached['signature'] == signature:
+            sources[name] = cached
+            continue
+        sources[name] = {'signature': signature, 'sha1': _file_hash(path)}
+        fresh = fresh and cached is not None and cached['sha1'] == sources[name]['sha1']
+    return sources, fresh
+
+
+def _read_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _write_manifest(cache_dir, manifest):
+    tmp_path = os.path.join(cache_dir, 'manifest.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent = 2)
+    os.replace(tmp_path, os.path.join(cache_dir, 'manifest.json'))
+
+
+## memory-maps the uncompressed arrow files, so a warm start only pages in the columns that actually get used
+def _read_frames(cache_dir, names):
+    from pyarrow import feather
+
+    return {name: feather.read_table(os.path.join(cache_dir, f'{name}.feather'), memory_map = True).to_pandas()
+            for name in names}
+
+
+def _write_frames(cache_dir, frames):
+    from pyarrow import feather
+
+    for name, frame in frames.items():
+        tmp_path = os.path.join(cache_dir, f'{name}.feather.tmp')
+        feather.write_feather(to_columnar(frame), tmp_path, compression = 'uncompressed')
+        os.replace(tmp_path, os.path.join(cache_dir, f'{name}.feather'))
+
+
+## this is the cached version of pipeline.build_frames
+## on a warm start (same source files as last time) the frames are read straight from the cache,
+## otherwise they are rebuilt with build and written back for next time
+## if pyarrow isn't installed, this just builds the frames every time
+def load_frames(paths = SOURCE_PATHS, cache_dir = CACHE_DIR, build = None):
+    if build is None:
+        from vaccinations.pipeline import build_frames as build
+
+    try:
+        import pyarrow
+    except ImportError:
+        print('pyarrow is not installed, building the frames without the cache')
+        return build(paths)
+
+    manifest = _read_manifest(cache_dir)
+    sources, fresh = _check_sources(paths, manifest)
+
+    if fresh:
+        if sources != manifest['sources']:
+            manifest['sources'] = sources
+            _write_manifest(cache_dir, manifest)
+        return _read_frames(cache_dir, manifest['frames'])
+
+    frames = build(paths)
+    os.makedirs(cache_dir, exist_ok = True)
+    _write_frames(cache_dir, frames)
+    _write_manifest(cache_dir, {'version': CACHE_VERSION, 'sources': sources, 'frames': list(frames.keys())})
+
+    return _read_frames(cache_dir, frames.keys())
@@ -0,0 +1,81 @@
+import functools
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+## the columns the line charts pull out for each country
+SERIES_COLS = ['date', 'vaccination_day_number', 'total_vaccinations', 'total_vaccinations_per_hundred', 'people_vaccinated', 'people_vaccinated_per_hundred']
+
+
+## the line charts draw one trace per country, which used to mean filtering the whole dataframe once per trace
+## here the adjusted dataframe is sorted by country and date once, and each column is kept as one contiguous numpy array
+## with a (start, stop) offset per country, so pulling out a country's series is just a slice (no copy, no scan)
+## version is a fingerprint of the data, which the figure cache below uses to know when cached figures are stale
+class SeriesStore:
+    def __init__(self, countries, offsets, arrays, version):
+        self.countries = list(countries)
+        self.offsets = offsets
+        self.arrays = arrays
+        self.version = version
+
+    @classmethod
+    def from_frame(cls, adjusted_df, columns = SERIES_COLS):
+        codes, countries = pd.factorize(adjusted_df['country'])
+        order = np.lexsort((adjusted_df['date'].to_numpy(), codes))
+        sorted_codes = codes[order]
+
+        bounds = np.searchsorted(sorted_codes, np.arange(len(countries) + 1))
+        offsets = {country: (bounds[i], bounds[i + 1]) for i, country in enumerate(countries)}
+        arrays = {col: np.ascontiguousarray(adjusted_df[col].to_numpy()[order]) for col in columns}
+
+        sha = hashlib.sha1()
+        sha.update('\0'.join(map(str, countries)).encode())
+        sha.update(bounds.tobytes())
+        for col in columns:
+            sha.update(arrays[col].tobytes())
+
+        return cls(countries, offsets, arrays, sha.hexdigest())
+
+    def __contains__(self, country):
+        return country in self.offsets
+
+    def series(self, country, col):
+        start, stop = self.offsets[country]
+        return self.arrays[col][start:stop]
+
+
+## a fingerprint of a (small) dataframe's contents, for figures that are also built from e.g. total_vacc_df:
+## putting it in the version means a reassigned or changed frame gets its figures rebuilt, e.g.
+##   @cached_figure(lambda: (store.version, frame_version(total_vacc_df)))
+def frame_version(df):
+    sha = hashlib.sha1()
+    sha.update('\0'.join(map(str, df.columns)).encode())
+    sha.update(pd.util.hash_pandas_object(df, index = True).to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+## memoizes a figure-building function on its arguments and the current data version
+## version is a function returning the version of whatever data the figures are built from (e.g. lambda: store.version)
+## when the version moves on, the whole cache for that function is dropped and figures get rebuilt on demand
+## NOTE: the cached figure object itself is returned, so don't modify it in place (copy it with go.Figure(fig) first)
+def cached_figure(version):
+    def decorator(func):
+        cache = {}
+        cached_version = [None]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            current = version()
+            if current != cached_version[0]:
+                cache.clear()
+                cached_version[0] = current
+            key = (args, tuple(sorted(kwargs.items())))
+            if key not in cache:
+                cache[key] = func(*args, **kwargs)
+            return cache[key]
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
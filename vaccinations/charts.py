@@ -0,0 +1,251 @@
+import pandas as pd
+
+from vaccinations.downsample import line_traces
+from vaccinations.rollup import ProgressRollup
+
+
+## all of the figures in the analysis, as functions that build and return a plotly figure without showing it
+## plotly is only imported inside each function, so importing this module (or running the data-only pipeline) doesn't pay for it
+## the multi-country line charts take line_options (a downsample.LineOptions) to draw big histories with fewer points / WebGL
+
+
+## here this is a basic map of which countries are using which sets of vaccinations
+## these are pretty region-dependent, based on which companies each country can get vaccines from
+def vaccine_sets_map(full_df):
+    import plotly.express as px
+
+    map_vaccines = px.choropleth(locations = full_df['country'], 
+                                 color = full_df['vaccines'],
+                                 locationmode = "country names",
+                                 title = "Countries using each set of vaccinations",
+                                 height = 800
+                                 )
+    map_vaccines.update_layout({'legend_orientation':'h', 'legend_title':'Set of vaccinations'})
+    return map_vaccines
+
+
+## using a treemap instead of a bar chart for aesthetics, you can see just how prevalent the more popular vaccinations are
+## some region-specific ones can only be found in a handful of countries
+def vaccine_sets_treemap(vacc_set_df):
+    import plotly.express as px
+
+    fig = px.treemap(vacc_set_df,
+                     path = ['vaccine_set'],
+                     values = 'count',
+                     title = 'Number of countries each unique set of vaccines can be found in',
+                     height = 600, width = 800)
+    fig.data[0].textinfo = 'label+text+value'
+    return fig
+
+
+## a full map of each country that an individual vaccine can be found in
+def vaccine_map_figure(vacc_index, vaccine_name):
+    import plotly.express as px
+
+    countries = vacc_index.countries_for(vaccine_name)
+    map_vaccines = px.choropleth(locations = countries, 
+                                 color = [True] * len(countries),
+                                 locationmode = "country names",
+                                 title = f"Countries using {vaccine_name}",
+                                 height = 500
+                                 )
+    map_vaccines.update_layout(showlegend=False)
+    return map_vaccines
+
+
+## a line chart with a line for each country an individual vaccine can be found in, showing their vaccination progress
+## NOTE: this is NOT how the vaccination progress in that country for the specific vaccine, but progress in total for that country
+## it's currently impossible to distribute a country's vaccinations across the vaccines they have access to, so we have to keep them bundled
+## the progression variables are already forward filled in the series store, so each line is just a slice
+def vaccine_progress_figure(vacc_index, store, vaccine_name, line_options = None):
+    import plotly.graph_objects as go
+
+    series = [(country, store.series(country, 'date'), store.series(country, 'total_vaccinations_per_hundred'))
+              for country in vacc_index.countries_for(vaccine_name)]
+
+    vaccine_line_plot = go.Figure(line_traces(series, line_options))
+    vaccine_line_plot.update_layout(
+        title = f'Vaccination progress per country using {vaccine_name} as one of its vaccination suppliers',
+        yaxis_title = "Vaccinations Per Hundred People",
+        hovermode = 'x',
+        legend_orientation = 'h',
+        height = 800
+    )
+    return vaccine_line_plot
+
+
+## both of the above for one vaccine, the map and the line chart
+def vaccine_figures(vacc_index, store, vaccine_name, line_options = None):
+    return vaccine_map_figure(vacc_index, vaccine_name), vaccine_progress_figure(vacc_index, store, vaccine_name, line_options)
+
+
+## quick and easy bar chart showing how many countries each vaccination can be found in
+def vaccine_counts_bar(vacc_index):
+    import plotly.express as px
+
+    unique_vaccines_countries = pd.DataFrame(vacc_index.to_dict()).transpose().reset_index().rename(columns = {'index': 'vaccine_company'}).sort_values(by = 'number', ascending = False)
+    fig = px.bar(unique_vaccines_countries,
+                 x = 'vaccine_company', y = 'number',
+                 labels = {'vaccine_company': 'Vaccination Company', 'number': 'Number of Countries Available'})
+    return fig
+
+
+def _progress_lines(grouped_series, title, yaxis_title, height, line_options = None):
+    import plotly.graph_objects as go
+
+    series = [(name, grouped['date'], grouped['total_vaccinations']) for name, grouped in grouped_series]
+    fig = go.Figure(line_traces(series, line_options))
+    fig.update_layout(
+        title = title,
+        yaxis_title = yaxis_title,
+        hovermode = 'x',
+        legend_orientation = 'h',
+        height = height
+    )
+    return fig
+
+
+## the vaccination progress for each country that a vaccination can be found in
+## again, NOTE this is NOT saying this is how many vaccinations have been rolled out for each vaccine type
+## rather, saying that for each country a vaccination can be found in, here is the total progress of those countries
+def vaccine_progress_chart(cube, line_options = None):
+    grouped_series = [(vacc, cube.series('total_vaccinations', vacc)) for vacc in cube.vaccines]
+    return _progress_lines(grouped_series, 'Vaccination progress for the countries each vaccine can be found in', "Count", 800, line_options)
+
+
+## the same as above, but for unique vaccination sets
+## so now we will have a line for each set of vaccinations present, summing up the countries using exactly that set
+def vaccine_set_progress_chart(cube, line_options = None):
+    grouped_series = [(vacc_set, cube.series('total_vaccinations', vacc_set, by = 'vaccine_set')) for vacc_set in cube.vaccine_sets]
+    return _progress_lines(grouped_series, 'Vaccination progress per set of vaccine present in each country', "Number of vaccines administered", 1000, line_options)
+
+
+## the top n countries by total vaccinations, comparing their progress by date or by day number since they started,
+## either as raw vaccinations or adjusted for population (per hundred)
+## returns None (after saying why) for a time period or pop_adjusted value it doesn't know
+def top_countries_figure(total_vacc_df, store, n = 25, time_period = 'date', pop_adjusted = True, line_options = None):
+    import plotly.graph_objects as go
+
+    sorted_df = total_vacc_df.sort_values(by = 'total_vaccinations', ascending = False)
+    countries = sorted_df.iloc[0 : n, ]['country'].tolist()
+    
+    if (time_period != 'date' and time_period != 'vaccination_day_number'):
+        print('must have different time period entry')
+        return None
+    elif time_period == 'date':
+        title = 'Vaccination progress per country by date'
+    elif time_period == 'vaccination_day_number':
+        title = 'Vaccination progress per country from the start of their vaccination rollout'
+
+    if pop_adjusted == True:
+        y_title = 'Vaccinations per hundred'
+        y_metric = 'total_vaccinations_per_hundred'
+    elif pop_adjusted == False:
+        y_title = 'Vaccinations'
+        y_metric = 'total_vaccinations'
+    else:
+        print('must have different pop adjusted entry')
+        return None
+        
+    series = [(country, store.series(country, time_period), store.series(country, y_metric)) for country in countries]
+    fig = go.Figure(line_traces(series, line_options))
+    fig.update_layout(
+        title = title,
+        yaxis_title = y_title,
+        hovermode = 'x',
+        legend_orientation = 'h',
+        height = 800
+    )
+
+    return fig
+
+
+## the total progress of the top n countries as of today
+## it shows countries with the top n number of total vaccinations, compared to how they are doing adjusted for their population (per hundred)
+def top_countries_scatter(total_vacc_df, n = 25):
+    import plotly.express as px
+
+    fig = px.scatter(total_vacc_df.sort_values(by = 'total_vaccinations', ascending = False).iloc[0:n, ],
+               x = 'total_vaccinations',
+               y = 'total_per_hundred',
+               size = 'population',
+               hover_name = 'country',
+               color = 'continent',
+               size_max = 80,
+               height = 800,
+               title = 'Comparing country progress for total vaccinations and total vaccinations per hundred people',
+               labels = dict(total_per_hundred = "Total Vaccinations per Hundred People", total_vaccinations = "Total Vaccinations (raw)"))
+    return fig
+
+
+## a world -> continent -> country treemap of either current total vaccinations per hundred (vals = 'total')
+## or average vaccinations per hundred *per day (vals = 'average'), for countries with at least min_pop people
+## (since each value is adjusted for population, countries with super low populations would otherwise find their way to the top)
+## returns None (after saying why) for a vals it doesn't know
+## with a rollup (a rollup.ProgressRollup of total_vacc_df) the countries are looked up by binary search instead of filtering total_vacc_df
+def avg_vaccination_progress_figure(total_vacc_df, vals, min_pop = 10000000, rollup = None):
+    import plotly.express as px
+
+    if vals != 'total' and vals != 'average':
+        print('must input an appropriate value type')
+        return None
+    elif vals == 'total':
+        val_metric = 'total_per_hundred'
+    elif vals == 'average':
+        val_metric = 'average_daily_percent_vaccinated'
+    
+    chart_df = rollup.frame(min_pop) if rollup is not None else total_vacc_df[total_vacc_df['population'] >= min_pop]
+    fig = px.treemap(chart_df,
+                     path = ['world', 'continent', 'country'],
+                     values = val_metric,
+                     height = 750)
+    fig.data[0].textinfo = 'label+text+value'
+
+    return fig
+
+
+## a bar chart for the countries within a continent, showing the most efficient countries at vaccinating their population
+## the color is showing total vaccinations per hundred people, darker color meaning more vaccinations administered
+## with a rollup (a rollup.ProgressRollup of total_vacc_df) the continent's countries come already ranked
+def continent_bar_figure(total_vacc_df, cont, rollup = None):
+    import plotly.express as px
+
+    if rollup is not None:
+        sorted_df = rollup.ranking(cont, 'average_daily_percent_vaccinated')
+    else:
+        continent_df = total_vacc_df[total_vacc_df['continent'] == cont]
+        sorted_df = continent_df.sort_values(by = 'average_daily_percent_vaccinated', ascending = False)
+    
+    fig = px.bar(sorted_df,
+                 x = 'country', y = 'average_daily_percent_vaccinated',
+                 color = 'total_per_hundred',
+                 color_continuous_scale = 'deep',
+                 width = 800,
+                 height = 500,
+                 title = cont,
+                 labels = dict(total_per_hundred = 'Total Vaccinations Per Hundred', average_daily_percent_vaccinated = 'Average % Population Vaccinated Per Day', country = 'Country'))
+    return fig
+
+
+## the bar chart above for every continent, as a list of (continent, figure)
+## the continents are ranked all at once by a rollup (built here unless one is passed in) rather than filtered and sorted one at a time
+def continent_bar_figures(total_vacc_df, rollup = None):
+    rollup = rollup if rollup is not None else ProgressRollup.from_frame(total_vacc_df)
+    return [(cont, continent_bar_figure(total_vacc_df, cont, rollup)) for cont in rollup.continents if cont is not None]
+
+
+## the "predictions" for which day each country will finish vaccinating, along with their current progress as of today
+def completion_scatter(country_results_df):
+    import plotly.express as px
+
+    fig = px.scatter(country_results_df,
+               x = 'final_date',
+               y = 'total_per_hundred',
+               size = 'population',
+               hover_name = 'country',
+               color = 'continent',
+               size_max = 80,
+               height = 800,
+               title = 'Comparing current country vaccination progress with estimated final vaccination date',
+               labels = dict(total_per_hundred = 'Total Vaccinations per Hundred (as of today)', final_date = 'Rough Estimate for Country to be Fully Vaccinated'))
+    return fig
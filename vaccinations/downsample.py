@@ -0,0 +1,166 @@
+import collections
+
+import numpy as np
+import pandas as pd
+
+
+## the multi-country line charts draw one trace per country over every day of data, which makes for huge, slow figures as the history grows
+## LineOptions switches on a lighter way of drawing them (the defaults draw every point exactly as before):
+##   - max_points: each trace is downsampled to at most this many points with largest-triangle-three-buckets (LTTB),
+##     which keeps the shape of the line (peaks, dips and the end points) rather than every nth day
+##   - webgl_threshold: once the figure has more points than this in total, the traces are drawn with Scattergl (WebGL) instead of Scatter
+##   - shared_x: traces on a regular daily grid (or day numbers) send x as a start and step (x0 / dx) that every trace shares,
+##     instead of each carrying its own array of dates. days missing from a trace become gaps the line is drawn straight across
+LineOptions = collections.namedtuple('LineOptions', ['max_points', 'webgl_threshold', 'shared_x'], defaults = [None, None, False])
+
+## a light mode that is a reasonable starting point for tuning
+COMPACT_LINES = LineOptions(max_points = 300, webgl_threshold = 20000, shared_x = True)
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+## largest-triangle-three-buckets: picks n_out of the points (x, y), always keeping the first and the last
+## the points in between are split into n_out - 2 buckets, and from each bucket the point that makes the largest triangle
+## with the previously picked point and the average of the next bucket is kept
+## returns the positions of the kept points (so x and y can be sliced in their original types)
+def lttb(x, y, n_out):
+    return lttb_many([(x, y)], n_out)[0]
+
+
+## lttb for many series at once: the buckets are stepped through once for all of the series together
+## (each pick depends on the one before it, so the steps themselves can't be vectorized, but every series can within a step)
+## series is a list of (x, y), returns a list of the kept positions of each
+def lttb_many(series, n_out):
+    results = [np.arange(len(y)) for _, y in series]
+    todo = [i for i, (_, y) in enumerate(series) if 3 <= n_out < len(y)]
+    if not todo:
+        return results
+
+    lengths = np.array([len(series[i][1]) for i in todo])
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    x = np.concatenate([_as_float(series[i][0]) for i in todo])
+    y = np.concatenate([np.asarray(series[i][1], dtype = float) for i in todo])
+
+    ## bucket edges within each series, and the average point of each bucket (the last bucket's "next bucket" is just the last point)
+    ## the averages don't depend on which points get picked, so those are worked out up front
+    edges = np.linspace(1, lengths - 1, n_out - 1, axis = 1).astype(int)
+    starts = offsets[:, None] + np.concatenate([np.zeros((len(todo), 1), dtype = int), edges], axis = 1)
+    counts = np.diff(np.append(starts.ravel(), len(y))).reshape(starts.shape)
+    avg_x = (np.add.reduceat(x, starts.ravel()).reshape(starts.shape) / counts)[:, 1:]
+    avg_y = (np.add.reduceat(y, starts.ravel()).reshape(starts.shape) / counts)[:, 1:]
+
+    selected = np.zeros((len(todo), n_out), dtype = int)
+    selected[:, -1] = lengths - 1
+    widths = np.arange((edges[:, 1:] - edges[:, :-1]).max())
+    a = offsets.copy()
+    for i in range(n_out - 2):
+        start, stop = offsets + edges[:, i], offsets + edges[:, i + 1]
+        positions = start[:, None] + widths
+        valid = positions < stop[:, None]
+        positions = np.minimum(positions, len(y) - 1)
+
+        xa, ya = x[a][:, None], y[a][:, None]
+        area = np.abs((xa - avg_x[:, i + 1, None]) * (y[positions] - ya) - (xa - x[positions]) * (avg_y[:, i + 1, None] - ya))
+        area = np.where(valid, np.nan_to_num(area, nan = -1.0), -np.inf)
+        a = start + np.argmax(area, axis = 1)
+        selected[:, i + 1] = a - offsets
+
+    for row, i in enumerate(todo):
+        results[i] = selected[row]
+    return results
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').view('int64').astype(float)
+    return x.astype(float)
+
+
+## builds one line trace per (name, x, y) in series, following options (a LineOptions, None draws every point as before)
+## mode and any other keyword arguments are passed on to every trace
+def line_traces(series, options = None, mode = 'lines+markers', **trace_kwargs):
+    import plotly.graph_objects as go
+
+    options = options or LineOptions()
+    if options == LineOptions():
+        return [go.Scatter(name = name, x = x, mode = mode, y = y, **trace_kwargs) for name, x, y in series]
+
+    prepared = []
+    for name, x, y in series:
+        x, y = np.asarray(x), np.asarray(y)
+        ## nullable integer counts come out as objects, which would be sent as a plain list rather than a compact typed array
+        if y.dtype == object:
+            y = y.astype(float)
+        prepared.append((name, x, y))
+
+    if options.max_points is not None:
+        kept = lttb_many([(x, y) for _, x, y in prepared], options.max_points)
+        prepared = [(name, x[keep], y[keep]) for (name, x, y), keep in zip(prepared, kept)]
+
+    total_points = sum(len(y) for _, _, y in prepared)
+    trace_type = go.Scattergl if options.webgl_threshold is not None and total_points > options.webgl_threshold else go.Scatter
+
+    traces = []
+    for name, x, y in prepared:
+        grid = _regular_grid(x, y) if options.shared_x else None
+        if grid is None:
+            traces.append(trace_type(name = name, x = x, mode = mode, y = y, **trace_kwargs))
+        else:
+            x0, dx, grid_y = grid
+            traces.append(trace_type(name = name, x0 = x0, dx = dx, mode = mode, y = grid_y, connectgaps = True, **trace_kwargs))
+    return traces
+
+
+## puts y onto a regular grid of days (or day numbers) starting at x[0], returning (x0, dx, y on the grid)
+## gives None when x isn't whole days / integers, isn't increasing, or the gaps would more than double the number of points
+def _regular_grid(x, y):
+    if len(x) < 2:
+        return None
+    if np.issubdtype(x.dtype, np.datetime64):
+        steps = (x.astype('datetime64[D]') - x[0].astype('datetime64[D]')).astype(int)
+        if not (x == x.astype('datetime64[D]')).all():
+            return None
+        x0, dx = pd.Timestamp(x[0]).strftime('%Y-%m-%d'), DAY_MS
+    elif np.issubdtype(x.dtype, np.integer) or (np.issubdtype(x.dtype, np.floating) and (x == np.round(x)).all()):
+        steps = (x - x[0]).astype(int)
+        x0, dx = x[0].item(), 1
+    else:
+        return None
+
+    if (np.diff(steps) <= 0).any() or steps[-1] + 1 > 2 * len(steps):
+        return None
+    grid_y = np.full(steps[-1] + 1, np.nan)
+    grid_y[steps] = y
+    return x0, dx, grid_y
+
+
+## how heavy a figure is to ship and draw: traces, points, the figure json and the html (without plotly.js itself) in bytes
+def payload_report(fig):
+    points = [len(trace.y) if trace.y is not None else 0 for trace in fig.data]
+    return {
+        'traces': len(fig.data),
+        'trace_types': sorted({trace.type for trace in fig.data}),
+        'points': int(sum(points)),
+        'max_trace_points': int(max(points, default = 0)),
+        'json_bytes': len(fig.to_json().encode()),
+        'html_bytes': len(fig.to_html(include_plotlyjs = False, full_html = False).encode())
+    }
+
+
+## the browser side of the report: this is added to the html export, and once the figure is drawn it shows (and logs to the console)
+## how many milliseconds the page took from starting to load until the figure was drawn, which is what to compare between settings
+RENDER_TIMER_SCRIPT = '''
+var rendered_ms = performance.now().toFixed(0);
+console.log('figure drawn after ' + rendered_ms + ' ms');
+var note = document.createElement('div');
+note.id = 'render-time';
+note.textContent = 'drawn after ' + rendered_ms + ' ms';
+note.style.cssText = 'font: 12px monospace; color: #888;';
+document.body.appendChild(note);
+'''
+
+
+## writes the figure as html with the render timer, for opening in a browser
+def write_timed_html(fig, path, include_plotlyjs = 'cdn'):
+    fig.write_html(path, include_plotlyjs = include_plotlyjs, post_script = RENDER_TIMER_SCRIPT)
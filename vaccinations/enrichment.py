@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+
+## these are our progression variables
+## these all represent the progress a country is making, but the df resets to 0 for every day these aren't updated / there is no more progress
+## so, to rectify this, we forward fill each of these within a country. so in the event of a "0", we fill in the previous day's value
+COLS_TO_FFILL = ['total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated', 'total_vaccinations_per_hundred', 'people_vaccinated_per_hundred', 'people_fully_vaccinated_per_hundred']
+
+
+## this adds the country-specific progress columns to the merged vaccination dataframe in one vectorized pass
+## instead of slicing the dataframe per country and stitching the slices back together, everything is done with a groupby on country
+## the output has the same rows, order and columns as the old per-country loop:
+##   - the progression variables forward filled over zeros within each country (leading zeros stay 0)
+##   - vaccination_day_number: days since the country's first row
+##   - percent_total_vaccinations / percent_people_vaccinated: progress as a share of the country's max as of today
+def enrich_progress(full_df, cols_to_ffill = COLS_TO_FFILL):
+    ## the old loop appended countries in order of first appearance, keeping each country's rows in file order
+    country_codes = pd.factorize(full_df['country'])[0]
+    adjusted_df = full_df.iloc[np.argsort(country_codes, kind = 'stable')].copy()
+    by_country = adjusted_df.groupby('country', sort = False, observed = True)
+
+    filled = adjusted_df[cols_to_ffill]
+    filled = filled.mask(filled == 0)
+    adjusted_df[cols_to_ffill] = filled.groupby(adjusted_df['country'], sort = False, observed = True).ffill().fillna(0)
+
+    first_vaccination = by_country['date'].transform('min')
+    adjusted_df['vaccination_day_number'] = (adjusted_df['date'] - first_vaccination).dt.days.clip(lower = 0)
+
+    by_country = adjusted_df.groupby('country', sort = False, observed = True)
+    adjusted_df['percent_total_vaccinations'] = adjusted_df['total_vaccinations'] / by_country['total_vaccinations'].transform('max')
+    adjusted_df['percent_people_vaccinated'] = adjusted_df['people_vaccinated'] / by_country['people_vaccinated'].transform('max')
+
+    return adjusted_df
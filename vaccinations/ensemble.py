@@ -0,0 +1,263 @@
+import hashlib
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from vaccinations.cache import CACHE_DIR
+from vaccinations.forecast import curve_func
+
+
+## the quadratic curve_func gives up on any country whose rollout has slowed down: the parabola turns over and never reaches the target
+## so here several models are fitted to each country's people vaccinated per hundred, and scored on how well they predict the last few days:
+##   - quadratic: curve_func, as before
+##   - logistic: an s-curve that levels off at k (the share of people that will end up vaccinated)
+##   - gompertz: another saturating curve, with a slower approach to its ceiling than the logistic
+##   - linear_recent: a straight line through just the last recent_days days, i.e. "keeps going at the current pace"
+## each model is first fitted without the last holdout_days days and scored (rmse) on them, then refitted on all of the data for the forecast
+## ensemble_results then either picks each country's best scoring model, or blends them with weights of 1 / rmse^2
+## the countries are fitted across a process pool (the saturating models need scipy's curve_fit), and each country's fits are cached
+## on disk keyed by a fingerprint of its series, so a daily refresh only refits the countries whose data changed
+MODELS = ('quadratic', 'logistic', 'gompertz', 'linear_recent')
+
+HOLDOUT_DAYS = 7
+RECENT_DAYS = 14
+
+FORECAST_CACHE_PATH = os.path.join(CACHE_DIR, 'forecast_fits.pkl')
+
+## bump this whenever the models or the way they are fitted change, so cached fits get redone
+ENSEMBLE_VERSION = 1
+
+
+def logistic_func(x, k, r, x0):
+    return k / (1 + np.exp(-r * (x - x0)))
+
+
+def gompertz_func(x, k, b, r):
+    return k * np.exp(-b * np.exp(-r * x))
+
+
+def linear_func(x, m, c):
+    return m * x + c
+
+
+MODEL_FUNCS = {'quadratic': curve_func, 'logistic': logistic_func, 'gompertz': gompertz_func, 'linear_recent': linear_func}
+
+
+## the derivatives of the saturating curves with respect to each parameter, which saves curve_fit a third or so of its time
+## over estimating them with finite differences
+def _logistic_jac(x, k, r, x0):
+    e = np.exp(-r * (x - x0))
+    return np.stack([1 / (1 + e), k * e * (x - x0) / (1 + e)**2, -k * e * r / (1 + e)**2], axis = -1)
+
+
+def _gompertz_jac(x, k, b, r):
+    e = np.exp(-r * x)
+    g = np.exp(-b * e)
+    return np.stack([g, -k * e * g, k * b * x * e * g], axis = -1)
+
+
+## fits one model to one series (x increasing), returning its parameters or None if the fit failed
+## the linear models are solved directly, the saturating ones get a starting guess and bounds (the ceiling has to be at least the highest value so far)
+def _fit_model(model, x, y, recent_days = RECENT_DAYS):
+    if model == 'quadratic':
+        b, a, c = np.polyfit(x, y, 2)
+        return np.array([a, b, c])
+    if model == 'linear_recent':
+        recent = x > x[-1] - recent_days
+        if recent.sum() < 2:
+            recent = np.ones(len(x), dtype = bool)
+        return np.polyfit(x[recent], y[recent], 1)
+
+    from scipy.optimize import curve_fit
+
+    top = max(y.max(), 1e-3)
+    ceiling = max(200.0, 2 * top)
+    if model == 'logistic':
+        p0, bounds, jac = [min(1.5 * top + 1, ceiling), 0.05, x[-1]], ([top, 1e-4, -1e4], [ceiling, 1.0, 1e4]), _logistic_jac
+    else:
+        p0, bounds, jac = [min(1.5 * top + 1, ceiling), 5.0, 0.02], ([top, 1e-6, 1e-6], [ceiling, 1e4, 1.0]), _gompertz_jac
+    try:
+        popt, pcov = curve_fit(MODEL_FUNCS[model], x, y, p0 = p0, bounds = bounds, jac = jac, maxfev = 5000)
+    except (RuntimeError, ValueError):
+        return None
+    return popt
+
+
+def _rmse(predicted, actual):
+    return float(np.sqrt(np.mean((predicted - actual)**2)))
+
+
+## every model's parameters and holdout rmse for one country, plus the blend (its params are the weights of each model, in models order)
+## countries without min_rows rows before the holdout can't be scored, and get NaN scores
+def _fit_country(x, y, models, holdout_days, recent_days, min_rows):
+    train = x <= x[-1] - holdout_days
+    scored = train.sum() >= min_rows and (~train).any()
+
+    fits, holdout_predictions = {}, {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for model in models:
+            rmse = np.nan
+            if scored:
+                train_params = _fit_model(model, x[train], y[train], recent_days)
+                if train_params is not None:
+                    holdout_predictions[model] = MODEL_FUNCS[model](x[~train], *train_params)
+                    rmse = _rmse(holdout_predictions[model], y[~train])
+            fits[model] = (_fit_model(model, x, y, recent_days), rmse)
+
+    ## a model that predicted the holdout exactly takes all of the weight
+    rmses = np.array([fits[model][1] if fits[model][0] is not None else np.nan for model in models])
+    with np.errstate(divide = 'ignore'):
+        weights = np.where(np.isfinite(rmses), 1 / rmses**2, 0.0)
+    if np.isinf(weights).any():
+        weights = np.isinf(weights).astype(float)
+    if weights.sum() > 0:
+        weights = weights / weights.sum()
+        blended = sum(weight * holdout_predictions[model] for model, weight in zip(models, weights) if weight > 0)
+        fits['blend'] = (weights, _rmse(blended, y[~train]))
+    else:
+        fits['blend'] = (None, np.nan)
+    return fits
+
+
+def _fit_chunk(chunk, models, holdout_days, recent_days, min_rows):
+    return {name: _fit_country(x, y, models, holdout_days, recent_days, min_rows) for name, x, y in chunk}
+
+
+def _fingerprint(config, x, y):
+    sha = hashlib.sha1(config.encode())
+    sha.update(x.tobytes())
+    sha.update(y.tobytes())
+    return sha.hexdigest()
+
+
+def _load_fits_cache(cache_path):
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    try:
+        return pd.read_pickle(cache_path)
+    except Exception as error:
+        print(f'could not read the forecast cache, refitting every country: {error}')
+        return {}
+
+
+def _save_fits_cache(cache, cache_path):
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok = True)
+    tmp_path = cache_path + '.tmp'
+    pd.to_pickle(cache, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+## fits every model to every country with at least min_rows rows, reusing the cached fits of countries whose series hasn't changed
+## returns one row per (country, model), plus a 'blend' row per country, with the fitted params, the holdout rmse
+## and whether the fit came out of the cache. params is None where a fit failed
+## the fitting follows forecast.fit_curves: max_workers = 1 runs everything in this process, otherwise across a process pool
+## cache_path = None turns the cache off
+def fit_ensemble(df, models = MODELS, holdout_days = HOLDOUT_DAYS, recent_days = RECENT_DAYS, x_col = 'vaccination_day_number', y_col = 'people_vaccinated_per_hundred',
+                 group_col = 'country', min_rows = 5, max_workers = None, chunk_size = 16, cache_path = FORECAST_CACHE_PATH):
+    series = []
+    for name, group in df.groupby(group_col, sort = False, observed = True):
+        if len(group) >= min_rows:
+            order = np.argsort(group[x_col].to_numpy(), kind = 'stable')
+            series.append((name, group[x_col].to_numpy(dtype = float)[order], group[y_col].to_numpy(dtype = float)[order]))
+
+    config = repr((ENSEMBLE_VERSION, tuple(models), holdout_days, recent_days, min_rows))
+    fingerprints = {name: _fingerprint(config, x, y) for name, x, y in series}
+    cache = _load_fits_cache(cache_path)
+    results = {name: cache[name][1] for name, _, _ in series if name in cache and cache[name][0] == fingerprints[name]}
+
+    todo = [item for item in series if item[0] not in results]
+    chunks = [todo[i : i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    args = (models, holdout_days, recent_days, min_rows)
+    fitted = {}
+    if max_workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            fitted.update(_fit_chunk(chunk, *args))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers = max_workers) as pool:
+            for chunk_results in pool.map(_fit_chunk, chunks, *[[arg] * len(chunks) for arg in args]):
+                fitted.update(chunk_results)
+    results.update(fitted)
+
+    if cache_path is not None and fitted:
+        _save_fits_cache({name: (fingerprints[name], results[name]) for name, _, _ in series}, cache_path)
+
+    rows = [(name, model, params, rmse, name not in fitted) for name, _, _ in series for model, (params, rmse) in results[name].items()]
+    fits = pd.DataFrame(rows, columns = [group_col, 'model', 'params', 'holdout_rmse', 'cached'])
+    return fits.set_index([group_col, 'model'])
+
+
+## the forecast curve of one country over days 0 to horizon, from its best model (method = 'best') or the blend of them all ('blend')
+## returns the curve and the model it came from, or (None, None) if nothing could be fitted
+def _forecast_curve(country_fits, days, method, models):
+    singles = country_fits.drop('blend', errors = 'ignore')
+    singles = singles[singles['params'].notna()]
+    if singles.empty:
+        return None, None
+
+    if method == 'blend' and 'blend' in country_fits.index and isinstance(country_fits.at['blend', 'params'], np.ndarray):
+        weights = country_fits.at['blend', 'params']
+        curve = sum(weight * MODEL_FUNCS[model](days, *country_fits.at[model, 'params']) for model, weight in zip(models, weights) if weight > 0)
+        return curve, 'blend'
+
+    ## without any holdout scores (a short series), fall back on the quadratic as before
+    scored = singles['holdout_rmse'].dropna()
+    model = scored.idxmin() if not scored.empty else ('quadratic' if 'quadratic' in singles.index else singles.index[0])
+    return MODEL_FUNCS[model](days, *singles.at[model, 'params']), model
+
+
+## the first (fractional) day the curve reaches target, by linear interpolation between the whole days either side, NaN if it never does
+def _crossing_day(days, curve, target):
+    above = np.flatnonzero(curve >= target)
+    if len(above) == 0:
+        return np.nan
+    i = above[0]
+    if i == 0:
+        return 0.0
+    return days[i - 1] + (target - curve[i - 1]) / (curve[i] - curve[i - 1]) * (days[i] - days[i - 1])
+
+
+## the same table as forecast.completion_results, from the ensemble's fits: one row per country whose forecast reaches the target within
+## horizon days of starting, with days_until_fully_vaccinated, which model the forecast came from and its holdout rmse,
+## the per-country summary columns, and final_date
+def ensemble_results(fits, total_vacc_df, target = 100, horizon = 365, method = 'best', models = MODELS):
+    if method not in ('best', 'blend'):
+        print(f"method must be 'best' or 'blend', not {method}")
+        return None
+
+    days = np.arange(horizon + 1, dtype = float)
+    rows = []
+    for country, country_fits in fits.groupby(level = 0, sort = False):
+        country_fits = country_fits.droplevel(0)
+        with np.errstate(over = 'ignore', invalid = 'ignore'):
+            curve, model = _forecast_curve(country_fits, days, method, models)
+        if curve is None:
+            continue
+        crossing = _crossing_day(days, curve, target)
+        if np.isfinite(crossing) and np.ceil(crossing) < horizon:
+            rows.append((country, crossing, model, country_fits.at[model, 'holdout_rmse']))
+
+    country_results_df = pd.DataFrame(rows, columns = ['country', 'days_until_fully_vaccinated', 'model', 'holdout_rmse'])
+    country_results_df['country'] = country_results_df['country'].astype(str)
+    country_results_df = country_results_df.merge(total_vacc_df, on = 'country')
+    country_results_df['final_date'] = country_results_df['day_started'] + pd.to_timedelta(country_results_df['days_until_fully_vaccinated'], unit = 'D')
+
+    return country_results_df
+
+
+## how each model scores across the countries: the number of countries it was fitted and scored for, its median holdout rmse,
+## and how many countries it is the best scoring model for
+def model_scores(fits):
+    scores = fits['holdout_rmse'].unstack('model')
+    singles = scores.drop(columns = 'blend', errors = 'ignore')
+    best = singles.dropna(how = 'all').idxmin(axis = 1).value_counts()
+    return pd.DataFrame({
+        'fitted': fits['params'].notna().groupby(level = 'model').sum(),
+        'scored': scores.notna().sum(),
+        'median_holdout_rmse': scores.median(),
+        'best_for': best
+    }).fillna({'best_for': 0}).astype({'best_for': int})
@@ -0,0 +1,258 @@
+import argparse
+import collections
+import functools
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from vaccinations import charts, downsample
+from vaccinations.summary import add_daily_rates
+
+
+## batch export of every figure in the analysis to Figs/ (Fig_1.png, Fig_2.png, ... with the numbers the README shows them under)
+## each figure is described by a spec: its name, the slice of data it is drawn from, and how to build it
+## the slice gets hashed (along with the chart code), and a figure is only rebuilt and re-rendered when its hash changed since the last export,
+## so a refresh costs time in proportion to the figures whose data actually changed. the ones that did change are rendered across a process pool
+## the hashes are kept in a small manifest next to the figures (.manifest.json), keyed by figure name
+## NOTE: png / svg export goes through plotly's kaleido package, html only needs plotly
+##
+## from the command line:
+##   python -m vaccinations.export --formats png html --workers 4
+FIGS_DIR = 'Figs'
+MANIFEST_NAME = '.manifest.json'
+
+## the vaccines that get their own map and progress chart
+TOP_VACCINES = ('Pfizer/BioNTech', 'Moderna', 'Oxford/AstraZeneca', 'Sputnik V', 'Sinopharm/Beijing', 'Sinovac')
+
+## data returns the dataframe (or tuple of dataframes) the figure is drawn from, build returns the figure, both take no arguments
+## options is anything else that changes how the figure is drawn (the line chart options), it is part of the hash
+## number is the figure's number in the README (Fig_<number>), None for figures the README doesn't show
+FigureSpec = collections.namedtuple('FigureSpec', ['name', 'data', 'build', 'options', 'number'], defaults = [None, None])
+
+## the README's figure number for each figure, pinned by name so that the files never shift around
+## (a continent or vaccine that isn't in the README gets a file named after the figure instead, see figure_stem)
+README_FIGURES = {
+    'vaccine_sets_map': 1,
+    'vaccine_sets_treemap': 2,
+    **{f'vaccine_map {vaccine_name}': 3 + 2 * i for i, vaccine_name in enumerate(TOP_VACCINES)},
+    **{f'vaccine_progress {vaccine_name}': 4 + 2 * i for i, vaccine_name in enumerate(TOP_VACCINES)},
+    'vaccine_counts': 15,
+    'vaccine_progress': 16,
+    'vaccine_set_progress': 17,
+    'top_countries 50 date total': 18,
+    'top_countries 50 vaccination_day_number total': 19,
+    'top_countries 30 date per_hundred': 20,
+    'top_countries 30 vaccination_day_number per_hundred': 21,
+    'top_countries_scatter': 22,
+    'progress_treemap total': 23,
+    'progress_treemap average': 24,
+    'continent_bars North America': 25,
+    'continent_bars Asia': 26,
+    'continent_bars Europe': 27,
+    'continent_bars South America': 28,
+    'continent_bars Africa': 29,
+    'completion_scatter': 30
+}
+
+
+## every figure in the analysis as a spec, in README order
+## frames needs full_df, adjusted_df and total_vacc_df, the completion scatter is only included when country_results_df is there too
+## line_options (a downsample.LineOptions) is passed on to the multi-country line charts
+def figure_specs(frames, top_vaccines = TOP_VACCINES, line_options = None):
+    from vaccinations.chart_data import SeriesStore
+    from vaccinations.cube import ProgressCube
+    from vaccinations.rollup import ProgressRollup
+    from vaccinations.vaccine_index import VaccineIndex, vaccine_set_counts
+
+    full_df, adjusted_df, total_vacc_df = frames['full_df'], frames['adjusted_df'], frames['total_vacc_df']
+    progress_df = frames['progress_df'] if 'progress_df' in frames else add_daily_rates(total_vacc_df)
+    vacc_index = VaccineIndex.from_frame(full_df)
+    store = SeriesStore.from_frame(adjusted_df)
+    cube = ProgressCube.from_frame(adjusted_df, vacc_index)
+    rollup = ProgressRollup.from_frame(progress_df)
+    vacc_set_df = vaccine_set_counts(full_df)
+
+    ## the countries in the order the chart draws (and ranks) them, along with their rows
+    def country_rows(countries, cols):
+        return lambda: (pd.DataFrame({'country': list(countries)}), adjusted_df.loc[adjusted_df['country'].isin(countries), ['country'] + cols])
+
+    specs = [
+        FigureSpec('vaccine_sets_map', lambda: full_df[['country', 'vaccines']], functools.partial(charts.vaccine_sets_map, full_df)),
+        FigureSpec('vaccine_sets_treemap', lambda: vacc_set_df[['vaccine_set', 'count']], functools.partial(charts.vaccine_sets_treemap, vacc_set_df))
+    ]
+    for vaccine_name in top_vaccines:
+        countries = vacc_index.countries_for(vaccine_name)
+        specs += [
+            FigureSpec(f'vaccine_map {vaccine_name}', functools.partial(pd.DataFrame, {'country': countries}),
+                       functools.partial(charts.vaccine_map_figure, vacc_index, vaccine_name)),
+            FigureSpec(f'vaccine_progress {vaccine_name}', country_rows(countries, ['date', 'total_vaccinations_per_hundred']),
+                       functools.partial(charts.vaccine_progress_figure, vacc_index, store, vaccine_name, line_options = line_options), line_options)
+        ]
+
+    ## both progress charts add up total_vaccinations by date, for each vaccine / each set of vaccines
+    totals_by_set = lambda: adjusted_df[['vaccines', 'date', 'total_vaccinations']]
+    specs += [
+        FigureSpec('vaccine_counts', lambda: vacc_index.counts().to_frame('number'), functools.partial(charts.vaccine_counts_bar, vacc_index)),
+        FigureSpec('vaccine_progress', totals_by_set, functools.partial(charts.vaccine_progress_chart, cube, line_options = line_options), line_options),
+        FigureSpec('vaccine_set_progress', totals_by_set, functools.partial(charts.vaccine_set_progress_chart, cube, line_options = line_options), line_options)
+    ]
+
+    for n, time_period, pop_adjusted in [(50, 'date', False), (50, 'vaccination_day_number', False), (30, 'date', True), (30, 'vaccination_day_number', True)]:
+        y_metric = 'total_vaccinations_per_hundred' if pop_adjusted else 'total_vaccinations'
+        countries = total_vacc_df.sort_values(by = 'total_vaccinations', ascending = False)['country'].iloc[0 : n]
+        specs.append(FigureSpec(f'top_countries {n} {time_period} {"per_hundred" if pop_adjusted else "total"}', country_rows(countries, [time_period, y_metric]),
+                                functools.partial(charts.top_countries_figure, total_vacc_df, store, n = n, time_period = time_period, pop_adjusted = pop_adjusted,
+                                                  line_options = line_options), line_options))
+
+    specs.append(FigureSpec('top_countries_scatter', lambda: total_vacc_df[['country', 'total_vaccinations', 'total_per_hundred', 'population', 'continent']].iloc[0 : 25],
+                            functools.partial(charts.top_countries_scatter, total_vacc_df, n = 25)))
+
+    for vals, val_metric, min_pop in [('total', 'total_per_hundred', 10000000), ('average', 'average_daily_percent_vaccinated', 1000000)]:
+        specs.append(FigureSpec(f'progress_treemap {vals}',
+                                functools.partial(rollup.frame, min_pop, ['world', 'continent', 'country', val_metric]),
+                                functools.partial(charts.avg_vaccination_progress_figure, progress_df, vals = vals, min_pop = min_pop, rollup = rollup)))
+
+    for cont in (cont for cont in rollup.continents if cont is not None):
+        specs.append(FigureSpec(f'continent_bars {cont}',
+                                functools.partial(lambda cont: progress_df.loc[progress_df['continent'] == cont, ['country', 'average_daily_percent_vaccinated', 'total_per_hundred']], cont),
+                                functools.partial(charts.continent_bar_figure, progress_df, cont, rollup = rollup)))
+
+    if 'country_results_df' in frames:
+        country_results_df = frames['country_results_df']
+        specs.append(FigureSpec('completion_scatter', lambda: country_results_df[['country', 'final_date', 'total_per_hundred', 'population', 'continent']],
+                                functools.partial(charts.completion_scatter, country_results_df)))
+
+    return [spec._replace(number = README_FIGURES.get(spec.name)) for spec in specs]
+
+
+## the file name (without the extension) a figure is exported as
+def figure_stem(spec):
+    return f'Fig_{spec.number}' if spec.number is not None else spec.name.replace('/', '_').replace(' ', '_')
+
+
+## a fingerprint of the figure: its name, options, the chart code and every value (and dtype) of its data slice
+def spec_hash(spec, code_hash = None):
+    digest = hashlib.sha1(spec.name.encode())
+    digest.update(repr(spec.options).encode())
+    digest.update((code_hash or _charts_hash()).encode())
+
+    data = spec.data()
+    for frame in (data if isinstance(data, tuple) else (data,)):
+        digest.update(repr(list(zip(frame.columns, frame.dtypes.astype(str)))).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index = False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+## any change to the chart code changes how every figure looks
+@functools.lru_cache(maxsize = 1)
+def _charts_hash():
+    digest = hashlib.sha1()
+    for module in [charts, downsample]:
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+## renders one figure (as plotly json) into each format, this is what runs in the worker processes
+def _render_figure(figure_json, base_path, formats):
+    import plotly.io as pio
+
+    fig = pio.from_json(figure_json)
+    for fmt in formats:
+        path = f'{base_path}.{fmt}'
+        if fmt == 'html':
+            fig.write_html(path, include_plotlyjs = 'cdn')
+        else:
+            fig.write_image(path, format = fmt)
+    return base_path
+
+
+## exports every spec to figs_dir as Fig_<number>.<format> (see figure_stem)
+## only figures whose hash changed (or whose files are missing) get rebuilt and rendered, pass force = True to redo them all
+## returns the names of the files that were rendered, skipped as unchanged, and that failed to render
+def export_figures(specs, figs_dir = FIGS_DIR, formats = ('png',), max_workers = None, force = False):
+    manifest_path = os.path.join(figs_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            ## (manifests from before figures were keyed by name have no file in their entries, those figures just get rendered again)
+            manifest = {name: entry for name, entry in json.load(f).items() if 'file' in entry}
+
+    os.makedirs(figs_dir, exist_ok = True)
+    code_hash = _charts_hash()
+    jobs, skipped = {}, []
+    for spec in specs:
+        stem = figure_stem(spec)
+        digest = spec_hash(spec, code_hash)
+        entry = manifest.get(spec.name, {})
+        files_exist = all(os.path.exists(os.path.join(figs_dir, f'{stem}.{fmt}')) for fmt in formats)
+        if not force and entry.get('hash') == digest and entry.get('file') == stem and set(formats) <= set(entry.get('formats', [])) and files_exist:
+            skipped.append(stem)
+            continue
+
+        ## a figure that gets re-rendered drops its old entry until it succeeds, so a failure is retried next time
+        manifest.pop(spec.name, None)
+        jobs[stem] = (spec.name, digest, spec.build().to_json())
+
+    rendered, failed = [], []
+    if jobs:
+        args = [(figure_json, os.path.join(figs_dir, stem), formats) for stem, (name, digest, figure_json) in jobs.items()]
+        if max_workers == 1 or len(jobs) == 1:
+            results = [_try(_render_figure, *job) for job in args]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers = max_workers) as pool:
+                futures = [pool.submit(_render_figure, *job) for job in args]
+                results = [_try(future.result) for future in futures]
+
+        for (stem, (name, digest, _)), error in zip(jobs.items(), results):
+            if error is None:
+                manifest[name] = {'file': stem, 'hash': digest, 'formats': sorted(formats)}
+                rendered.append(stem)
+            else:
+                print(f'{stem} ({name}) could not be rendered: {error}')
+                failed.append(stem)
+
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent = 2, sort_keys = True)
+    os.replace(tmp_path, manifest_path)
+
+    return {'rendered': rendered, 'skipped': skipped, 'failed': failed}
+
+
+## runs func, returning the error it raised (or None)
+def _try(func, *args):
+    try:
+        func(*args)
+    except Exception as error:
+        return error
+    return None
+
+
+def main(argv = None):
+    from vaccinations.pipeline import run
+
+    parser = argparse.ArgumentParser(description = 'export every figure to Figs/, re-rendering only the ones whose data changed')
+    parser.add_argument('--figs-dir', default = FIGS_DIR)
+    parser.add_argument('--formats', nargs = '+', default = ['png'], choices = ['png', 'svg', 'html', 'jpeg', 'webp', 'pdf'])
+    parser.add_argument('--workers', type = int, default = None, help = 'processes to render with (defaults to one per core)')
+    parser.add_argument('--force', action = 'store_true', help = 're-render every figure, even the unchanged ones')
+    parser.add_argument('--no-cache', action = 'store_true', help = 'rebuild the frames from the csvs instead of using the on-disk cache')
+    parser.add_argument('--max-points', type = int, default = None, help = 'downsample each line to at most this many points (LTTB)')
+    parser.add_argument('--webgl-threshold', type = int, default = None, help = 'draw line charts with more points than this with WebGL')
+    parser.add_argument('--shared-x', action = 'store_true', help = 'send daily x values as a shared start and step instead of per-trace arrays')
+    args = parser.parse_args(argv)
+
+    line_options = downsample.LineOptions(args.max_points, args.webgl_threshold, args.shared_x)
+    frames = run(headless = True, use_cache = not args.no_cache)
+    result = export_figures(figure_specs(frames, line_options = line_options), args.figs_dir, tuple(args.formats), max_workers = args.workers, force = args.force)
+    print(f'{len(result["rendered"])} figures rendered, {len(result["skipped"])} unchanged, {len(result["failed"])} failed')
+    return result
+
+
+if __name__ == '__main__':
+    main()
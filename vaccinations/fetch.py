@@ -0,0 +1,223 @@
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+from vaccinations.cache import _signature
+from vaccinations.loading import SOURCE_PATHS
+
+
+## country_vaccinations.csv gets re-uploaded every day, so rather than someone dropping the new file in place by hand
+## this downloads the three source files from wherever they are published (base_url + each file's name) into SOURCE_PATHS:
+##   - the connections are pooled and kept alive, so the files (and every later refresh in the same process) share them
+##   - requests are conditional on the ETag / Last-Modified the server gave last time, so an unchanged file is a 304 with no body
+##   - bodies are streamed to a .part file next to the source and only moved into place once complete (and only if the content actually
+##     changed, a server without validators that sends the same bytes again leaves the file alone), so a half-written source is never read
+##   - a download that gets cut off keeps its .part file and picks up where it left off next time with a range request (If-Range guarded,
+##     so a file that changed in the meantime is downloaded again from the start)
+## a file that wasn't replaced keeps its size and modified time, so cache.load_frames still counts it as a hit without hashing or parsing it
+## what the server said about each file is kept in FETCH_STATE_PATH
+## (stand_in.py is a local server with the same conditional / range behaviour, to try all of this against)
+##
+## from the command line:
+##   python -m vaccinations.fetch --base-url http://127.0.0.1:8060/
+##   python -m vaccinations.pipeline --headless --fetch http://127.0.0.1:8060/ --skip-unchanged
+FETCH_STATE_PATH = os.path.join('.fetch', 'state.json')
+
+CHUNK_SIZE = 1 << 16
+
+
+## where each source is downloaded from, by its file name under base_url
+def source_urls(base_url, paths = SOURCE_PATHS):
+    return {name: urllib.parse.urljoin(base_url, os.path.basename(path)) for name, path in paths.items()}
+
+
+## keep-alive http(s) connections, shared between threads and reused for every request to the same host
+## a connection the server has closed since it was last used is replaced once, transparently
+class ConnectionPool:
+    def __init__(self, timeout = 30):
+        self.timeout = timeout
+        self.opened = 0
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url):
+        parts = urllib.parse.urlsplit(url)
+        return parts.scheme, parts.hostname, parts.port
+
+    def _connect(self, key):
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        with self._lock:
+            self.opened += 1
+        return connection_class(host, port, timeout = self.timeout)
+
+    ## sends the request, returning the connection and its response (hand them back with release once the body has been read)
+    def request(self, method, url, headers = None):
+        key = self._key(url)
+        parts = urllib.parse.urlsplit(url)
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+        while True:
+            with self._lock:
+                connection = self._idle[key].pop() if self._idle[key] else None
+            reused = connection is not None
+            connection = connection or self._connect(key)
+            try:
+                connection.request(method, target, headers = headers or {})
+                return connection, connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if not reused:
+                    raise
+
+    def release(self, url, connection, response):
+        if response.will_close or not response.isclosed():
+            connection.close()
+            return
+        with self._lock:
+            self._idle[self._key(url)].append(connection)
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+
+def _hash_file(path, sha):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha
+
+
+## one source file, returning its new state entry and what happened: 'changed', 'unchanged' or 'incomplete'
+## entry is what the server said last time ({} the first time), only trusted while the local file is still the one it describes
+def fetch_file(pool, url, path, entry, chunk_size = CHUNK_SIZE):
+    part_path = path + '.part'
+    headers = {}
+    if os.path.exists(path) and entry.get('signature') == _signature(path):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    ## a download that got cut off asks for the rest of the same version instead (the newer one it was fetching)
+    partial = entry.get('partial')
+    if partial and os.path.exists(part_path) and os.path.getsize(part_path) == partial['bytes']:
+        headers = {'Range': f'bytes={partial["bytes"]}-', 'If-Range': partial['validator']}
+
+    connection, response = pool.request('GET', url, headers)
+    try:
+        if response.status == 304:
+            response.read()
+            return {**entry, 'url': url, 'checked_at': time.time()}, 'unchanged', 0
+        if response.status not in (200, 206):
+            response.read()
+            raise OSError(f'{url} answered {response.status} {response.reason}')
+
+        validators = {'etag': response.getheader('ETag'), 'last_modified': response.getheader('Last-Modified')}
+        ## a 200 to a range request means the file changed since the partial download, so it starts over
+        appending = response.status == 206
+        sha = _hash_file(part_path, hashlib.sha1()) if appending else hashlib.sha1()
+        received = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        expected = response.getheader('Content-Length')
+        with open(part_path, 'ab' if appending else 'wb') as f:
+            try:
+                for chunk in iter(lambda: response.read(chunk_size), b''):
+                    f.write(chunk)
+                    sha.update(chunk)
+                    received += len(chunk)
+                ## read(n) just stops when the connection drops, so a short body is only caught against the length the server promised
+                if expected is not None and received < int(expected):
+                    raise http.client.IncompleteRead(b'', int(expected) - received)
+            except (http.client.IncompleteRead, ConnectionError, TimeoutError) as error:
+                print(f'download of {url} was cut off after {received} bytes ({error!r}), it will resume from there next time')
+                f.flush()
+                validator = validators['etag'] or validators['last_modified']
+                partial = {'validator': validator, 'bytes': os.path.getsize(part_path)} if validator else None
+                return {**entry, 'url': url, 'partial': partial}, 'incomplete', received
+    finally:
+        pool.release(url, connection, response)
+
+    new_entry = {'url': url, **validators, 'sha1': sha.hexdigest(), 'checked_at': time.time()}
+    if entry.get('sha1') == new_entry['sha1'] and os.path.exists(path) and entry.get('signature') == _signature(path):
+        os.remove(part_path)
+        return {**new_entry, 'signature': entry['signature']}, 'unchanged', received
+
+    os.replace(part_path, path)
+    return {**new_entry, 'signature': _signature(path)}, 'changed', received
+
+
+def load_state(state_path = FETCH_STATE_PATH):
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path) as f:
+        return json.load(f)
+
+
+def save_state(state, state_path = FETCH_STATE_PATH):
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok = True)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent = 2)
+    os.replace(tmp_path, state_path)
+
+
+## fetches every source at once (one thread, and pooled connection, per file)
+## returns {name: {'status': 'changed' / 'unchanged' / 'incomplete' / 'failed', 'bytes': body bytes received}}
+## a file that failed or got cut off keeps its previous version in place, so the pipeline can still run on yesterday's data
+## (the state of the sources that did come down is saved whatever happened to the others)
+def fetch_sources(urls, paths = SOURCE_PATHS, state_path = FETCH_STATE_PATH, pool = None, chunk_size = CHUNK_SIZE):
+    state = load_state(state_path)
+    own_pool = pool is None
+    pool = pool or ConnectionPool()
+    results = {}
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers = len(urls)) as executor:
+            futures = {name: executor.submit(fetch_file, pool, url, paths[name], state.get(name, {}), chunk_size) for name, url in urls.items()}
+            for name, future in futures.items():
+                try:
+                    state[name], status, received = future.result()
+                    results[name] = {'status': status, 'bytes': received}
+                ## (a response the server broke off before the body, e.g. a bad status line, is an HTTPException rather than an OSError)
+                except (OSError, http.client.HTTPException) as error:
+                    print(f'could not fetch {name} from {urls[name]}: {error!r}')
+                    results[name] = {'status': 'failed', 'bytes': 0}
+    finally:
+        if own_pool:
+            pool.close()
+        save_state(state, state_path)
+    return results
+
+
+## whether any source came down with new content
+def any_changed(results):
+    return any(result['status'] == 'changed' for result in results.values())
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'download the source csvs, skipping any that have not changed since last time')
+    parser.add_argument('--base-url', required = True, help = 'where the three files are published, e.g. http://127.0.0.1:8060/')
+    parser.add_argument('--state', default = FETCH_STATE_PATH)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = fetch_sources(source_urls(args.base_url), state_path = args.state)
+    for name, result in results.items():
+        print(f'{name}: {result["status"]} ({result["bytes"]} bytes downloaded)')
+    print(f'{time.perf_counter() - start:.3f}s')
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+
+
+## the model we fit to each country's people vaccinated per hundred over its vaccination day number
+## note - this simplistic, prone-to-overfitting, parabola-based curve has flaws (see the notes in the analysis script)
+def curve_func(x, a, b, c):
+    return a * x + b * x**2 + c
+
+
+## the columns the fitted parameters come back in, in the same order curve_fit returns popt
+PARAM_COLS = ['a', 'b', 'c']
+
+
+## since curve_func is linear in its parameters, least squares has a closed form, so there is no need to run an optimizer per country
+## here every country is solved at once: the sums that make up each country's 3x3 normal equations are accumulated with np.bincount
+## and the stacked systems are solved with a single batched np.linalg.solve
+## x is scaled per country before building the sums to keep the normal equations well conditioned, and scaled back afterwards
+## returns one row of popt (a, b, c) per country with at least min_rows rows, in order of first appearance
+def fit_quadratic_batch(df, x_col = 'vaccination_day_number', y_col = 'people_vaccinated_per_hundred', group_col = 'country', min_rows = 5):
+    codes, groups = pd.factorize(df[group_col])
+    n_groups = len(groups)
+    x = df[x_col].to_numpy(dtype = float)
+    y = df[y_col].to_numpy(dtype = float)
+
+    n_rows = np.bincount(codes, minlength = n_groups)
+    scale = np.ones(n_groups)
+    np.maximum.at(scale, codes, np.abs(x))
+    t = x / scale[codes]
+
+    ## power sums of t (0 to 4) and the cross terms with y, for every country at once
+    t_pow = [np.bincount(codes, weights = t**k, minlength = n_groups) for k in range(5)]
+    ty_pow = [np.bincount(codes, weights = y * t**k, minlength = n_groups) for k in range(3)]
+
+    params = _solve_normal_equations(t_pow, ty_pow, n_rows >= min_rows, scale)
+    keep = n_rows >= min_rows
+    return pd.DataFrame(params[keep], index = pd.Index(groups[keep], name = group_col), columns = PARAM_COLS)
+
+
+## the solution of the normal equations built from the power sums of t (0 to 4) and the cross terms with y (0 to 2), for the countries in keep
+## (NaN for the rest), with a and b scaled back from t to x
+def _solve_normal_equations(t_pow, ty_pow, keep, scale):
+    ## the basis is [t, t^2, 1] so that the solution lines up with (a, b, c)
+    lhs = np.stack([
+        np.stack([t_pow[2], t_pow[3], t_pow[1]], axis = -1),
+        np.stack([t_pow[3], t_pow[4], t_pow[2]], axis = -1),
+        np.stack([t_pow[1], t_pow[2], t_pow[0]], axis = -1)
+    ], axis = 1)
+    rhs = np.stack([ty_pow[1], ty_pow[2], ty_pow[0]], axis = -1)
+
+    params = np.full((len(scale), 3), np.nan)
+    if keep.any():
+        params[keep] = _solve_stacked(lhs[keep], rhs[keep])
+
+    params[:, 0] = params[:, 0] / scale
+    params[:, 1] = params[:, 1] / scale**2
+    return params
+
+
+## the same fit from running totals, for the daily refresh (see incremental.py): the power sums are kept unscaled, so that the sums over the new days
+## can just be added to the ones over the history, and the per-country scale (the largest x so far) is only applied when solving
+## QUADRATIC_SUM_COLS are n and the sums of x**k (k = 1 to 4) and y * x**k (k = 0 to 2), plus x_max
+## (x is the day number, a whole number of days, so even the x**4 sums stay exact in float64)
+QUADRATIC_SUM_COLS = ['n', 'x1', 'x2', 'x3', 'x4', 'y', 'xy', 'x2y', 'x_max']
+
+
+## the sums of df's rows, one row per country in order of first appearance
+def quadratic_sums(df, x_col = 'vaccination_day_number', y_col = 'people_vaccinated_per_hundred', group_col = 'country'):
+    codes, groups = pd.factorize(df[group_col])
+    x = df[x_col].to_numpy(dtype = float)
+    y = df[y_col].to_numpy(dtype = float)
+
+    sums = {'n': np.bincount(codes, minlength = len(groups)).astype(float)}
+    for k in range(1, 5):
+        sums[f'x{k}'] = np.bincount(codes, weights = x**k, minlength = len(groups))
+    for k, name in enumerate(['y', 'xy', 'x2y']):
+        sums[name] = np.bincount(codes, weights = y * x**k, minlength = len(groups))
+    x_max = np.zeros(len(groups))
+    np.maximum.at(x_max, codes, np.abs(x))
+    sums['x_max'] = x_max
+
+    return pd.DataFrame(sums, index = pd.Index(np.asarray(groups, dtype = object).astype(str), name = group_col))[QUADRATIC_SUM_COLS]
+
+
+## adds the sums over some new rows onto the running ones (countries seen for the first time are appended, in their order)
+def add_quadratic_sums(sums, new_sums):
+    combined = sums.reindex(sums.index.append(new_sums.index[~new_sums.index.isin(sums.index)])).fillna(0.0)
+    added = new_sums.reindex(combined.index).fillna(0.0)
+    combined[QUADRATIC_SUM_COLS[:-1]] += added[QUADRATIC_SUM_COLS[:-1]]
+    combined['x_max'] = np.maximum(combined['x_max'], added['x_max'])
+    return combined
+
+
+## fit_quadratic_batch from the sums: one row of popt (a, b, c) per country with at least min_rows rows, in the sums' order
+def fit_quadratic_sums(sums, min_rows = 5):
+    scale = np.maximum(sums['x_max'].to_numpy(dtype = float), 1.0)
+    t_pow = [sums['n'].to_numpy(dtype = float)] + [sums[f'x{k}'].to_numpy(dtype = float) / scale**k for k in range(1, 5)]
+    ty_pow = [sums[name].to_numpy(dtype = float) / scale**k for k, name in enumerate(['y', 'xy', 'x2y'])]
+    keep = t_pow[0] >= min_rows
+
+    params = _solve_normal_equations(t_pow, ty_pow, keep, scale)
+    return pd.DataFrame(params[keep], index = sums.index[keep], columns = PARAM_COLS)
+
+
+## solves the stacked normal equations, falling back to a least squares solve for any (near) singular system
+def _solve_stacked(lhs, rhs):
+    solved = np.empty_like(rhs)
+    singular = np.linalg.cond(lhs) > 1 / np.finfo(float).eps
+    if (~singular).any():
+        solved[~singular] = np.linalg.solve(lhs[~singular], rhs[~singular][..., None])[..., 0]
+    for i in np.flatnonzero(singular):
+        solved[i] = np.linalg.lstsq(lhs[i], rhs[i], rcond = None)[0]
+    return solved
+
+
+def _fit_chunk(func, series):
+    from scipy.optimize import curve_fit
+
+    results = {}
+    for name, xdata, ydata in series:
+        try:
+            popt, pcov = curve_fit(func, xdata = xdata, ydata = ydata)
+        except RuntimeError:
+            ## curve_fit gives up when it can't converge, those countries just don't get a prediction
+            continue
+        results[name] = popt
+    return results
+
+
+## for models that aren't linear in their parameters (and really need scipy's curve_fit), the countries are split into chunks
+## and fitted across a process pool instead. func has to be a module level function so it can be sent to the worker processes
+## with max_workers = 1 everything runs in this process, which is handy for debugging
+def fit_curves(df, func = curve_func, x_col = 'vaccination_day_number', y_col = 'people_vaccinated_per_hundred', group_col = 'country', min_rows = 5, max_workers = None, chunk_size = 64):
+    series = [(name, group[x_col].to_numpy(dtype = float), group[y_col].to_numpy(dtype = float))
+              for name, group in df.groupby(group_col, sort = False, observed = True) if len(group) >= min_rows]
+    chunks = [series[i : i + chunk_size] for i in range(0, len(series), chunk_size)]
+
+    results = {}
+    if max_workers == 1:
+        for chunk in chunks:
+            results.update(_fit_chunk(func, chunk))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers = max_workers) as pool:
+            for chunk_results in pool.map(_fit_chunk, [func] * len(chunks), chunks):
+                results.update(chunk_results)
+
+    names = [name for name, _, _ in series if name in results]
+    params = pd.DataFrame([results[name] for name in names], index = pd.Index(names, name = group_col))
+    if params.shape[1] == len(PARAM_COLS):
+        params.columns = PARAM_COLS
+    return params
+
+
+## finds, for every country at once, the day the fitted curve a * x + b * x**2 + c first reaches the target coverage
+## rather than stepping through the days one at a time, this is the smaller non-negative root of b * x**2 + a * x + (c - target) = 0,
+## written as 2 * (target - c) / (a + sqrt(a**2 - 4 * b * (c - target))) so that it also holds for b = 0 and stays stable for small b
+## countries that don't reach the target within horizon days get NaN, along with the day and value of the curve's max within the horizon
+## (the vertex of the parabola when it turns over in time, otherwise one of the ends)
+def solve_completion_days(params, target = 100, horizon = 365):
+    a = params['a'].to_numpy(dtype = float)
+    b = params['b'].to_numpy(dtype = float)
+    c = params['c'].to_numpy(dtype = float)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        disc = a**2 - 4 * b * (c - target)
+        ## (a curve that never reaches the target has no real roots, the square root is only taken where there are some)
+        crossing = np.where(c >= target, 0.0, 2 * (target - c) / (a + np.sqrt(np.where(disc >= 0, disc, 0.0))))
+        ## a curve already at the target reaches it on day 0 whatever its shape, otherwise, as the day loop this replaced stepped
+        ## x = 0, 1, ..., horizon - 1, a crossing counts when the whole day it falls on is inside the horizon
+        reaches = (c >= target) | ((disc >= 0) & (crossing >= 0) & (np.ceil(crossing) < horizon))
+
+        vertex = np.where(b < 0, np.clip(-a / (2 * b), 0, horizon), 0.0)
+    candidates = np.stack([np.zeros_like(a), np.full_like(a, horizon), vertex], axis = -1)
+    values = a[:, None] * candidates + b[:, None] * candidates**2 + c[:, None]
+    best = np.argmax(values, axis = -1)
+    rows = np.arange(len(a))
+
+    return pd.DataFrame({
+        'days_until_target': np.where(reaches, crossing, np.nan),
+        'reaches_target': reaches,
+        'peak_day': candidates[rows, best],
+        'peak_value': values[rows, best]
+    }, index = params.index)
+
+
+## builds the final prediction table: one row per country whose curve reaches the target coverage within the horizon,
+## with days_until_fully_vaccinated, the per-country summary columns, and final_date (the day they started vaccinating plus those days)
+## it's cheap to call this for several targets (e.g. 70 and 100) from the same fitted params
+def completion_results(params, total_vacc_df, target = 100, horizon = 365):
+    solved = solve_completion_days(params, target = target, horizon = horizon)
+    solved = solved[solved['reaches_target']]
+
+    country_results_df = solved[['days_until_target']].rename(columns = {'days_until_target': 'days_until_fully_vaccinated'})
+    country_results_df.index.name = 'country'
+    country_results_df = country_results_df.reset_index().merge(total_vacc_df, on = 'country')
+    country_results_df['final_date'] = country_results_df['day_started'] + pd.to_timedelta(country_results_df['days_until_fully_vaccinated'], unit = 'D')
+
+    return country_results_df
@@ -0,0 +1,387 @@
+import csv
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from vaccinations.cache import _signature
+from vaccinations.enrichment import COLS_TO_FFILL, enrich_progress
+from vaccinations.forecast import add_quadratic_sums, quadratic_sums
+from vaccinations.instrument import timed
+from vaccinations.loading import prepare_vaccinations, read_vaccinations
+from vaccinations.rolling import RollingWindows
+
+
+## the kaggle file only gains one row per country per day, so rebuilding everything from scratch each refresh is wasteful
+## instead we keep a checkpoint of the frames between runs plus a small per-country state table, and only read and enrich what is new:
+##   - when the file was only appended to (its header and the bytes just before the old end are unchanged), only the bytes past the old end get parsed
+##   - when it was rewritten (e.g. kaggle's daily re-upload, with each country's new days at the end of its block), the whole file gets parsed again
+##     (to check the checkpointed rows are still there as they were), but only the rows after each country's last checkpointed date get enriched
+## either way the new rows are slotted in after their country's rows, so the frames come out exactly as a full build has them
+## (same rows, order, index, values and dtypes), and the per-country summary and the quadratic fit's sums are updated from the state alone
+## the checkpoint is a directory: state.pkl (the state, fit sums, rolling windows and where the file ended) plus one pickle per refresh under parts/
+## holding only that refresh's rows, so a refresh only writes what it added, appended or rewritten. the parts hold the rows in the order they came in,
+## and state.pkl has where each of them is in the file now as runs of consecutive rows (see _runs), so a rewrite that moves the checkpointed rows
+## only rewrites that. every COMPACT_PARTS refreshes, or once the rows are split into more than COMPACT_RUNS runs, the parts are folded back into one
+## anything that can't be slotted in (a country's new row dated on or before its last one, checkpointed rows that were revised or removed,
+## or a different continents file) falls back to a full rebuild, as does full_refresh = True
+##
+## from the command line:
+##   python -m vaccinations.pipeline --headless --incremental
+CHECKPOINT_DIR = '.checkpoint'
+
+## bump this whenever the checkpoint's layout changes, so old checkpoints get rebuilt
+CHECKPOINT_VERSION = 3
+
+## how many parts can pile up before they are folded back into one
+COMPACT_PARTS = 30
+
+## how many runs the stored rows can be split into in the file (a rewrite adding a day to every country splits them two more per country)
+## before they are folded back into one
+COMPACT_RUNS = 20000
+
+## how much of the end of the file is hashed, to tell an append from a rewrite
+TAIL_BYTES = 65536
+
+## the percent columns move with every new max, so they are left out of the parts and added back when the frames are put together
+PERCENT_COLS = ['percent_total_vaccinations', 'percent_people_vaccinated']
+
+
+## the per-country state needed to keep enriching new days without looking back at the history (indexed by country, in order of first appearance):
+##   - first_date / last_date: for the vaccination day number and to know which rows are new
+##   - last_<col>: last non-zero value of each progression variable, to carry the forward fill across runs
+##   - max_<col>: running maxima, for the percent columns and the per-country summary
+##   - n_rows: number of days reported so far
+def build_state(adjusted_df, cols_to_ffill = COLS_TO_FFILL):
+    by_country = adjusted_df.groupby('country', sort = False, observed = True)
+
+    state = pd.DataFrame({
+        'first_date': by_country['date'].min(),
+        'last_date': by_country['date'].max(),
+        'n_rows': by_country.size()
+    })
+
+    ## the progression variables are already forward filled, so the last row holds the last non-zero value
+    last_rows = by_country[cols_to_ffill].last()
+    maxima = by_country[cols_to_ffill].max()
+    for col in cols_to_ffill:
+        state[f'last_{col}'] = last_rows[col]
+        state[f'max_{col}'] = maxima[col]
+
+    state.index = pd.Index(state.index.astype(str), name = 'country')
+    return state
+
+
+## enriches only the new rows, seeding the forward fill and day numbers from the checkpointed state
+## returns the enriched new rows (without the percent columns, which depend on the updated maxima) and the updated state
+def enrich_delta(new_df, state, cols_to_ffill = COLS_TO_FFILL):
+    country_codes = pd.factorize(new_df['country'])[0]
+    delta_df = new_df.iloc[np.argsort(country_codes, kind = 'stable')].copy()
+    countries = delta_df['country']
+    ## the state is looked up by plain names (mapping a categorical gives back a categorical on older pandas)
+    names = countries.astype(str)
+
+    filled = delta_df[cols_to_ffill]
+    filled = filled.mask(filled == 0).groupby(countries, sort = False, observed = True).ffill()
+    for col in cols_to_ffill:
+        filled[col] = filled[col].fillna(names.map(state[f'last_{col}']))
+    delta_df[cols_to_ffill] = filled.fillna(0)
+
+    ## countries that show up for the first time start counting days from their own first row
+    first_date = names.map(state['first_date']).astype(delta_df['date'].dtype)
+    first_date = first_date.fillna(delta_df.groupby('country', sort = False, observed = True)['date'].transform('min'))
+    delta_df['vaccination_day_number'] = (delta_df['date'] - first_date).dt.days.clip(lower = 0)
+
+    new_state = build_state(delta_df, cols_to_ffill)
+    previous = state.reindex(new_state.index)
+    new_state['first_date'] = previous['first_date'].fillna(new_state['first_date'])
+    for col in cols_to_ffill:
+        new_state[f'max_{col}'] = pd.concat([previous[f'max_{col}'], new_state[f'max_{col}']], axis = 1).max(axis = 1).astype(new_state[f'max_{col}'].dtype)
+    new_state['n_rows'] = new_state['n_rows'] + previous['n_rows'].fillna(0).astype(int)
+
+    ## updated countries replace their old state where it was, brand new ones are appended
+    order = state.index.append(new_state.index[~new_state.index.isin(state.index)])
+    state = pd.concat([state[~state.index.isin(new_state.index)], new_state[state.columns]]).reindex(order)
+
+    return delta_df, state
+
+
+## the percent columns are progress relative to each country's max as of today, so they move whenever a new max comes in
+## this is a single vectorized division against the state's maxima rather than a rebuild of the enriched dataframe
+def update_percent_columns(adjusted_df, state):
+    countries = adjusted_df['country']
+    adjusted_df['percent_total_vaccinations'] = adjusted_df['total_vaccinations'] / countries.map(state['max_total_vaccinations']).astype(float)
+    adjusted_df['percent_people_vaccinated'] = adjusted_df['people_vaccinated'] / countries.map(state['max_people_vaccinated']).astype(float)
+    return adjusted_df
+
+
+## picks out the rows of the freshly read file that come after each country's checkpointed last date
+def select_new_rows(full_df, state):
+    last_date = full_df['country'].map(state['last_date'])
+    return full_df[last_date.isna() | (full_df['date'] > last_date)]
+
+
+def _tail_sha1(path, end):
+    with open(path, 'rb') as f:
+        f.seek(max(end - TAIL_BYTES, 0))
+        return hashlib.sha1(f.read(end - max(end - TAIL_BYTES, 0))).hexdigest()
+
+
+## what a refresh needs to tell an unchanged file, an appended one and a rewritten one apart
+def source_fingerprint(path):
+    signature = _signature(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(max(signature['size'] - 1, 0))
+        last_byte = f.read(1)
+    return {**signature, 'header': header, 'tail_sha1': _tail_sha1(path, signature['size']), 'ends_with_newline': last_byte == b'\n'}
+
+
+## whether the file now is the checkpointed one with rows added after its old end
+def _appended(fingerprint, checkpointed, path):
+    return fingerprint['size'] > checkpointed['size'] and fingerprint['header'] == checkpointed['header'] \
+        and checkpointed['ends_with_newline'] and _tail_sha1(path, checkpointed['size']) == checkpointed['tail_sha1']
+
+
+## parses only the rows past offset (the old end of the file), labelled with their row numbers in the file
+def read_appended_rows(path, continents, offset, header, first_row):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        df = read_vaccinations(f, header = None, names = next(csv.reader([header.decode()])))
+    new_df = prepare_vaccinations(df, continents)
+    new_df.index = pd.RangeIndex(first_row, first_row + len(new_df))
+    return new_df
+
+
+## stacks frames with the same columns whose categoricals may have different categories (each part only has the ones in its own rows),
+## using the union of them all, sorted as read_vaccinations has them
+def concat_rows(dfs):
+    dfs = list(dfs)
+    for col in dfs[0].columns:
+        if isinstance(dfs[0][col].dtype, pd.CategoricalDtype):
+            categories = dfs[0][col].cat.categories
+            for df in dfs[1:]:
+                categories = categories.union(df[col].cat.categories)
+            dtype = pd.CategoricalDtype(categories.sort_values())
+            dfs = [df.assign(**{col: df[col].astype(dtype)}) for df in dfs]
+    return pd.concat(dfs, axis = 0) if len(dfs) > 1 else dfs[0]
+
+
+## puts adjusted_df back together from its rows: grouped by country in the state's order, each country's rows in file order (by row number),
+## with the percent columns against the state's maxima
+def assemble_adjusted(adjusted_dfs, state):
+    adjusted_df = concat_rows(adjusted_dfs)
+    codes = state.index.get_indexer(adjusted_df['country'].astype(str))
+    ## one (country, row number) key, sorted stably: the parts are each already in that order, so the sort only has to merge them
+    labels = adjusted_df.index.to_numpy()
+    keys = codes.astype('int64') * (labels.max() + 1 if len(labels) else 1) + labels
+    adjusted_df = adjusted_df.iloc[np.argsort(keys, kind = 'stable')]
+    return update_percent_columns(adjusted_df, state)
+
+
+## positions has the row in the file of each stored row (in the order they are stored), runs has it as (file row each run starts at, its length)
+def _runs(positions):
+    if not len(positions):
+        return np.empty(0, dtype = 'int64'), np.empty(0, dtype = 'int64')
+    bounds = np.r_[0, np.flatnonzero(np.diff(positions) != 1) + 1, len(positions)]
+    return positions[bounds[:-1]], np.diff(bounds)
+
+
+def _positions(runs):
+    starts, lengths = runs
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+
+def _part_path(checkpoint_dir, number):
+    return os.path.join(checkpoint_dir, 'parts', f'{number:05d}.pkl')
+
+
+def _write_pickle(obj, path):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    tmp_path = path + '.tmp'
+    pd.to_pickle(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_state(checkpoint_dir):
+    state_path = os.path.join(checkpoint_dir, 'state.pkl')
+    if not os.path.exists(state_path):
+        return None
+    checkpoint = pd.read_pickle(state_path)
+    return checkpoint if checkpoint.get('version') == CHECKPOINT_VERSION else None
+
+
+def load_checkpoint(checkpoint_dir = CHECKPOINT_DIR):
+    checkpoint = _read_state(checkpoint_dir)
+    if checkpoint is None:
+        return None
+    parts = [pd.read_pickle(_part_path(checkpoint_dir, number)) for number in checkpoint['parts']]
+
+    ## the parts are labelled with the row numbers they were stored under, which get put back in file order
+    positions = checkpoint['positions'] = _positions(checkpoint['runs'])
+    stored = np.empty_like(positions)
+    stored[positions] = np.arange(len(positions))
+    checkpoint['full_df'] = concat_rows([part['full_df'] for part in parts]).iloc[stored]
+    checkpoint['full_df'].index = pd.RangeIndex(len(checkpoint['full_df']))
+    for part in parts:
+        part['adjusted_df'].index = positions[part['adjusted_df'].index.to_numpy()]
+    checkpoint['adjusted_rows'] = [part['adjusted_df'] for part in parts]
+    return checkpoint
+
+
+## writes the new rows as a part of their own (or, with compact = True, everything as a single part), then the state pointing at them
+## the new rows are labelled with the numbers they are stored under (the ones after every row already stored), and checkpoint['positions']
+## has where every stored row is in the file
+## the state goes last, so a refresh that dies halfway leaves the previous checkpoint as it was
+def save_checkpoint(checkpoint_dir, checkpoint, full_df, adjusted_df, compact = False):
+    old_parts = list(checkpoint.get('parts', []))
+    number = checkpoint.get('next_part', 0)
+    runs = _runs(checkpoint['positions'])
+    if compact or len(old_parts) + 1 >= COMPACT_PARTS or len(runs[0]) > COMPACT_RUNS:
+        ## everything as it is in the file, so stored and file row numbers are the same again
+        full_df, adjusted_df = checkpoint['full_df'], checkpoint['adjusted_df']
+        parts, compact = [number], True
+        runs = _runs(np.arange(len(full_df)))
+    else:
+        parts = old_parts + [number]
+    checkpoint = {**checkpoint, 'runs': runs}
+    if len(full_df) or compact:
+        _write_pickle({'full_df': full_df, 'adjusted_df': adjusted_df.drop(PERCENT_COLS, axis = 1, errors = 'ignore')}, _part_path(checkpoint_dir, number))
+        checkpoint = {**checkpoint, 'parts': parts, 'next_part': number + 1}
+
+    keep = ['version', 'source', 'continents', 'cols_to_ffill', 'n_file_rows', 'state', 'fit_sums', 'windows', 'runs', 'parts', 'next_part']
+    _write_pickle({name: checkpoint[name] for name in keep}, os.path.join(checkpoint_dir, 'state.pkl'))
+    for old in set(old_parts) - set(checkpoint['parts']):
+        os.remove(_part_path(checkpoint_dir, old))
+
+
+## this is the incremental version of reading the csv and building full_df and adjusted_df
+## on the first run (or with full_refresh = True, or whenever the new rows can't be slotted in) it does the full build and writes the checkpoint
+## after that, it puts the frames back together from the checkpoint when the source file hasn't changed, and otherwise only enriches the new rows
+## returns a dictionary of:
+##   - full_df / adjusted_df: the same frames the full build gives
+##   - state: the per-country state above, from which summary.summarize_state gives total_vacc_df
+##   - fit_sums: the quadratic fit's running sums for every country (see forecast.fit_quadratic_sums)
+##   - windows: a rolling.RollingWindows, whose latest() gives every country's 7 / 14 / 28 day rates as of today
+##   - updated: the countries that received new rows
+## each step is timed as a stage of recorder when one is passed in (see instrument.StageRecorder)
+def refresh(vaccinations_path, continents, checkpoint_dir = CHECKPOINT_DIR, cols_to_ffill = COLS_TO_FFILL, full_refresh = False, recorder = None):
+    fingerprint = source_fingerprint(vaccinations_path)
+    checkpoint = None if full_refresh else timed(recorder, 'load_checkpoint', load_checkpoint, checkpoint_dir)
+    if checkpoint is not None and (not checkpoint['continents'].equals(continents) or checkpoint['cols_to_ffill'] != list(cols_to_ffill)):
+        checkpoint = None
+
+    full_df = None
+    if checkpoint is not None:
+        checkpointed = checkpoint['source']
+        if (fingerprint['size'], fingerprint['mtime_ns']) == (checkpointed['size'], checkpointed['mtime_ns']):
+            checkpoint['adjusted_df'] = timed(recorder, 'assemble_adjusted', assemble_adjusted, checkpoint['adjusted_rows'], checkpoint['state'])
+            return _refreshed(checkpoint, [])
+        if _appended(fingerprint, checkpointed, vaccinations_path):
+            new_df = timed(recorder, 'read_appended_rows', read_appended_rows, vaccinations_path, continents, checkpointed['size'], checkpointed['header'],
+                           checkpoint['n_file_rows'])
+            refreshed = _refresh_appended(checkpoint, new_df, fingerprint, checkpoint_dir, cols_to_ffill, recorder)
+        else:
+            full_df = timed(recorder, 'merge_continents', prepare_vaccinations, timed(recorder, 'read_vaccinations', read_vaccinations, vaccinations_path), continents)
+            refreshed = _refresh_rewritten(checkpoint, full_df, fingerprint, checkpoint_dir, cols_to_ffill, recorder)
+        if refreshed is not None:
+            return refreshed
+
+    if full_df is None:
+        full_df = timed(recorder, 'merge_continents', prepare_vaccinations, timed(recorder, 'read_vaccinations', read_vaccinations, vaccinations_path), continents)
+    adjusted_df = timed(recorder, 'enrich_progress', enrich_progress, full_df, cols_to_ffill)
+    previous = _read_state(checkpoint_dir) or {'parts': [], 'next_part': 0}
+    checkpoint = {
+        'version': CHECKPOINT_VERSION, 'source': fingerprint, 'continents': continents, 'cols_to_ffill': list(cols_to_ffill), 'n_file_rows': len(full_df),
+        'state': timed(recorder, 'build_state', build_state, adjusted_df, cols_to_ffill),
+        'fit_sums': timed(recorder, 'quadratic_sums', quadratic_sums, adjusted_df),
+        'windows': timed(recorder, 'rolling_windows', RollingWindows.from_frame, adjusted_df),
+        'full_df': full_df, 'adjusted_df': adjusted_df, 'positions': np.arange(len(full_df)),
+        ## the parts of whatever checkpoint was there before get replaced (and removed)
+        **{name: previous[name] for name in ['parts', 'next_part']}
+    }
+    timed(recorder, 'save_checkpoint', save_checkpoint, checkpoint_dir, checkpoint, full_df, adjusted_df, compact = True)
+    return _refreshed(checkpoint, checkpoint['state'].index.tolist())
+
+
+## the rows past the old end of the file: they go after everything already in the checkpoint, so they only need to be dated after their country's last day
+## (they are stored under their row numbers in the file, which come after every stored row's)
+def _refresh_appended(checkpoint, new_df, fingerprint, checkpoint_dir, cols_to_ffill, recorder):
+    state = checkpoint['state']
+    last_date = new_df['country'].astype(str).map(state['last_date'])
+    if (new_df['date'] <= last_date).any():
+        return None
+
+    delta_df, state = timed(recorder, 'enrich_delta', enrich_delta, new_df, state, cols_to_ffill)
+    timed(recorder, 'update_rolling_windows', checkpoint['windows'].update, delta_df)
+    checkpoint = {
+        **checkpoint, 'source': fingerprint, 'n_file_rows': checkpoint['n_file_rows'] + len(new_df), 'state': state,
+        'positions': np.r_[checkpoint['positions'], new_df.index.to_numpy()],
+        'fit_sums': timed(recorder, 'add_quadratic_sums', add_quadratic_sums, checkpoint['fit_sums'], quadratic_sums(delta_df)),
+        'full_df': concat_rows([checkpoint['full_df'], new_df]),
+        'adjusted_df': timed(recorder, 'assemble_adjusted', assemble_adjusted, checkpoint['adjusted_rows'] + [delta_df], state)
+    }
+    checkpoint['full_df'].index = pd.RangeIndex(len(checkpoint['full_df']))
+    timed(recorder, 'save_checkpoint', save_checkpoint, checkpoint_dir, checkpoint, new_df, delta_df)
+    return _refreshed(checkpoint, delta_df['country'].astype(str).unique().tolist())
+
+
+## the whole file was parsed again: the rows up to each country's last checkpointed date have to be the checkpointed rows, in the same order,
+## and each country's new rows have to come after them in the file. the checkpointed rows keep their enrichment, relabelled with their new row numbers,
+## and only the new rows get written, as a part of their own (with the moved rows' new row numbers in positions)
+def _refresh_rewritten(checkpoint, full_df, fingerprint, checkpoint_dir, cols_to_ffill, recorder):
+    state = checkpoint['state']
+    countries = full_df['country'].astype(str)
+    last_date = countries.map(state['last_date'])
+    is_new = (last_date.isna() | (full_df['date'] > last_date)).to_numpy()
+    if not timed(recorder, 'compare_rows', _same_rows, full_df[~is_new], checkpoint['full_df']):
+        return None
+    positions = np.arange(len(full_df))
+    last_old = pd.Series(positions[~is_new]).groupby(countries[~is_new].to_numpy()).max()
+    if (positions[is_new] < countries[is_new].map(last_old).fillna(-1).to_numpy()).any():
+        return None
+
+    ## the new row number of each checkpointed row, by its old one
+    moved_to = positions[~is_new]
+    for rows in checkpoint['adjusted_rows']:
+        rows.index = moved_to[rows.index.to_numpy()]
+    new_df = full_df[is_new]
+    delta_df, state = timed(recorder, 'enrich_delta', enrich_delta, new_df, state, cols_to_ffill)
+
+    ## countries in order of first appearance in the new file
+    state = state.reindex(pd.unique(countries.to_numpy()))
+    timed(recorder, 'update_rolling_windows', checkpoint['windows'].update, delta_df)
+    ## a country that shows up between others moves the ones after it
+    checkpoint['windows'].reorder(state.index)
+    checkpoint = {
+        **checkpoint, 'source': fingerprint, 'n_file_rows': len(full_df), 'state': state,
+        'positions': np.r_[moved_to[checkpoint['positions']], positions[is_new]],
+        'fit_sums': timed(recorder, 'add_quadratic_sums', add_quadratic_sums, checkpoint['fit_sums'], quadratic_sums(delta_df)).reindex(state.index),
+        'full_df': full_df,
+        'adjusted_df': timed(recorder, 'assemble_adjusted', assemble_adjusted, checkpoint['adjusted_rows'] + [delta_df], state)
+    }
+
+    ## the new rows are stored after the checkpointed ones, in file order
+    n_stored = len(moved_to)
+    stored_df = new_df.set_axis(pd.RangeIndex(n_stored, n_stored + len(new_df)), axis = 0)
+    stored_delta = delta_df.set_axis(n_stored + np.searchsorted(positions[is_new], delta_df.index.to_numpy()), axis = 0)
+    timed(recorder, 'save_checkpoint', save_checkpoint, checkpoint_dir, checkpoint, stored_df, stored_delta)
+    return _refreshed(checkpoint, delta_df['country'].astype(str).unique().tolist())
+
+
+## whether the rows read again are the checkpointed ones, value for value
+def _same_rows(df, checkpointed_df):
+    if len(df) != len(checkpointed_df) or list(df.columns) != list(checkpointed_df.columns):
+        return False
+    for col in df.columns:
+        a, b = df[col].reset_index(drop = True), checkpointed_df[col].reset_index(drop = True)
+        if isinstance(a.dtype, pd.CategoricalDtype) or isinstance(b.dtype, pd.CategoricalDtype):
+            a, b = a.astype(object), b.astype(object)
+        if not a.equals(b):
+            return False
+    return True
+
+
+def _refreshed(checkpoint, updated):
+    return {**{name: checkpoint[name] for name in ['full_df', 'adjusted_df', 'state', 'fit_sums', 'windows']}, 'updated': updated}
@@ -0,0 +1,167 @@
+import contextlib
+import datetime
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+## per-stage counters for the pipeline, so a slow daily run can be pinned on the csv parse, the enrichment, the curve fits or the figures
+## by default each stage only records what is basically free to read: wall time, cpu time, the process' peak memory (max rss)
+## and the number of rows it produced, so a recorder can be left on for every run
+## two heavier samplers can be switched on when digging into a slow run:
+##   - profile = True runs cProfile over every stage, dump_profile writes it out as a pstats file
+##     (snakeviz, flameprof or gprof2dot turn that into a flame graph / call graph)
+##   - trace_memory = True runs tracemalloc, giving the exact peak python + numpy allocations within each stage
+##
+## e.g.
+##   recorder = StageRecorder()
+##   full_df = recorder.run('load', read_vaccinations, path)
+##   with recorder.stage('figures'):
+##       ...
+##   recorder.write_report('reports/run.json')
+class StageRecorder:
+    def __init__(self, profile = False, trace_memory = False):
+        self.stages = []
+        self.started = datetime.datetime.now().isoformat(timespec = 'seconds')
+        self.profiler = None
+        if profile:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+        self.trace_memory = trace_memory
+        self._started_tracing = False
+        self._depth = 0
+        self._traced_peaks = []
+
+    ## times everything inside the with block as one stage, yielding its record so the caller can add to it (e.g. rows)
+    ## stages can be nested (a cache miss building the frames inside a load stage), the profiler only gets switched on by the outermost one
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = {'stage': name, 'depth': self._depth, 'rows': None}
+        self.stages.append(record)
+        rss_before = _max_rss_mb()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._carry_traced_peak()
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+            self._traced_peaks.append(traced_before)
+        if self.profiler is not None and self._depth == 0:
+            self.profiler.enable()
+
+        self._depth += 1
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall
+            record['cpu_seconds'] = time.process_time() - cpu
+            self._depth -= 1
+
+            if self.profiler is not None and self._depth == 0:
+                self.profiler.disable()
+            if self.trace_memory:
+                self._carry_traced_peak()
+                peak = self._traced_peaks.pop()
+                record['traced_peak_mb'] = (peak - traced_before) / 1024**2
+                if self._traced_peaks:
+                    self._traced_peaks[-1] = max(self._traced_peaks[-1], peak)
+            record['max_rss_mb'] = _max_rss_mb()
+            record['max_rss_growth_mb'] = None if rss_before is None else record['max_rss_mb'] - rss_before
+
+    ## tracemalloc only keeps one peak, so before a nested stage resets it (and when a stage finishes) the peak so far
+    ## is carried into the innermost open stage's running peak
+    def _carry_traced_peak(self):
+        if self._traced_peaks:
+            self._traced_peaks[-1] = max(self._traced_peaks[-1], tracemalloc.get_traced_memory()[1])
+
+    ## runs func(*args, **kwargs) as one stage, recording how many rows it returned
+    def run(self, name, func, /, *args, **kwargs):
+        with self.stage(name) as record:
+            output = func(*args, **kwargs)
+            record['rows'] = count_rows(output)
+        return output
+
+    ## stops tracemalloc if this recorder was the one to start it
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def report(self):
+        return {
+            'started': self.started,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'profiled': self.profiler is not None,
+            'traced_memory': self.trace_memory,
+            'total_wall_seconds': sum(stage['wall_seconds'] for stage in self.stages if stage['depth'] == 0),
+            'total_cpu_seconds': sum(stage['cpu_seconds'] for stage in self.stages if stage['depth'] == 0),
+            'stages': self.stages
+        }
+
+    def write_report(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent = 2)
+
+    ## writes the cProfile stats of every stage so far (a pstats file), does nothing if profiling is off
+    def dump_profile(self, path):
+        if self.profiler is None:
+            print('profiling is off, pass profile = True to the recorder to get a profile dump')
+            return
+        os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+        self.profiler.dump_stats(path)
+
+    ## one line per stage, indented by how nested it is
+    def summary(self):
+        lines = []
+        for stage in self.stages:
+            rows = stage['rows']
+            if isinstance(rows, dict):
+                rows = ', '.join(f'{name} {n}' for name, n in rows.items())
+            lines.append(f'{"  " * stage["depth"]}{stage["stage"]}: {stage["wall_seconds"]:.3f}s wall, {stage["cpu_seconds"]:.3f}s cpu'
+                         + (f', max rss {stage["max_rss_mb"]:.0f} MB' if stage['max_rss_mb'] is not None else '')
+                         + (f', traced peak {stage["traced_peak_mb"]:.1f} MB' if 'traced_peak_mb' in stage else '')
+                         + (f', rows: {rows}' if rows is not None else ''))
+        return '\n'.join(lines)
+
+
+## runs func as a stage of recorder, or just runs it when there is no recorder
+def timed(recorder, name, func, /, *args, **kwargs):
+    if recorder is None:
+        return func(*args, **kwargs)
+    return recorder.run(name, func, *args, **kwargs)
+
+
+## the number of rows in a stage's output: a dataframe / series gives its length, a dict or tuple of them gives the length of each one
+def count_rows(output):
+    if isinstance(output, (pd.DataFrame, pd.Series)):
+        return len(output)
+    if isinstance(output, dict):
+        rows = {name: len(frame) for name, frame in output.items() if isinstance(frame, (pd.DataFrame, pd.Series))}
+        return rows or None
+    if isinstance(output, tuple):
+        rows = {str(i): len(frame) for i, frame in enumerate(output) if isinstance(frame, (pd.DataFrame, pd.Series))}
+        return rows or None
+    return None
+
+
+## the most memory the process has held at once so far, in MB (None where the resource module isn't available, i.e. windows)
+def _max_rss_mb():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## linux reports kilobytes, macos bytes
+    return max_rss / (1024**2 if platform.system() == 'Darwin' else 1024)
@@ -0,0 +1,117 @@
+import pandas as pd
+
+
+## the three source files the analysis is built from
+## country_vaccinations.csv gets re-uploaded to kaggle each day, the other two are static mapping files
+SOURCE_PATHS = {
+    'vaccinations': 'country_vaccinations.csv',
+    'continents': 'country_continents.csv',
+    'population': 'population_by_country_2020.csv'
+}
+
+
+## columns in the raw kaggle file that we don't use anywhere in the analysis
+SOURCE_COLS = ['source_name', 'source_website']
+
+## the types each column of country_vaccinations.csv is read in as, applied straight away by read_csv
+## the repeated strings are categoricals, the counts are nullable integers (they are whole numbers with gaps)
+## and the per-hundred / per-million rates are float32. date is parsed into a datetime64 column
+VACCINATION_DTYPES = {
+    'country': 'category',
+    'iso_code': 'category',
+    'vaccines': 'category',
+    'total_vaccinations': 'Int64',
+    'people_vaccinated': 'Int64',
+    'people_fully_vaccinated': 'Int64',
+    'daily_vaccinations_raw': 'Int64',
+    'daily_vaccinations': 'Int64',
+    'total_vaccinations_per_hundred': 'float32',
+    'people_vaccinated_per_hundred': 'float32',
+    'people_fully_vaccinated_per_hundred': 'float32',
+    'daily_vaccinations_per_million': 'float32'
+}
+
+
+## the csv writes the counts as floats (e.g. 64.0), which read_csv is much quicker at parsing as float64 than straight into Int64
+COUNT_COLS = [col for col, dtype in VACCINATION_DTYPES.items() if dtype == 'Int64']
+PARSE_DTYPES = {col: ('float64' if dtype == 'Int64' else dtype) for col, dtype in VACCINATION_DTYPES.items()}
+
+
+## reads the daily vaccinations file with the compact schema, skipping the source columns entirely
+## categories can fix the categories of the categorical columns up front (e.g. {'country': [...]}), so separately read pieces of the file
+## share one categorical type. with a chunksize this returns an iterator of typed chunks, like pd.read_csv does
+def read_vaccinations(path, categories = None, **kwargs):
+    dtypes = dict(PARSE_DTYPES)
+    for col, values in (categories or {}).items():
+        dtypes[col] = pd.CategoricalDtype(values)
+
+    df = pd.read_csv(path, usecols = ['date'] + list(VACCINATION_DTYPES), dtype = dtypes, parse_dates = ['date'], **kwargs)
+    if kwargs.get('chunksize') is not None or kwargs.get('iterator'):
+        return _typed_chunks(df, categories)
+    return sort_categories(apply_count_dtypes(df), categories)
+
+
+def _typed_chunks(reader, categories = None):
+    with reader:
+        for chunk in reader:
+            yield sort_categories(apply_count_dtypes(chunk), categories)
+
+
+def apply_count_dtypes(df):
+    df[COUNT_COLS] = df[COUNT_COLS].astype('Int64')
+    return df
+
+
+## read_csv puts the categories of a big file together from the pieces it parses it in, so they only come out sorted for small files
+## sorting them keeps the categorical types the same however the file was read (skipping any columns whose categories were fixed up front)
+def sort_categories(df, fixed = None):
+    for col, dtype in VACCINATION_DTYPES.items():
+        if dtype == 'category' and col not in (fixed or {}) and not df[col].cat.categories.is_monotonic_increasing:
+            df[col] = df[col].cat.reorder_categories(df[col].cat.categories.sort_values())
+    return df
+
+
+## here we are merging vaccination data with the continent data
+## some issues with numpy NaN values will cause issues with our initial charts, so missing numbers become 0
+## (the progression variables get forward filled over those zeros later on)
+## making date a datetime variable instead of string will help with charting and time manipulation later
+def prepare_vaccinations(df, continents):
+    full_df = df.drop(SOURCE_COLS, axis = 1, errors = 'ignore') \
+        .merge(right = continents, how = 'left', left_on = 'country', right_on = 'Country') \
+        .drop('Country', axis = 1)
+
+    ## the merge turns a categorical country back into plain strings
+    if isinstance(df['country'].dtype, pd.CategoricalDtype):
+        full_df['country'] = full_df['country'].astype(df['country'].dtype)
+        full_df['Continent'] = full_df['Continent'].astype('category')
+
+    numeric_cols = full_df.select_dtypes('number').columns
+    full_df[numeric_cols] = full_df[numeric_cols].fillna(0)
+    full_df['date'] = pd.to_datetime(full_df['date'])
+
+    return full_df
+
+
+## memory used by each dataframe (including the strings themselves), in MB
+def memory_usage_mb(frames):
+    return {name: frame.memory_usage(deep = True).sum() / 1024**2 for name, frame in frames.items()}
+
+
+## prints the memory used by each dataframe, e.g. report_memory(frames, 'after loading')
+def report_memory(frames, label = ''):
+    for name, mb in memory_usage_mb(frames).items():
+        print(f'{label + ": " if label else ""}{name} uses {mb:.2f} MB')
+
+
+## reads the vaccinations file both the plain way and with the compact schema, and reports the memory each takes
+def compare_schema_memory(path = 'country_vaccinations.csv'):
+    frames = {'untyped': pd.read_csv(path), 'typed': read_vaccinations(path)}
+    report_memory(frames, 'country_vaccinations.csv')
+    return memory_usage_mb(frames)
+
+
+## the population file has lots of extra columns, we only need the population for each country
+def read_population(path):
+    return pd.read_csv(path)[['Country (or dependency)', 'Population (2020)']] \
+        .rename(columns = {'Country (or dependency)': 'Country', 'Population (2020)': 'Population'})
+
@@ -0,0 +1,244 @@
+import argparse
+import functools
+import json
+import os
+import time
+
+import pandas as pd
+
+from vaccinations.enrichment import COLS_TO_FFILL, enrich_progress
+from vaccinations.ensemble import FORECAST_CACHE_PATH, ensemble_results, fit_ensemble
+from vaccinations.forecast import completion_results, fit_quadratic_batch, fit_quadratic_sums
+from vaccinations.incremental import CHECKPOINT_DIR, refresh
+from vaccinations.instrument import StageRecorder, timed
+from vaccinations.loading import SOURCE_PATHS, prepare_vaccinations, read_population, read_vaccinations
+from vaccinations.rolling import WINDOWS, latest_metrics
+from vaccinations.summary import add_daily_rates, summarize_countries, summarize_state
+from vaccinations.validation import QUARANTINE_PATH, describe, summary_path, validate
+
+
+## the analysis as a set of stages that can be called on their own, without running (or importing) any of the charts
+## each stage takes and returns a dictionary of named dataframes, so they can be chained: load -> enrich -> summarize -> predict -> render
+## plotly and scipy are never imported unless the render stage (or a non-linear curve fit) actually needs them
+##
+## from the command line:
+##   python -m vaccinations.pipeline --headless --output-dir results     (data only, writes the summary and predictions as csv)
+##   python -m vaccinations.pipeline --figures-dir figures                (also builds every figure and writes each one as html)
+##   python -m vaccinations.pipeline --headless --report reports/run.json --profile reports/run.prof
+##   python -m vaccinations.pipeline --headless --forecaster best --workers 4     (forecast with the model ensemble instead of the quadratic)
+##   python -m vaccinations.pipeline --headless --no-cache --backend polars      (build the frames on polars instead of pandas)
+##   python -m vaccinations.pipeline --headless --fetch http://127.0.0.1:8060/ --skip-unchanged   (download the sources first, see fetch.py)
+##   python -m vaccinations.pipeline --headless --no-cache --quarantine     (check the raw rows, writing the bad ones to .quarantine/, see validation.py)
+##   python -m vaccinations.pipeline --headless --incremental     (only read and enrich the new days, keeping a checkpoint in .checkpoint/, see incremental.py)
+##
+## every stage (and the steps within it) is timed by a StageRecorder (see instrument.py) when one is passed in as recorder,
+## the command line always records one and prints the per-stage timings at the end
+
+
+## reads the three source files and merges the continents onto the daily vaccination data
+## with a quarantine_path, the raw rows are checked first (see validation.py) and the ones that fail are written there,
+## they still go on into full_df as before
+## with a checkpoint_dir, the vaccinations file is refreshed incrementally instead (see incremental.py), which also gives adjusted_df and total_vacc_df
+## (so enrich and summarize have nothing left to do), plus the quadratic fit's running sums (fit_sums) and the rolling windows (rolling_windows)
+## that predict picks up rather than going over the whole history again
+def load(paths = SOURCE_PATHS, recorder = None, quarantine_path = None, checkpoint_dir = None, cols_to_ffill = COLS_TO_FFILL):
+    continents = timed(recorder, 'read_continents', pd.read_csv, paths['continents'])
+    if checkpoint_dir is not None:
+        pop_dict = timed(recorder, 'read_population', read_population, paths['population'])
+        refreshed = timed(recorder, 'refresh', refresh, paths['vaccinations'], continents, checkpoint_dir, cols_to_ffill, recorder = recorder)
+        return {
+            'full_df': refreshed['full_df'],
+            'adjusted_df': refreshed['adjusted_df'],
+            'total_vacc_df': timed(recorder, 'summarize_state', summarize_state, refreshed['state'], pop_dict, continents),
+            'fit_sums': refreshed['fit_sums'],
+            'rolling_windows': refreshed['windows'],
+            'continents': continents,
+            'pop_dict': pop_dict
+        }
+    vaccinations_df = timed(recorder, 'read_vaccinations', read_vaccinations, paths['vaccinations'])
+    pop_dict = timed(recorder, 'read_population', read_population, paths['population'])
+    if quarantine_path is not None:
+        timed(recorder, 'validate', validate, vaccinations_df, continents, pop_dict, quarantine_path)
+    return {
+        'full_df': timed(recorder, 'merge_continents', prepare_vaccinations, vaccinations_df, continents),
+        'continents': continents,
+        'pop_dict': pop_dict
+    }
+
+
+## adds the country-adjusted progress columns (adjusted_df), unless load already refreshed it
+def enrich(frames, cols_to_ffill = COLS_TO_FFILL, recorder = None):
+    if 'adjusted_df' in frames:
+        return frames
+    return {**frames, 'adjusted_df': timed(recorder, 'enrich_progress', enrich_progress, frames['full_df'], cols_to_ffill)}
+
+
+## one row per country summarising progress as of today (total_vacc_df), unless load already refreshed it
+def summarize(frames, recorder = None):
+    if 'total_vacc_df' in frames:
+        return frames
+    total_vacc_df = timed(recorder, 'summarize_countries', summarize_countries, frames['adjusted_df'], frames['pop_dict'], frames['continents'])
+    return {**frames, 'total_vacc_df': total_vacc_df}
+
+
+## fits the completion curves for every country with enough data, and solves for when each one reaches the target (country_results_df)
+## the predictions (like the later charts) only use countries with at least one day since starting, with their daily rates (progress_df)
+## alongside them, each country's rates over the last 7 / 14 / 28 days and days left to the target at those rates (rolling_df, see rolling.py)
+## forecaster picks the curves: 'quadratic' (curve_func, as in the analysis script), or the model ensemble (see ensemble.py)
+## with each country's best scoring model ('best') or all of them blended ('blend'), fitted over max_workers processes
+## with the fits cached in forecast_cache (None to refit everything)
+## frames from an incremental load come with the quadratic fit's running sums and the rolling windows already up to date, which are used instead
+def predict(frames, target = 100, horizon = 365, recorder = None, forecaster = 'quadratic', max_workers = None, forecast_cache = FORECAST_CACHE_PATH):
+    total_vacc_df = timed(recorder, 'add_daily_rates', add_daily_rates, frames['total_vacc_df'])
+    countries_to_predict = total_vacc_df.loc[total_vacc_df['predictable'], 'country']
+    adjusted_df = frames['adjusted_df']
+    windows = frames.get('rolling_windows')
+    if windows is not None and windows.target == target and windows.windows == WINDOWS:
+        rolling_df = timed(recorder, 'rolling_metrics', windows.latest)
+    else:
+        rolling_df = timed(recorder, 'rolling_metrics', latest_metrics, adjusted_df, target = target)
+
+    to_predict = None if forecaster == 'quadratic' and 'fit_sums' in frames else adjusted_df[adjusted_df['country'].isin(countries_to_predict)]
+    if forecaster == 'quadratic':
+        if to_predict is None:
+            fit_sums = frames['fit_sums']
+            country_params = timed(recorder, 'curve_fit', fit_quadratic_sums, fit_sums[fit_sums.index.isin(countries_to_predict)])
+        else:
+            country_params = timed(recorder, 'curve_fit', fit_quadratic_batch, to_predict)
+        country_results_df = timed(recorder, 'completion_dates', completion_results, country_params, total_vacc_df, target = target, horizon = horizon)
+    else:
+        country_params = timed(recorder, 'fit_ensemble', fit_ensemble, to_predict, max_workers = max_workers, cache_path = forecast_cache)
+        country_results_df = timed(recorder, 'completion_dates', ensemble_results, country_params, total_vacc_df, target = target, horizon = horizon, method = forecaster)
+
+    return {**frames, 'progress_df': total_vacc_df, 'rolling_df': rolling_df, 'country_params': country_params, 'country_results_df': country_results_df}
+
+
+## the frames the analysis works off of (full_df, adjusted_df, total_vacc_df), this is what cache.load_frames stores
+## (built incrementally with a checkpoint_dir, along with fit_sums and rolling_windows, see load)
+def build_frames(paths = SOURCE_PATHS, cols_to_ffill = COLS_TO_FFILL, recorder = None, quarantine_path = None, checkpoint_dir = None):
+    frames = summarize(enrich(load(paths, recorder, quarantine_path, checkpoint_dir, cols_to_ffill), cols_to_ffill, recorder), recorder)
+    return {name: frames[name] for name in ['full_df', 'adjusted_df', 'total_vacc_df', 'fit_sums', 'rolling_windows'] if name in frames}
+
+
+## builds every figure in the analysis, in the same order as the Figs/ folder (see export.figure_specs)
+## returns a dictionary of figure name -> plotly figure
+## line_options (a downsample.LineOptions) draws the multi-country line charts with fewer points / WebGL
+def render(frames, top_vaccines = None, line_options = None, recorder = None):
+    from vaccinations.export import TOP_VACCINES, figure_specs
+
+    specs = timed(recorder, 'figure_specs', figure_specs, frames, top_vaccines or TOP_VACCINES, line_options)
+    return {spec.name: timed(recorder, spec.name, spec.build) for spec in specs}
+
+
+## runs the whole pipeline, optionally pulling the built frames from the on-disk cache
+## with headless = True nothing gets rendered (and plotly never gets imported)
+## with a recorder, the top level stages are load_frames, predict and render, each with its own steps nested under it
+## (a warm cache has no steps under load_frames, a miss shows the full build)
+## forecaster and max_workers are passed on to predict, the ensemble's fits are only cached when use_cache is on
+## backend picks the engine the frames get built on (pandas, polars or duckdb, see backends.py), they all build the same frames
+## quarantine_path checks the raw rows whenever the frames get built (so on a cache miss, i.e. whenever a source changed), pandas only
+## checkpoint_dir refreshes the frames incrementally (see incremental.py), the checkpoint stands in for the on-disk cache of the frames, pandas only
+def run(paths = SOURCE_PATHS, headless = True, use_cache = True, target = 100, horizon = 365, recorder = None, forecaster = 'quadratic', max_workers = None,
+        backend = 'pandas', quarantine_path = None, checkpoint_dir = None):
+    if checkpoint_dir is not None and (backend != 'pandas' or quarantine_path is not None):
+        raise ValueError('the incremental refresh only works on pandas, without checking the raw rows')
+    if backend == 'pandas':
+        build = functools.partial(build_frames, recorder = recorder, quarantine_path = quarantine_path, checkpoint_dir = checkpoint_dir)
+    elif quarantine_path is not None:
+        raise ValueError(f'the raw rows can only be checked when building on pandas, not {backend}')
+    else:
+        from vaccinations.backends import build_frames as build_on_backend
+
+        build = functools.partial(build_on_backend, backend = backend, recorder = recorder)
+    if use_cache and checkpoint_dir is None:
+        from vaccinations.cache import load_frames
+
+        frames = timed(recorder, 'load_frames', load_frames, paths, build = build)
+    else:
+        frames = timed(recorder, 'load_frames', build, paths)
+
+    frames = timed(recorder, 'predict', predict, frames, target = target, horizon = horizon, recorder = recorder, forecaster = forecaster,
+                   max_workers = max_workers, forecast_cache = FORECAST_CACHE_PATH if use_cache else None)
+    if not headless:
+        frames['figures'] = timed(recorder, 'render', render, frames, recorder = recorder)
+    return frames
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'run the covid vaccination analysis pipeline')
+    parser.add_argument('--headless', action = 'store_true', help = 'only build the data, without rendering any figures')
+    parser.add_argument('--no-cache', action = 'store_true', help = 'rebuild the frames from the csvs instead of using the on-disk cache')
+    parser.add_argument('--fetch', default = None, metavar = 'BASE_URL', help = 'download any source that changed from here first (see fetch.py)')
+    parser.add_argument('--skip-unchanged', action = 'store_true', help = 'with --fetch, stop there when none of the sources changed')
+    parser.add_argument('--backend', default = 'pandas', choices = ['pandas', 'polars', 'duckdb'], help = 'the engine to build the frames on')
+    parser.add_argument('--quarantine', nargs = '?', const = QUARANTINE_PATH, default = None, metavar = 'PATH',
+                        help = f'check the raw rows when building the frames, writing the ones that fail here (defaults to {QUARANTINE_PATH})')
+    parser.add_argument('--incremental', nargs = '?', const = CHECKPOINT_DIR, default = None, metavar = 'DIR',
+                        help = f'only read and enrich the new days, keeping a checkpoint here between runs (defaults to {CHECKPOINT_DIR})')
+    parser.add_argument('--target', type = float, default = 100, help = 'percent of the population vaccinated to predict the date for')
+    parser.add_argument('--horizon', type = int, default = 365, help = 'how many days ahead to look for the target')
+    parser.add_argument('--forecaster', default = 'quadratic', choices = ['quadratic', 'best', 'blend'],
+                        help = "the quadratic curve, or the model ensemble's best model per country / blend of every model")
+    parser.add_argument('--workers', type = int, default = None, help = 'processes to fit the ensemble with (defaults to one per core)')
+    parser.add_argument('--output-dir', default = None, help = 'write total_vacc_df, rolling_df and country_results_df here as csv')
+    parser.add_argument('--figures-dir', default = None, help = 'write every figure here as html (ignored when headless)')
+    parser.add_argument('--show', action = 'store_true', help = 'show every figure (ignored when headless)')
+    parser.add_argument('--report', default = None, help = 'write the per-stage timings here as json')
+    parser.add_argument('--profile', default = None, help = 'run every stage under cProfile and write the stats here (a pstats file)')
+    parser.add_argument('--trace-memory', action = 'store_true', help = 'record the exact peak allocations of each stage with tracemalloc (slower)')
+    parser.add_argument('--quiet', action = 'store_true', help = "don't print the per-stage timings")
+    args = parser.parse_args(argv)
+    if args.quarantine is not None and args.backend != 'pandas':
+        parser.error('--quarantine only works with --backend pandas')
+    if args.incremental is not None and (args.quarantine is not None or args.backend != 'pandas'):
+        parser.error('--incremental only works with --backend pandas, without --quarantine')
+
+    recorder = StageRecorder(profile = args.profile is not None, trace_memory = args.trace_memory)
+    start = time.perf_counter()
+    if args.fetch is not None:
+        from vaccinations.fetch import any_changed, fetch_sources, source_urls
+
+        fetched = recorder.run('fetch_sources', fetch_sources, source_urls(args.fetch))
+        if args.skip_unchanged and not any_changed(fetched):
+            recorder.close()
+            print(f'none of the sources changed since the last fetch, nothing to do ({time.perf_counter() - start:.2f}s)')
+            return None
+    frames = run(headless = args.headless, use_cache = not args.no_cache, target = args.target, horizon = args.horizon, recorder = recorder,
+                 forecaster = args.forecaster, max_workers = args.workers, backend = args.backend, quarantine_path = args.quarantine,
+                 checkpoint_dir = args.incremental)
+
+    if args.output_dir is not None:
+        with recorder.stage('write_outputs'):
+            os.makedirs(args.output_dir, exist_ok = True)
+            frames['total_vacc_df'].to_csv(os.path.join(args.output_dir, 'total_vacc_df.csv'), index = False)
+            frames['rolling_df'].to_csv(os.path.join(args.output_dir, 'rolling_df.csv'), index = False)
+            frames['country_results_df'].to_csv(os.path.join(args.output_dir, 'country_results_df.csv'), index = False)
+
+    if frames.get('figures') and (args.figures_dir is not None or args.show):
+        with recorder.stage('write_figures'):
+            for name, fig in frames['figures'].items():
+                if args.figures_dir is not None:
+                    os.makedirs(args.figures_dir, exist_ok = True)
+                    fig.write_html(os.path.join(args.figures_dir, name.replace('/', '_').replace(' ', '_') + '.html'))
+                if args.show:
+                    fig.show()
+    recorder.close()
+
+    if not args.quiet:
+        print(recorder.summary())
+    if args.report is not None:
+        recorder.write_report(args.report)
+    if args.profile is not None:
+        recorder.dump_profile(args.profile)
+
+    if args.quarantine is not None and os.path.exists(summary_path(args.quarantine)):
+        with open(summary_path(args.quarantine)) as f:
+            print(f'{describe(json.load(f))}, quarantined rows in {args.quarantine}')
+    print(f'{len(frames["total_vacc_df"])} countries summarised, {len(frames["country_results_df"])} predicted to reach {args.target:g}% '
+          f'within {args.horizon} days ({time.perf_counter() - start:.2f}s)')
+
+    return frames
+
+
+if __name__ == '__main__':
+    main()
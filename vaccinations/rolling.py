@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+
+## the average daily percent vaccinated in total_vacc_df is a straight line from each country's first day to today,
+## which hides a rollout that has recently slowed down (and that is exactly when the quadratic forecast goes wrong)
+## so here are rolling versions over the last 7 / 14 / 28 days, for every row of adjusted_df:
+##   - doses_<w>d: average daily doses over the last w days
+##   - per_hundred_<w>d: average daily vaccinations per hundred people over the last w days
+##   - days_to_target_<w>d: days left until the target (vaccinations per hundred) at that rate, 0 once reached, missing if the rate isn't positive
+##   - wow_growth: the doses of the last 7 days against the 7 days before them, minus 1 (0.1 is 10% more than the week before)
+## the windows are calendar days, against the (forward filled) value as of w days earlier, so a country that skips days still lines up
+## a window that reaches back before a country's first row is missing
+WINDOWS = (7, 14, 28)
+
+ROLLING_COLS = ['total_vaccinations', 'total_vaccinations_per_hundred']
+
+
+def _days(dates):
+    return np.asarray(dates, dtype = 'datetime64[D]').astype('int64')
+
+
+## every lag the metrics look back by (wow_growth always needs 7 and 14)
+def _lags(windows):
+    return sorted(set(windows) | {7, 14})
+
+
+## the metrics from the current values and the values as of each lag earlier, shared by the full and incremental versions so they agree exactly
+def _window_metrics(current, past, windows, target):
+    doses, per_hundred = current['total_vaccinations'], current['total_vaccinations_per_hundred']
+    metrics = {}
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        for w in windows:
+            rate = (per_hundred - past[('total_vaccinations_per_hundred', w)]) / w
+            metrics[f'doses_{w}d'] = (doses - past[('total_vaccinations', w)]) / w
+            metrics[f'per_hundred_{w}d'] = rate
+            metrics[f'days_to_target_{w}d'] = np.where(per_hundred >= target, 0.0, np.where(rate > 0, (target - per_hundred) / rate, np.nan))
+
+        this_week = doses - past[('total_vaccinations', 7)]
+        last_week = past[('total_vaccinations', 7)] - past[('total_vaccinations', 14)]
+        metrics['wow_growth'] = np.where(last_week > 0, this_week / last_week - 1, np.nan)
+    return metrics
+
+
+## the rolling metrics for every row of adjusted_df (same index and row order), vectorized across all countries:
+## the rows are sorted once by country and day, and the row as of each lag earlier is found with one binary search over all of them
+def rolling_metrics(adjusted_df, windows = WINDOWS, target = 100):
+    lags = _lags(windows)
+    codes = pd.factorize(adjusted_df['country'])[0]
+    days = _days(adjusted_df['date'])
+    order = np.lexsort((days, codes))
+    sorted_codes, sorted_days = codes[order], days[order]
+
+    ## one increasing key over (country, day), spaced so looking back by a lag never lands in the previous country's keys
+    span = sorted_days.max() - sorted_days.min() + lags[-1] + 2
+    keys = sorted_codes * span + (sorted_days - sorted_days.min() + lags[-1] + 1)
+
+    current = {col: adjusted_df[col].to_numpy(dtype = 'float64', na_value = np.nan)[order] for col in ROLLING_COLS}
+    past = {}
+    for lag in lags:
+        positions = np.searchsorted(keys, keys - lag, side = 'right') - 1
+        valid = (positions >= 0) & (sorted_codes[np.maximum(positions, 0)] == sorted_codes)
+        for col in ROLLING_COLS:
+            past[(col, lag)] = np.where(valid, current[col][np.maximum(positions, 0)], np.nan)
+
+    unsort = np.empty_like(order)
+    unsort[order] = np.arange(len(order))
+    rolling_df = adjusted_df[['country', 'date']].copy()
+    for name, values in _window_metrics(current, past, windows, target).items():
+        rolling_df[name] = values[unsort]
+    return rolling_df
+
+
+## one row per country with its rolling metrics as of its last day
+def latest_metrics(adjusted_df, windows = WINDOWS, target = 100):
+    return RollingWindows.from_frame(adjusted_df, windows, target).latest()
+
+
+## the rolling metrics kept up to date as new days come in, without looking back at the history
+## for each country this holds its last day and a ring buffer of the (forward filled) values over the last max(lag) + 1 calendar days,
+## so adding a day is a fixed amount of work per country however long its history is, and is vectorized across the countries in the update
+## from_frame builds it from adjusted_df, update takes the newly enriched rows (e.g. incremental.enrich_delta's output)
+## and returns their metrics, the same as rolling_metrics on the whole history would give for those rows
+## NOTE: new rows have to come after each country's last day (revised history needs a rebuild with from_frame)
+class RollingWindows:
+    def __init__(self, countries, last_day, rings, windows = WINDOWS, target = 100):
+        self.countries = pd.Index(np.asarray(countries, dtype = object))
+        self.last_day = last_day
+        self.rings = rings
+        self.windows = tuple(windows)
+        self.target = target
+        self.size = _lags(windows)[-1] + 1
+
+    @classmethod
+    def from_frame(cls, adjusted_df, windows = WINDOWS, target = 100):
+        size = _lags(windows)[-1] + 1
+        codes, countries = pd.factorize(adjusted_df['country'])
+        days = _days(adjusted_df['date'])
+        order = np.lexsort((days, codes))
+        sorted_codes, sorted_days = codes[order], days[order]
+
+        span = sorted_days.max() - sorted_days.min() + size + 1
+        keys = sorted_codes * span + (sorted_days - sorted_days.min() + size)
+        last_rows = np.searchsorted(sorted_codes, np.arange(len(countries)), side = 'right') - 1
+        last_day = sorted_days[last_rows]
+
+        ## each country's value as of every one of its last size days, with the same binary search as rolling_metrics
+        rings = {col: np.full((len(countries), size), np.nan) for col in ROLLING_COLS}
+        values = {col: adjusted_df[col].to_numpy(dtype = 'float64', na_value = np.nan)[order] for col in ROLLING_COLS}
+        rows = np.arange(len(countries))
+        for back in range(size):
+            positions = np.searchsorted(keys, keys[last_rows] - back, side = 'right') - 1
+            valid = (positions >= 0) & (sorted_codes[np.maximum(positions, 0)] == rows)
+            for col in ROLLING_COLS:
+                rings[col][rows, (last_day - back) % size] = np.where(valid, values[col][np.maximum(positions, 0)], np.nan)
+
+        return cls(countries, last_day, rings, windows, target)
+
+    def _add_countries(self, countries):
+        new = pd.Index(countries).unique().difference(self.countries, sort = False)
+        if len(new):
+            self.countries = self.countries.append(new)
+            ## new countries have no last day yet, anything looked up before their first row stays missing
+            self.last_day = np.append(self.last_day, np.full(len(new), np.iinfo('int64').min // 2))
+            for col in ROLLING_COLS:
+                self.rings[col] = np.vstack([self.rings[col], np.full((len(new), self.size), np.nan)])
+
+    ## puts the countries in the given order (e.g. after a rewritten file moved a country), so latest() lists them the way a rebuild would
+    def reorder(self, countries):
+        positions = self.countries.get_indexer(pd.Index(countries))
+        self.countries = self.countries[positions]
+        self.last_day = self.last_day[positions]
+        self.rings = {col: ring[positions] for col, ring in self.rings.items()}
+
+    def update(self, new_df):
+        countries = new_df['country'].astype(str)
+        self._add_countries(countries)
+        positions = self.countries.get_indexer(countries)
+        days = _days(new_df['date'])
+        values = {col: new_df[col].to_numpy(dtype = 'float64', na_value = np.nan) for col in ROLLING_COLS}
+
+        ## each round adds one day for every country that has one left, in date order within each country
+        rounds = pd.Series(days).groupby(positions).rank(method = 'first').to_numpy().astype(int) - 1
+        metrics = {name: np.full(len(new_df), np.nan) for name in self._metrics(rounds[:0], days[:0])}
+        for r in range(rounds.max() + 1 if len(rounds) else 0):
+            rows = np.flatnonzero(rounds == r)
+            country, day = positions[rows], days[rows]
+
+            ## the days skipped since a country's last day carry its last value forward
+            last = self.last_day[country]
+            for col in ROLLING_COLS:
+                ring = self.rings[col]
+                last_value = ring[country, last % self.size]
+                for back in range(1, min(self.size, (day - last).max())):
+                    skipped = day - back > last
+                    ring[country[skipped], (day[skipped] - back) % self.size] = last_value[skipped]
+                ring[country, day % self.size] = values[col][rows]
+            self.last_day[country] = day
+
+            for name, values_r in self._metrics(country, day).items():
+                metrics[name][rows] = values_r
+
+        rolling_df = new_df[['country', 'date']].copy()
+        for name, values_r in metrics.items():
+            rolling_df[name] = values_r
+        return rolling_df
+
+    def _metrics(self, country, day):
+        current = {col: self.rings[col][country, day % self.size] for col in ROLLING_COLS}
+        past = {(col, lag): self.rings[col][country, (day - lag) % self.size] for col in ROLLING_COLS for lag in _lags(self.windows)}
+        return _window_metrics(current, past, self.windows, self.target)
+
+    ## one row per country with its metrics as of its last day
+    def latest(self):
+        latest_df = pd.DataFrame({'date': pd.to_datetime(self.last_day.astype('datetime64[D]'))}, index = self.countries.rename('country'))
+        for name, values in self._metrics(np.arange(len(self.countries)), self.last_day).items():
+            latest_df[name] = values
+        return latest_df.reset_index()
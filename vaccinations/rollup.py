@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+
+## the per-country values the treemaps add up
+ROLLUP_METRICS = ['total_per_hundred', 'average_daily_percent_vaccinated']
+
+## the per-continent bar charts rank the countries by these
+RANK_METRICS = ['average_daily_percent_vaccinated', 'total_per_hundred']
+
+
+## the progress treemap is world -> continent -> country for the countries with at least min_pop people, and the per-continent bars rank each
+## continent's countries, which used to mean filtering (and for the bars, sorting) the whole progress dataframe again for every threshold / continent
+## here the progress dataframe (total_vacc_df with its daily rates) is laid out once so that any threshold is a binary search:
+##   - the countries are sorted by population, largest first, both across the world and within each continent (a contiguous segment each),
+##     so the countries with at least min_pop people are always the first k, and k is one searchsorted away
+##   - each metric keeps a running sum in that same order (per continent, and across the world), so any threshold's totals are a lookup at k
+##   - each continent's countries are also kept ranked by every RANK_METRICS column (largest first, missing values last)
+## countries without a population never pass a min_pop, countries without a continent are rolled up under None
+##
+## e.g.
+##   rollup = ProgressRollup.from_frame(progress_df)
+##   rollup.total('total_per_hundred', 10000000)                       ## the world's value in the treemap at 10M+
+##   rollup.continent_totals('average_daily_percent_vaccinated', 1e6)   ## {continent: (countries, value)} at 1M+
+##   rollup.hierarchy('total_per_hundred', 10000000)                    ## the whole world -> continent -> country tree
+##   rollup.ranking('Europe', n = 10)                                   ## the top 10 rows of Europe's bar chart
+class ProgressRollup:
+    def __init__(self, progress_df, continents, bounds, order, neg_population, prefix, world_order, world_neg_population, world_prefix, rankings):
+        self.progress_df = progress_df
+        self.continents = continents
+        self.bounds = bounds
+        self.order = order
+        self.neg_population = neg_population
+        self.prefix = prefix
+        self.world_order = world_order
+        self.world_neg_population = world_neg_population
+        self.world_prefix = world_prefix
+        self.rankings = rankings
+        self._segments = {continent: i for i, continent in enumerate(continents)}
+        self._countries = progress_df['country'].astype(str).to_numpy(dtype = object)[order]
+        self._values = {metric: progress_df[metric].to_numpy(dtype = 'float64', na_value = np.nan)[order] for metric in prefix}
+
+    @classmethod
+    def from_frame(cls, progress_df, metrics = ROLLUP_METRICS, rank_by = RANK_METRICS):
+        population = progress_df['population'].to_numpy(dtype = 'float64', na_value = np.nan)
+        ## the negated populations sort ascending with the missing ones (NaN) last, which is what searchsorted needs
+        neg_population = -population
+
+        ## continents in order of first appearance, each country's rank within the world by population
+        continent_codes, continents = pd.factorize(progress_df['continent'].astype(object), use_na_sentinel = False)
+        continents = [None if pd.isna(continent) else continent for continent in continents]
+        world_order = np.argsort(neg_population, kind = 'stable')
+        order = world_order[np.argsort(continent_codes[world_order], kind = 'stable')]
+        bounds = np.searchsorted(continent_codes[order], np.arange(len(continents) + 1))
+
+        ## running sums start at 0 (nothing passes), missing values add nothing, as in a groupby sum
+        prefix, world_prefix = {}, {}
+        for metric in metrics:
+            values = np.nan_to_num(progress_df[metric].to_numpy(dtype = 'float64', na_value = np.nan), nan = 0.0)
+            prefix[metric] = [np.r_[0.0, np.cumsum(values[order[start:stop]])] for start, stop in zip(bounds[:-1], bounds[1:])]
+            world_prefix[metric] = np.r_[0.0, np.cumsum(values[world_order])]
+
+        ## one stable sort per ranking column across the world, split by continent, keeps each continent's rows in ranked order
+        rankings = {}
+        for metric in rank_by:
+            ranked = progress_df[metric].reset_index(drop = True).sort_values(ascending = False, kind = 'stable', na_position = 'last').index.to_numpy()
+            ranked_codes = continent_codes[ranked]
+            rankings[metric] = [ranked[ranked_codes == code] for code in range(len(continents))]
+
+        return cls(progress_df, continents, bounds, order, neg_population[order], prefix, world_order, neg_population[world_order], world_prefix, rankings)
+
+    def _segment(self, continent):
+        if continent not in self._segments:
+            raise KeyError(f'unknown continent: {continent}')
+        return self._segments[continent]
+
+    ## how many of the (negated, sorted) populations are at least min_pop, nothing is at least a NaN
+    @staticmethod
+    def _passing(neg_population, min_pop):
+        if min_pop != min_pop:
+            return 0
+        return int(np.searchsorted(neg_population, -min_pop, side = 'right'))
+
+    ## how many countries have at least min_pop people, across the world
+    def count(self, min_pop):
+        return self._passing(self.world_neg_population, min_pop)
+
+    ## the sum of metric over the countries with at least min_pop people, across the world
+    def total(self, metric, min_pop):
+        return float(self.world_prefix[metric][self.count(min_pop)])
+
+    ## {continent: (number of countries, sum of metric)} for the countries with at least min_pop people, leaving out continents with none
+    def continent_totals(self, metric, min_pop):
+        totals = {}
+        for i, continent in enumerate(self.continents):
+            start, stop = self.bounds[i], self.bounds[i + 1]
+            k = self._passing(self.neg_population[start:stop], min_pop)
+            if k:
+                totals[continent] = (k, float(self.prefix[metric][i][k]))
+        return totals
+
+    ## the world -> continent -> country values of the treemap for the countries with at least min_pop people:
+    ## {'value': world total, 'continents': [{'continent', 'value', 'countries': [country names], 'values': [their values]}]}
+    ## with the countries largest first within each continent (missing values as NaN)
+    def hierarchy(self, metric, min_pop):
+        continents = []
+        for continent, (k, value) in self.continent_totals(metric, min_pop).items():
+            start = self.bounds[self._segments[continent]]
+            continents.append({'continent': continent, 'value': value,
+                               'countries': self._countries[start:start + k].tolist(), 'values': self._values[metric][start:start + k]})
+        return {'value': self.total(metric, min_pop), 'continents': continents}
+
+    ## the rows of the progress dataframe for the countries with at least min_pop people, in their original order (and with their original index)
+    ## (the same rows as progress_df[progress_df['population'] >= min_pop], without scanning the population column)
+    def frame(self, min_pop, columns = None):
+        rows = np.sort(self.world_order[:self.count(min_pop)])
+        return self.progress_df.iloc[rows] if columns is None else self.progress_df.iloc[rows][columns]
+
+    ## a continent's rows of the progress dataframe ranked by one of RANK_METRICS, largest first (the first n, or all of them)
+    def ranking(self, continent, by = RANK_METRICS[0], n = None):
+        rows = self.rankings[by][self._segment(continent)]
+        return self.progress_df.iloc[rows if n is None else rows[:n]]
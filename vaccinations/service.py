@@ -0,0 +1,428 @@
+import argparse
+import asyncio
+import collections
+import functools
+import hashlib
+import json
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from vaccinations.chart_data import SeriesStore
+from vaccinations.loading import SOURCE_PATHS
+from vaccinations.rollup import ProgressRollup
+from vaccinations.summary import add_daily_rates
+from vaccinations.vaccine_index import VaccineIndex
+
+
+## a small local http / json service answering the queries behind vaccine_map, top_countries_chart and avg_vaccination_progress
+## (plus a per-country lookup), for dashboards that ask for them over and over with slightly different arguments
+##   - the frames are loaded once into a QueryIndex, which keeps them indexed by country (a SeriesStore to slice each line from),
+##     by vaccine (a VaccineIndex), by total vaccinations rank (for top n) and rolled up by continent and population (a ProgressRollup, for min_pop)
+##   - answers are kept, already encoded, in an LRU cache keyed on the data version, the endpoint and its (normalized) arguments
+##   - POST /reload (or --refresh-every) loads the frames again after the daily refresh and swaps the new index in once it is built,
+##     requests keep being answered from the old index in the meantime, and ones already running finish on the index they started with
+##   - GET /stats has the latency percentiles of each endpoint (over its last LATENCY_WINDOW requests), the cache's hit rate and the data version
+##
+## from the command line:
+##   python -m vaccinations.service --port 8050 --refresh-every 3600
+##   python -m vaccinations.service --port 8050 --refresh-every 600 --fetch http://127.0.0.1:8060/     (downloading the sources on each refresh)
+##   curl 'localhost:8050/top_countries?n=10&time_period=vaccination_day_number&pop_adjusted=false'
+##   curl 'localhost:8050/avg_progress?vals=average&min_pop=1000000'
+##   curl 'localhost:8050/vaccine_map?vaccine=Moderna'
+##   curl 'localhost:8050/country?name=Israel'
+##   curl -X POST localhost:8050/reload
+##   curl localhost:8050/stats
+LATENCY_WINDOW = 10000
+
+
+## the float32 columns as the shortest decimals that round trip (1.23 rather than 1.2300000190734863), missing values as null
+def _json_values(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return np.datetime_as_string(values, unit = 'D').tolist()
+    if values.dtype == np.float32:
+        values = values.astype(str).astype('float64')
+    if np.issubdtype(values.dtype, np.floating):
+        return [None if value != value else value for value in values.tolist()]
+    return values.tolist()
+
+
+def _json_value(value):
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    return _json_values(np.asarray([value]))[0]
+
+
+## the frames indexed for the queries, built once per data version
+## summary is total_vacc_df (all countries, for the top n and country lookups), progress is it with the daily rates (add_daily_rates)
+class QueryIndex:
+    def __init__(self, summary, progress, store, vacc_index, version):
+        self.summary = summary.reset_index(drop = True)
+        self.progress = progress.reset_index(drop = True)
+        self.store = store
+        self.vacc_index = vacc_index
+        self.version = version
+        self._country_rows = pd.Index(self.summary['country'].astype(str))
+
+        ## top n is the first n of the countries ranked by total vaccinations (the same sort as charts.top_countries_figure)
+        self.by_total = self.summary.sort_values(by = 'total_vaccinations', ascending = False)['country'].astype(str).tolist()
+
+        ## the progress rows rolled up by continent and sorted by population, so any min_pop is a binary search (see rollup.py)
+        self.rollup = ProgressRollup.from_frame(self.progress)
+
+    @classmethod
+    def from_frames(cls, frames):
+        total_vacc_df = frames['total_vacc_df']
+        adjusted_df = frames['adjusted_df']
+        store = SeriesStore.from_frame(adjusted_df)
+        vacc_index = VaccineIndex.from_frame(frames.get('full_df', adjusted_df))
+
+        sha = hashlib.sha1(store.version.encode())
+        sha.update(pd.util.hash_pandas_object(total_vacc_df, index = False).to_numpy().tobytes())
+        return cls(total_vacc_df, add_daily_rates(total_vacc_df), store, vacc_index, sha.hexdigest())
+
+    ## the countries an individual vaccine can be found in, with each one's line of total vaccinations per hundred by date
+    ## (what both the vaccine map and vaccine_progress_figure's line chart are drawn from)
+    def vaccine_map(self, vaccine):
+        countries = self.vacc_index.countries_for(vaccine)
+        lines = [{'country': country, 'x': _json_values(self.store.series(country, 'date')),
+                  'y': _json_values(self.store.series(country, 'total_vaccinations_per_hundred'))}
+                 for country in countries if country in self.store]
+        return {'vaccine': vaccine, 'countries': countries, 'metric': 'total_vaccinations_per_hundred', 'lines': lines}
+
+    ## one line per country for the top n countries by total vaccinations, by date or by day number, raw or per hundred
+    def top_countries(self, n = 25, time_period = 'date', pop_adjusted = True):
+        if time_period not in ('date', 'vaccination_day_number'):
+            raise ValueError('must have different time period entry')
+        if n < 0:
+            raise ValueError('n must not be negative')
+        y_metric = 'total_vaccinations_per_hundred' if pop_adjusted else 'total_vaccinations'
+
+        lines = [{'country': country, 'x': _json_values(self.store.series(country, time_period)), 'y': _json_values(self.store.series(country, y_metric))}
+                 for country in self.by_total[:n] if country in self.store]
+        return {'time_period': time_period, 'metric': y_metric, 'lines': lines}
+
+    ## the world -> continent -> country values of the treemap, for countries with at least min_pop people
+    ## (vals is 'total' for total vaccinations per hundred, 'average' for the average percent vaccinated per day)
+    ## countries come largest first within each continent, and each continent's value is the sum of its countries'
+    def avg_progress(self, vals, min_pop = 10000000):
+        if vals not in ('total', 'average'):
+            raise ValueError('must input an appropriate value type')
+        val_metric = 'total_per_hundred' if vals == 'total' else 'average_daily_percent_vaccinated'
+        hierarchy = self.rollup.hierarchy(val_metric, min_pop)
+
+        continents = [{'continent': continent['continent'], 'value': continent['value'],
+                       'countries': [{'country': country, 'value': value} for country, value in zip(continent['countries'], _json_values(continent['values']))]}
+                      for continent in hierarchy['continents']]
+        return {'vals': vals, 'metric': val_metric, 'min_pop': min_pop, 'value': hierarchy['value'], 'continents': continents}
+
+    ## one country's row of total_vacc_df, with the vaccines it is using
+    def country(self, name):
+        if name not in self._country_rows:
+            raise KeyError(f'unknown country: {name}')
+        row = self.summary.iloc[self._country_rows.get_loc(name)]
+        return {**{col: _json_value(value) for col, value in row.items()}, 'vaccines': self.vacc_index.vaccines_for(name)}
+
+
+## the arguments each endpoint takes, as (parser, default), with a default of None meaning the argument is required
+def _parse_bool(value):
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise ValueError(f'expected true or false, got {value}')
+
+
+ENDPOINTS = {
+    '/vaccine_map': ('vaccine_map', {'vaccine': (str, None)}),
+    '/top_countries': ('top_countries', {'n': (int, 25), 'time_period': (str, 'date'), 'pop_adjusted': (_parse_bool, True)}),
+    '/avg_progress': ('avg_progress', {'vals': (str, None), 'min_pop': (float, 10000000)}),
+    '/country': ('country', {'name': (str, None)})
+}
+
+
+def parse_arguments(path, query):
+    method, spec = ENDPOINTS[path]
+    unknown = set(query) - set(spec)
+    if unknown:
+        raise ValueError(f'unknown arguments for {path}: {", ".join(sorted(unknown))}')
+
+    arguments = {}
+    for name, (parse, default) in spec.items():
+        if name in query:
+            arguments[name] = parse(query[name])
+        elif default is None:
+            raise ValueError(f'{path} needs a {name}')
+        else:
+            arguments[name] = default
+    return method, arguments
+
+
+## a least recently used cache of encoded answers, evicting the oldest once it holds maxsize of them
+class LRUCache:
+    def __init__(self, maxsize = 1024):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last = False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None}
+
+
+## the latencies of the last window requests to each endpoint, in milliseconds
+class LatencyStats:
+    def __init__(self, window = LATENCY_WINDOW):
+        self.window = window
+        self._latencies = collections.defaultdict(functools.partial(collections.deque, maxlen = window))
+        self._counts = collections.Counter()
+
+    def record(self, endpoint, seconds):
+        self._latencies[endpoint].append(seconds * 1000)
+        self._counts[endpoint] += 1
+
+    def summary(self):
+        summary = {}
+        for endpoint, latencies in self._latencies.items():
+            p50, p90, p99 = np.percentile(np.fromiter(latencies, float), [50, 90, 99])
+            summary[endpoint] = {'requests': self._counts[endpoint], 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': max(latencies)}
+        return summary
+
+
+## the default way of getting the frames: the on-disk cache, which rebuilds them when the source csvs have changed
+## with fetch_from (a base url, see fetch.py) any source that changed there gets downloaded first, over pool's kept-alive connections
+def load_source_frames(paths = SOURCE_PATHS, fetch_from = None, pool = None):
+    from vaccinations.cache import load_frames
+
+    if fetch_from is not None:
+        from vaccinations.fetch import fetch_sources, source_urls
+
+        fetch_sources(source_urls(fetch_from, paths), paths, pool = pool)
+    return load_frames(paths)
+
+
+## the service itself: answers the queries from the current QueryIndex (through the cache) and swaps in a new one on reload
+## load is called (in a worker thread, so the service keeps answering) to get the frames whenever the data gets reloaded
+class QueryService:
+    def __init__(self, load = load_source_frames, cache_size = 1024, latency_window = LATENCY_WINDOW):
+        self.load = load
+        self.cache = LRUCache(cache_size)
+        self.latency = LatencyStats(latency_window)
+        self.index = None
+        self.loaded_at = None
+        self.reloads = 0
+        self._reload_lock = asyncio.Lock()
+
+    ## loads the frames and builds their index off the event loop, swapping it in if the data has changed
+    ## returns whether it was swapped (a reload that is already running is waited for rather than started again)
+    async def reload(self):
+        if self._reload_lock.locked():
+            async with self._reload_lock:
+                return False
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            index = await loop.run_in_executor(None, lambda: QueryIndex.from_frames(self.load()))
+            self.loaded_at = time.time()
+            if self.index is not None and index.version == self.index.version:
+                return False
+
+            ## one assignment, so each request sees either the old index or the new one, and the old answers are dropped from the cache
+            self.index = index
+            self.cache.clear()
+            self.reloads += 1
+            return True
+
+    ## the encoded answer to one query, from the cache when it has been asked before on this version of the data
+    def query(self, path, query):
+        index = self.index
+        method, arguments = parse_arguments(path, query)
+        key = (index.version, path, tuple(sorted(arguments.items())))
+        body = self.cache.get(key)
+        if body is None:
+            body = json.dumps(getattr(index, method)(**arguments), separators = (',', ':')).encode()
+            ## an answer worked out on an index that got swapped out in the meantime isn't kept
+            if index is self.index:
+                self.cache.put(key, body)
+        return body
+
+    def stats(self):
+        return {'version': self.index.version if self.index is not None else None, 'loaded_at': self.loaded_at, 'reloads': self.reloads,
+                'cache': self.cache.stats(), 'latency': self.latency.summary()}
+
+    ## the status and json body for one request
+    async def respond(self, method, target):
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query, keep_blank_values = True))
+        try:
+            if url.path == '/reload':
+                if method != 'POST':
+                    return 405, {'error': 'use POST to reload'}
+                swapped = await self.reload()
+                return 200, {'swapped': swapped, 'version': self.index.version}
+            if method != 'GET':
+                return 405, {'error': f'use GET for {url.path}'}
+            if url.path == '/stats':
+                return 200, self.stats()
+            if url.path not in ENDPOINTS:
+                return 404, {'error': f'unknown endpoint: {url.path}', 'endpoints': sorted(ENDPOINTS) + ['/reload', '/stats']}
+            if self.index is None:
+                return 503, {'error': 'the data is still loading'}
+            return 200, self.query(url.path, query)
+        except KeyError as error:
+            return 404, {'error': error.args[0] if error.args else str(error)}
+        except ValueError as error:
+            return 400, {'error': str(error)}
+        except Exception as error:
+            print(f'error answering {target}: {error!r}')
+            return 500, {'error': repr(error)}
+
+    ## one connection, answering requests on it until the client closes it (or asks to with http/1.0 or Connection: close)
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                start = time.perf_counter()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                ## a body we can't size can't be skipped over either, so the connection gets closed after the 400
+                try:
+                    content_length = int(headers.get('content-length', 0))
+                    if content_length < 0:
+                        raise ValueError
+                except ValueError:
+                    content_length = None
+                if content_length:
+                    await reader.readexactly(content_length)
+
+                parts = request_line.decode('latin-1').split()
+                if content_length is None:
+                    status, body, path, keep_alive = 400, {'error': f'bad content-length: {headers["content-length"]}'}, None, False
+                elif len(parts) != 3:
+                    status, body, path, keep_alive = 400, {'error': 'malformed request line'}, None, False
+                else:
+                    method, target, version = parts
+                    status, body = await self.respond(method, target)
+                    path = urllib.parse.urlsplit(target).path
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                await _write_response(writer, status, body, keep_alive)
+                if path in ENDPOINTS:
+                    self.latency.record(path, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        ## a request line or header longer than the stream's limit can't be read past, so it is answered and the connection closed
+        except (asyncio.LimitOverrunError, ValueError):
+            try:
+                await _write_response(writer, 400, {'error': 'request line or header too long'}, False)
+            except ConnectionError:
+                pass
+        ## (idle keep-alive connections get cancelled when the service stops)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    ## loads the data, then serves on host:port until cancelled, reloading every refresh_every seconds when given
+    ## started (an asyncio.Event) gets set once the service is accepting connections, and the bound port is in self.port
+    async def serve(self, host = '127.0.0.1', port = 8050, refresh_every = None, started = None):
+        await self.reload()
+        server = await asyncio.start_server(self.handle, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        refresher = asyncio.create_task(self._refresh_every(refresh_every)) if refresh_every else None
+        if started is not None:
+            started.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if refresher is not None:
+                refresher.cancel()
+
+    async def _refresh_every(self, seconds):
+        while True:
+            await asyncio.sleep(seconds)
+            try:
+                await self.reload()
+            except Exception as error:
+                print(f'reload failed, still serving version {self.index.version}: {error!r}')
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+async def _write_response(writer, status, body, keep_alive):
+    body = body if isinstance(body, bytes) else json.dumps(body, separators = (',', ':')).encode()
+    writer.write(f'HTTP/1.1 {status} {_REASONS.get(status, "")}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                 f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + body)
+    await writer.drain()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'serve the vaccination queries over local http / json')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8050)
+    parser.add_argument('--cache-size', type = int, default = 1024, help = 'how many answers the LRU cache keeps')
+    parser.add_argument('--refresh-every', type = float, default = None, help = 'seconds between reloading the data (it is only swapped in when it has changed)')
+    parser.add_argument('--fetch', default = None, metavar = 'BASE_URL', help = 'download any source that changed from here on every load (see fetch.py)')
+    parser.add_argument('--vaccinations', default = SOURCE_PATHS['vaccinations'])
+    parser.add_argument('--continents', default = SOURCE_PATHS['continents'])
+    parser.add_argument('--population', default = SOURCE_PATHS['population'])
+    args = parser.parse_args(argv)
+
+    paths = {'vaccinations': args.vaccinations, 'continents': args.continents, 'population': args.population}
+    pool = None
+    if args.fetch is not None:
+        from vaccinations.fetch import ConnectionPool
+
+        pool = ConnectionPool()
+    service = QueryService(functools.partial(load_source_frames, paths, args.fetch, pool), cache_size = args.cache_size)
+    started = asyncio.Event()
+
+    async def announce():
+        await started.wait()
+        print(f'serving version {service.index.version[:12]} on http://{args.host}:{service.port}')
+
+    async def serve():
+        await asyncio.gather(service.serve(args.host, args.port, args.refresh_every, started), announce())
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
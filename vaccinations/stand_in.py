@@ -0,0 +1,151 @@
+import argparse
+import collections
+import email.utils
+import http.server
+import os
+import re
+import threading
+
+
+## a local stand-in for wherever the source csvs are published, serving the files of one directory the way a real static host does:
+## keep-alive connections, an ETag and Last-Modified on every file, 304s for conditional requests that still match,
+## and byte ranges (honouring If-Range) for resuming a download
+## it can also be made to behave badly, to see how fetch.py copes:
+##   - validators = False: no ETag / Last-Modified, so every request sends the whole file again
+##   - cut_next[file name] = n: the next download of that file stops after n bytes and the connection is dropped
+## requests counts the responses by status and bytes_sent the body bytes sent
+##
+## from the command line (serving the repo's own csvs):
+##   python -m vaccinations.stand_in --directory . --port 8060
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_HEAD(self):
+        self._send_file(head = True)
+
+    def do_GET(self):
+        self._send_file(head = False)
+
+    def _respond(self, status, headers = None, body = b''):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.requests[status] += 1
+
+    def _send_file(self, head):
+        name = os.path.basename(self.path.split('?')[0])
+        path = os.path.join(self.server.directory, name)
+        if not name or not os.path.isfile(path):
+            self._respond(404, body = b'not found')
+            return
+
+        stat = os.stat(path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt = True)
+        headers = {'Content-Type': 'text/csv', 'Accept-Ranges': 'bytes'}
+        if self.server.validators:
+            headers.update({'ETag': etag, 'Last-Modified': last_modified})
+
+            if_none_match = self.headers.get('If-None-Match')
+            if_modified_since = self.headers.get('If-Modified-Since')
+            if if_none_match is not None:
+                if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+                    self._respond(304, headers)
+                    return
+            elif if_modified_since is not None:
+                try:
+                    since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+                except (TypeError, ValueError):
+                    since = -1
+                if int(stat.st_mtime) <= since:
+                    self._respond(304, headers)
+                    return
+
+        ## a range is only served while If-Range (when sent) still matches the file, otherwise the whole file goes out
+        start, stop, status = 0, stat.st_size, 200
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if match and (if_range is None or if_range in (etag, last_modified)):
+            start = int(match.group(1))
+            stop = min(int(match.group(2)) + 1, stat.st_size) if match.group(2) else stat.st_size
+            if start >= stat.st_size:
+                self._respond(416, {'Content-Range': f'bytes */{stat.st_size}'})
+                return
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{stat.st_size}'
+
+        with self.server.lock:
+            cut_after = None if head else self.server.cut_next.pop(name, None)
+            self.server.requests[status] += 1
+
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header('Content-Length', str(stop - start))
+        self.end_headers()
+        if head:
+            return
+
+        remaining = stop - start if cut_after is None else min(cut_after, stop - start)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(1 << 16, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                with self.server.lock:
+                    self.server.bytes_sent += len(chunk)
+        if cut_after is not None:
+            self.wfile.flush()
+            self.close_connection = True
+
+
+## a threaded server over directory, with the knobs above as attributes
+def make_server(directory, host = '127.0.0.1', port = 8060, validators = True, verbose = False):
+    server = http.server.ThreadingHTTPServer((host, port), StandInHandler)
+    server.daemon_threads = True
+    server.directory = directory
+    server.validators = validators
+    server.verbose = verbose
+    server.cut_next = {}
+    server.requests = collections.Counter()
+    server.bytes_sent = 0
+    server.lock = threading.Lock()
+    return server
+
+
+## starts a server in a background thread (port 0 picks a free port), returning it and its base url, stop it with server.shutdown()
+def start_server(directory, host = '127.0.0.1', port = 0, validators = True, verbose = False):
+    server = make_server(directory, host, port, validators, verbose)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server, f'http://{host}:{server.server_address[1]}/'
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'serve a directory of source csvs like a static host, with ETags, 304s and ranges')
+    parser.add_argument('--directory', default = '.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8060)
+    parser.add_argument('--no-validators', action = 'store_true', help = 'send no ETag / Last-Modified, so nothing can be conditional')
+    args = parser.parse_args(argv)
+
+    server = make_server(args.directory, args.host, args.port, validators = not args.no_validators, verbose = True)
+    print(f'serving {os.path.abspath(args.directory)} on http://{args.host}:{server.server_address[1]}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
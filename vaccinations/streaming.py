@@ -0,0 +1,128 @@
+import argparse
+import os
+
+import pandas as pd
+
+from vaccinations.enrichment import COLS_TO_FFILL
+from vaccinations.incremental import enrich_delta, update_percent_columns
+from vaccinations.loading import SOURCE_PATHS, VACCINATION_DTYPES, prepare_vaccinations, read_population, read_vaccinations
+from vaccinations.summary import summarize_state
+from vaccinations.validation import QUARANTINE_PATH, RowValidator, describe
+
+
+## a streaming version of reading and enriching the vaccination file, for histories that don't fit in memory
+## (sub-national or multi-year archives), holding only one chunk of rows plus a small per-country state table at a time
+## it makes two passes over the csv:
+##   1. scan_vaccinations: per-country first / last dates, row counts and maxima, plus the categories of the categorical columns
+##      the summary (total_vacc_df) comes straight out of this, and the maxima are what the percent columns divide by
+##   2. stream_enriched: the enriched chunks, carrying each country's last non-zero values across chunk boundaries
+##      with the same forward fill as the daily refresh (incremental.enrich_delta)
+## for a file grouped by country (as the kaggle file is), the chunks concatenated together are identical to enrichment.enrich_progress,
+## with the same rows, order, index, values and dtypes. otherwise each chunk's rows are grouped by country within the chunk only
+##
+## from the command line:
+##   python -m vaccinations.streaming --chunksize 100000 --output enriched.csv --summary summary.csv
+##   python -m vaccinations.streaming --chunksize 100000 --output enriched.csv --quarantine
+DEFAULT_CHUNKSIZE = 100000
+
+CATEGORICAL_COLS = [col for col, dtype in VACCINATION_DTYPES.items() if dtype == 'category']
+
+## the maxima the summary needs on top of the progression variables
+SUMMARY_COLS = ['total_vaccinations', 'total_vaccinations_per_hundred', 'people_vaccinated_per_hundred']
+
+
+## first pass: returns the per-country state (indexed by country, in order of first appearance) and the categories of each categorical column
+## the maxima are over the raw values, which are the same as the maxima of the forward filled ones (0 for a country with no values)
+def scan_vaccinations(path, chunksize = DEFAULT_CHUNKSIZE, cols_to_ffill = COLS_TO_FFILL):
+    max_cols = list(dict.fromkeys(cols_to_ffill + SUMMARY_COLS))
+    aggregations = {'first_date': ('date', 'min'), 'last_date': ('date', 'max'), 'n_rows': ('date', 'size')}
+    aggregations.update({f'max_{col}': (col, 'max') for col in max_cols})
+    combine = {name: ('sum' if name == 'n_rows' else agg) for name, (col, agg) in aggregations.items()}
+
+    state = None
+    categories = {col: set() for col in CATEGORICAL_COLS}
+    for chunk in read_vaccinations(path, chunksize = chunksize):
+        for col in CATEGORICAL_COLS:
+            categories[col].update(chunk[col].cat.categories)
+
+        chunk_state = chunk.groupby('country', sort = False, observed = True).agg(**aggregations)
+        chunk_state.index = chunk_state.index.astype(str)
+        state = chunk_state if state is None else pd.concat([state, chunk_state]).groupby(level = 0, sort = False).agg(combine)
+
+    state.index.name = 'country'
+    state[[f'max_{col}' for col in max_cols]] = state[[f'max_{col}' for col in max_cols]].fillna(0)
+
+    return state, {col: sorted(values) for col, values in categories.items()}
+
+
+## second pass: yields the enriched chunks (the rows of adjusted_df, chunk by chunk)
+## scan is the output of scan_vaccinations, which gets run first if it isn't passed in
+## validator (a validation.RowValidator) checks each chunk's raw rows on the way through, closing it is left to the caller
+def stream_enriched(path, continents, chunksize = DEFAULT_CHUNKSIZE, cols_to_ffill = COLS_TO_FFILL, scan = None, validator = None):
+    state, categories = scan if scan is not None else scan_vaccinations(path, chunksize, cols_to_ffill)
+
+    ## the merge makes Continent a categorical of whichever continents are in each chunk, so it gets fixed to the ones in the whole file
+    continent_dtype = pd.CategoricalDtype(sorted(state.index.map(continents.set_index('Country')['Continent']).dropna().unique()))
+
+    ## the carried state starts with each country's first date from the scan, and nothing to forward fill from yet
+    carry = pd.DataFrame({'first_date': state['first_date'], 'last_date': pd.NaT, 'n_rows': 0}, index = state.index)
+    for col in cols_to_ffill:
+        carry[f'last_{col}'] = float('nan')
+        carry[f'max_{col}'] = float('nan')
+
+    offset = 0
+    for chunk in read_vaccinations(path, categories = categories, chunksize = chunksize):
+        if validator is not None:
+            validator.check(chunk)
+        full_chunk = prepare_vaccinations(chunk, continents)
+        full_chunk['Continent'] = full_chunk['Continent'].astype(continent_dtype)
+        full_chunk.index = pd.RangeIndex(offset, offset + len(full_chunk))
+        offset += len(full_chunk)
+
+        delta_df, carry = enrich_delta(full_chunk, carry, cols_to_ffill)
+        yield update_percent_columns(delta_df, state)
+
+
+## streams the enriched rows into a csv, and returns the summary dataframe
+## with a quarantine_path, the raw rows that fail validation are written there as they stream past (see validation.py)
+def write_enriched(paths = SOURCE_PATHS, output_path = 'adjusted_df.csv', chunksize = DEFAULT_CHUNKSIZE, cols_to_ffill = COLS_TO_FFILL, quarantine_path = None):
+    continents = pd.read_csv(paths['continents'])
+    pop_dict = read_population(paths['population'])
+    scan = scan_vaccinations(paths['vaccinations'], chunksize, cols_to_ffill)
+    validator = RowValidator(continents, pop_dict, quarantine_path) if quarantine_path is not None else None
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok = True)
+    header = True
+    for chunk in stream_enriched(paths['vaccinations'], continents, chunksize, cols_to_ffill, scan = scan, validator = validator):
+        chunk.to_csv(output_path, mode = 'w' if header else 'a', header = header, index = False)
+        header = False
+    if validator is not None:
+        print(f'{describe(validator.close())}, quarantined rows in {quarantine_path}')
+
+    return summarize_state(scan[0], pop_dict, continents)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'enrich the vaccinations file chunk by chunk, with bounded memory')
+    parser.add_argument('--vaccinations', default = SOURCE_PATHS['vaccinations'])
+    parser.add_argument('--continents', default = SOURCE_PATHS['continents'])
+    parser.add_argument('--population', default = SOURCE_PATHS['population'])
+    parser.add_argument('--chunksize', type = int, default = DEFAULT_CHUNKSIZE, help = 'rows of the csv to hold in memory at once')
+    parser.add_argument('--output', default = 'adjusted_df.csv', help = 'csv to write the enriched rows to')
+    parser.add_argument('--summary', default = None, help = 'csv to write the per-country summary to')
+    parser.add_argument('--quarantine', nargs = '?', const = QUARANTINE_PATH, default = None, metavar = 'PATH',
+                        help = f'check the raw rows as they stream past, writing the ones that fail here (defaults to {QUARANTINE_PATH})')
+    args = parser.parse_args(argv)
+
+    paths = {'vaccinations': args.vaccinations, 'continents': args.continents, 'population': args.population}
+    total_vacc_df = write_enriched(paths, args.output, args.chunksize, quarantine_path = args.quarantine)
+    if args.summary is not None:
+        os.makedirs(os.path.dirname(args.summary) or '.', exist_ok = True)
+        total_vacc_df.to_csv(args.summary, index = False)
+
+    print(f'{total_vacc_df["n_rows"].sum()} rows for {len(total_vacc_df)} countries enriched into {args.output}')
+    return total_vacc_df
+
+
+if __name__ == '__main__':
+    main()
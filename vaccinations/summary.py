@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+
+## here we are building one big "current progress" dataframe, giving one row per country
+## detailing how they fare as of today
+## whereas the adjusted dataframe is a tall file listing individual days of progress,
+## we will use this to compare how countries have done up until this point in time
+## everything comes out of a single groupby pass over the adjusted dataframe, with the population and continent lookups mapped on after:
+##   - total_vaccinations / total_per_hundred: max totals so far
+##   - day_started / days_since_starting: first day of data and how many days they have been vaccinating
+##   - n_rows: number of days of data
+##   - predictable: whether the country has people vaccinated data and enough days (min_rows) to fit a completion curve to
+##   - population / continent
+def summarize_countries(adjusted_df, pop_dict, continents, min_rows = 5):
+    total_vacc_df = adjusted_df.groupby('country', sort = False, observed = True).agg(
+        total_vaccinations = ('total_vaccinations', 'max'),
+        total_per_hundred = ('total_vaccinations_per_hundred', 'max'),
+        day_started = ('date', 'min'),
+        days_since_starting = ('vaccination_day_number', 'max'),
+        people_per_hundred = ('people_vaccinated_per_hundred', 'max'),
+        n_rows = ('date', 'size')
+    )
+
+    return finish_summary(total_vacc_df, pop_dict, continents, min_rows)
+
+
+## the same summary from a per-country state table (indexed by country, in order of first appearance, with first_date, last_date, n_rows and
+## the max_<col> of total_vaccinations, total_vaccinations_per_hundred and people_vaccinated_per_hundred), without the adjusted dataframe
+## this is how streaming.py (from its first pass) and incremental.py (from its checkpointed state) get total_vacc_df
+def summarize_state(state, pop_dict, continents, min_rows = 5):
+    total_vacc_df = pd.DataFrame({
+        'total_vaccinations': state['max_total_vaccinations'],
+        'total_per_hundred': state['max_total_vaccinations_per_hundred'],
+        'day_started': state['first_date'],
+        'days_since_starting': (state['last_date'] - state['first_date']).dt.days,
+        'people_per_hundred': state['max_people_vaccinated_per_hundred'],
+        'n_rows': state['n_rows']
+    })
+    return finish_summary(total_vacc_df, pop_dict, continents, min_rows)
+
+
+## turns the per-country aggregates (indexed by country, with a people_per_hundred column) into the summary dataframe above
+def finish_summary(total_vacc_df, pop_dict, continents, min_rows = 5):
+    total_vacc_df['predictable'] = (total_vacc_df['people_per_hundred'] > 0) & (total_vacc_df['n_rows'] >= min_rows)
+    total_vacc_df = total_vacc_df.drop('people_per_hundred', axis = 1)
+
+    total_vacc_df = total_vacc_df.reset_index().sort_values(by = 'total_vaccinations', ascending = False).reset_index(drop = True)
+    total_vacc_df['country'] = total_vacc_df['country'].astype(str)
+    total_vacc_df['population'] = total_vacc_df['country'].map(pop_dict.set_index('Country')['Population'])
+    total_vacc_df['continent'] = total_vacc_df['country'].map(continents.set_index('Country')['Continent'])
+
+    return total_vacc_df
+
+
+## just some cleaning for some division later: countries need at least one day since starting to have a daily rate
+## average_daily_percent_vaccinated, while not the most informative variable, is the straightline average percent of the population
+## each country is vaccinating *per day* since they started vaccinating
+## world is a plain text column just as a parent for our treemaps
+def add_daily_rates(total_vacc_df):
+    total_vacc_df = total_vacc_df[total_vacc_df['days_since_starting'] > 0].copy()
+    total_vacc_df['days_since_starting'] = total_vacc_df['days_since_starting'].astype('float64')
+    total_vacc_df['total_per_hundred'] = total_vacc_df['total_per_hundred'].astype('float64')
+
+    total_vacc_df['average_daily_percent_vaccinated'] = round(total_vacc_df['total_per_hundred'] / total_vacc_df['days_since_starting'], 4)
+    total_vacc_df['world'] = 'world'
+
+    return total_vacc_df.replace(np.inf, np.nan)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+
+## this dataset bundles the vaccines a country is using together in one variable named vaccines, e.g. 'Moderna, Pfizer/BioNTech'
+## rather than adding a True/False column per vaccine to every row of the daily data, we keep one small country x vaccine membership matrix
+## a country counts as using a vaccine if it shows up in any of its rows
+## countries and vaccines are kept in order of first appearance in the data
+class VaccineIndex:
+    def __init__(self, countries, vaccines, matrix):
+        self.countries = list(countries)
+        self.vaccines = list(vaccines)
+        self.matrix = np.asarray(matrix, dtype = bool)
+        self._country_pos = pd.Index(self.countries)
+        self._vaccine_pos = {vacc: i for i, vacc in enumerate(self.vaccines)}
+
+    ## the vaccines column is only split once per distinct (country, vaccine set) pair, not once per row
+    @classmethod
+    def from_frame(cls, df, country_col = 'country', vaccines_col = 'vaccines'):
+        pairs = df[[country_col, vaccines_col]].drop_duplicates()
+        countries = pd.unique(pairs[country_col])
+
+        exploded = pairs.assign(vaccine = pairs[vaccines_col].astype(str).str.split(', ')).explode('vaccine')
+        vaccines = pd.unique(exploded['vaccine'])
+
+        matrix = np.zeros((len(countries), len(vaccines)), dtype = bool)
+        rows = pd.Index(countries).get_indexer(exploded[country_col])
+        cols = pd.Index(vaccines).get_indexer(exploded['vaccine'])
+        matrix[rows, cols] = True
+
+        return cls(countries, vaccines, matrix)
+
+    def _vaccine_col(self, vaccine):
+        if vaccine not in self._vaccine_pos:
+            raise KeyError(f'unknown vaccine: {vaccine}')
+        return self._vaccine_pos[vaccine]
+
+    def countries_for(self, vaccine):
+        rows = np.flatnonzero(self.matrix[:, self._vaccine_col(vaccine)])
+        return [self.countries[i] for i in rows]
+
+    def vaccines_for(self, country):
+        row = self._country_pos.get_loc(country)
+        return [self.vaccines[j] for j in np.flatnonzero(self.matrix[row])]
+
+    def counts(self):
+        return pd.Series(self.matrix.sum(axis = 0), index = self.vaccines)
+
+    ## maps each row's country onto the matrix, giving a True/False array for filtering a daily dataframe down to one vaccine
+    ## countries that aren't in the index come back False
+    def row_mask(self, countries, vaccine):
+        return self.membership(countries)[:, self._vaccine_col(vaccine)]
+
+    ## the rows of the matrix for the given countries (countries x vaccines), all False for countries that aren't in the index
+    def membership(self, countries):
+        rows = self._country_pos.get_indexer(countries)
+        return np.where((rows >= 0)[:, None], self.matrix[rows], False)
+
+    ## the dictionary layout used by the analysis script: for each vaccine, the number of countries and the list of them
+    def to_dict(self):
+        return {vacc: {'number': len(countries), 'list_countries': countries}
+                for vacc, countries in ((vacc, self.countries_for(vacc)) for vacc in self.vaccines)}
+
+
+## a simple table for each unique set of vaccinations (the raw vaccines column), with the number of countries
+## that set can be found in, along with the list of countries
+def vaccine_set_counts(full_df):
+    pairs = full_df[['vaccines', 'country']].drop_duplicates()
+    grouped = pairs['country'].astype(str).groupby(pairs['vaccines'], sort = False, observed = True)
+    return pd.DataFrame({'count': grouped.size(), 'countries': grouped.agg(list)}).reset_index().rename(columns = {'vaccines': 'vaccine_set'})
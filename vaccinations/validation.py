@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from vaccinations.loading import COUNT_COLS, SOURCE_PATHS, read_population, read_vaccinations
+
+
+## prepare_vaccinations fills every missing number with 0 and enrichment forward fills over those zeros,
+## which is what the charts need, but it also hides anything wrong with the raw rows. so before that, every row gets checked for:
+##   - duplicate_row: a (country, date) that has already been seen (the first one isn't flagged), or in a later chunk of ordered input,
+##     a date that isn't after the last one its country has had (see below)
+##   - non_monotonic: a cumulative count (total / people / fully vaccinated) below the highest one the country reported on an earlier date
+##   - negative_count: any count below 0
+##   - per_hundred_mismatch: a per-hundred rate more than PER_HUNDRED_TOLERANCE (relative, plus 0.01 for the rounding to 2 decimals)
+##     away from its count over the country's population in population_by_country_2020.csv
+##   - missing_continent / missing_population: a country that isn't in country_continents.csv / population_by_country_2020.csv
+## all of it is vectorized over the rows: one sort by (country, date) serves the duplicate and monotonic checks, the lookups are
+## done once per distinct country and spread to the rows by their codes
+## flagged rows are NOT dropped, they still go through the pipeline as before, they are written to the quarantine file
+## (with an issues column naming their checks) and counted in a summary json next to it
+##
+## RowValidator carries each country's highest counts and last date from one call to the next, so streamed chunks (see streaming.py)
+## get the same flags the whole file would, exactly so for a file that lists each country's rows in date order (as the kaggle one does):
+## there a (country, date) from an earlier chunk can only come up again as a date that isn't after its country's last one, so that is all
+## that gets kept, and the state stays one row per country however long the file is. a row that turns up in a later chunk than rows of
+## the same country with later dates is held against their counts, and flagged duplicate_row, where the whole file might flag neither
+## with ordered = False (--unordered) every (country, date) seen is kept instead, so duplicates across chunks are caught in any order,
+## at the cost of memory growing with the file
+##
+## from the command line:
+##   python -m vaccinations.validation --quarantine .quarantine/country_vaccinations.csv
+##   python -m vaccinations.validation --chunksize 100000
+##   python -m vaccinations.validation --chunksize 100000 --unordered     (a file that doesn't list each country's rows in date order)
+QUARANTINE_PATH = os.path.join('.quarantine', 'country_vaccinations.csv')
+
+CHECKS = ['duplicate_row', 'non_monotonic', 'negative_count', 'per_hundred_mismatch', 'missing_continent', 'missing_population']
+
+CUMULATIVE_COLS = ['total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated']
+PER_HUNDRED_COLS = {col: f'{col}_per_hundred' for col in CUMULATIVE_COLS}
+PER_HUNDRED_TOLERANCE = 0.1
+
+
+## the summary json sits next to the quarantine file
+def summary_path(quarantine_path):
+    return os.path.splitext(quarantine_path)[0] + '_summary.json'
+
+
+class RowValidator:
+    def __init__(self, continents, pop_dict, quarantine_path = None, tolerance = PER_HUNDRED_TOLERANCE, ordered = True):
+        self.continent_countries = pd.Index(continents['Country'].dropna().astype(str).unique())
+        self.population = pop_dict.drop_duplicates('Country').set_index('Country')['Population'].astype('float64')
+        self.quarantine_path = quarantine_path
+        self.tolerance = tolerance
+        self.ordered = ordered
+
+        ## the carried state, per country id (ids are handed out in order of first appearance)
+        ## (and for unordered input, every (country, day) key seen, sorted)
+        self.countries = pd.Index([], dtype = object)
+        self.highest = np.empty((0, len(CUMULATIVE_COLS)))
+        self.last_day = np.empty(0, dtype = 'int64')
+        self.seen = np.empty(0, dtype = 'int64')
+
+        self.rows = 0
+        self.counts = dict.fromkeys(CHECKS, 0)
+        self.flagged_rows = 0
+        self.flagged_countries = {check: set() for check in CHECKS}
+        self._wrote_header = False
+
+    ## ids for the distinct countries of a chunk, adding any new ones
+    def _country_ids(self, uniques):
+        new = uniques.difference(self.countries, sort = False)
+        if len(new):
+            self.countries = self.countries.append(new)
+            self.highest = np.vstack([self.highest, np.full((len(new), len(CUMULATIVE_COLS)), -np.inf)])
+            self.last_day = np.r_[self.last_day, np.full(len(new), np.iinfo('int64').min)]
+        return self.countries.get_indexer(uniques)
+
+    ## the True / False flags of every check for each row of df (the raw typed rows, as read_vaccinations gives them), same index
+    def check(self, df):
+        codes, uniques = pd.factorize(df['country'])
+        uniques = pd.Index(np.asarray(uniques, dtype = object).astype(str))
+        ids = self._country_ids(uniques)[codes]
+        flags = {}
+
+        ## one stable sort by (country, day) keeps the duplicates in file order, with the first one of each (country, day) ahead
+        days = df['date'].to_numpy(dtype = 'datetime64[D]').astype('int64')
+        keys = ids.astype('int64') << 32 | (days - np.iinfo('int32').min)
+        order = np.argsort(keys, kind = 'stable')
+        sorted_keys, sorted_ids = keys[order], ids[order]
+        starts = np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]
+        ends = np.r_[starts[1:], True]
+
+        ## each count column is converted to floats (NaN for missing) once, for all the checks below
+        values = {col: df[col].to_numpy(dtype = 'float64', na_value = np.nan) for col in COUNT_COLS}
+
+        duplicate_sorted = np.r_[False, sorted_keys[1:] == sorted_keys[:-1]]
+        sorted_days = days[order]
+        if self.ordered:
+            duplicate_sorted |= sorted_days <= self.last_day[sorted_ids]
+            if len(df):
+                self.last_day[sorted_ids[ends]] = np.maximum(self.last_day[sorted_ids[ends]], sorted_days[ends])
+        else:
+            if len(self.seen):
+                positions = np.searchsorted(self.seen, sorted_keys)
+                duplicate_sorted |= self.seen[np.minimum(positions, len(self.seen) - 1)] == sorted_keys
+            ## the new keys are already sorted, so they are merged into seen in place rather than sorting the lot again
+            new_keys = sorted_keys[~duplicate_sorted]
+            self.seen = np.insert(self.seen, np.searchsorted(self.seen, new_keys), new_keys) if len(self.seen) else new_keys
+        duplicate = np.zeros(len(df), dtype = bool)
+        duplicate[order] = duplicate_sorted
+        flags['duplicate_row'] = duplicate
+
+        ## the highest count on earlier rows of the country: the running max within the chunk (shifted down a row),
+        ## or what was carried over from earlier chunks
+        counts = np.column_stack([values[col] for col in CUMULATIVE_COLS])[order]
+        running = pd.DataFrame(np.where(np.isnan(counts), -np.inf, counts)).groupby(sorted_ids).cummax().to_numpy()
+        earlier = np.where(starts[:, None], -np.inf, np.roll(running, 1, axis = 0))
+        earlier = np.maximum(earlier, self.highest[sorted_ids])
+        non_monotonic = np.zeros(len(df), dtype = bool)
+        non_monotonic[order] = (counts < earlier).any(axis = 1)
+        flags['non_monotonic'] = non_monotonic
+        if len(df):
+            self.highest[sorted_ids[ends]] = running[ends]
+
+        flags['negative_count'] = np.column_stack([values[col] < 0 for col in COUNT_COLS]).any(axis = 1)
+
+        country_population = uniques.map(self.population).to_numpy(dtype = 'float64', na_value = np.nan)
+        population = country_population[codes]
+        mismatch = np.zeros(len(df), dtype = bool)
+        with np.errstate(invalid = 'ignore'):
+            for col, rate_col in PER_HUNDRED_COLS.items():
+                expected = values[col] / population * 100
+                mismatch |= np.abs(df[rate_col].to_numpy(dtype = 'float64', na_value = np.nan) - expected) > np.maximum(self.tolerance * expected, 0.01)
+        flags['per_hundred_mismatch'] = mismatch
+
+        flags['missing_continent'] = ~uniques.isin(self.continent_countries)[codes]
+        flags['missing_population'] = np.isnan(country_population)[codes]
+
+        flags = pd.DataFrame(flags, index = df.index)[CHECKS]
+        self._record(df, flags, uniques, codes)
+        return flags
+
+    def _record(self, df, flags, uniques, codes):
+        flagged = flags.any(axis = 1).to_numpy()
+        self.rows += len(df)
+        self.flagged_rows += int(flagged.sum())
+        for check in CHECKS:
+            self.counts[check] += int(flags[check].sum())
+            self.flagged_countries[check].update(uniques[np.unique(codes[flags[check].to_numpy()])])
+
+        if self.quarantine_path is not None and flagged.any():
+            rows = quarantine_rows(df[flagged], flags[flagged])
+            os.makedirs(os.path.dirname(self.quarantine_path) or '.', exist_ok = True)
+            rows.to_csv(self.quarantine_path + '.tmp', mode = 'a' if self._wrote_header else 'w', header = not self._wrote_header, index = False)
+            self._wrote_header = True
+
+    ## the counts so far: rows checked, rows flagged by any check, rows flagged by each check and the countries each check flagged
+    def summary(self):
+        return {'rows': self.rows, 'flagged_rows': self.flagged_rows, 'checks': dict(self.counts),
+                'countries': {check: sorted(countries) for check, countries in self.flagged_countries.items() if countries}}
+
+    ## moves the quarantine file into place (an empty one, with just the header, if nothing was flagged) and writes the summary json
+    ## returns the summary
+    def close(self):
+        summary = self.summary()
+        if self.quarantine_path is not None:
+            os.makedirs(os.path.dirname(self.quarantine_path) or '.', exist_ok = True)
+            if not self._wrote_header:
+                pd.DataFrame(columns = ['row', 'issues']).to_csv(self.quarantine_path + '.tmp', index = False)
+            os.replace(self.quarantine_path + '.tmp', self.quarantine_path)
+
+            tmp_path = summary_path(self.quarantine_path) + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({**summary, 'checked_at': time.time()}, f, indent = 2)
+            os.replace(tmp_path, summary_path(self.quarantine_path))
+        return summary
+
+
+## the offending rows, with the row they were in (their index) and the checks they failed as e.g. 'non_monotonic;per_hundred_mismatch'
+def quarantine_rows(df, flags):
+    issues = flags.dot(pd.Index(flags.columns) + ';').str.rstrip(';')
+    return df.assign(issues = issues).rename_axis('row').reset_index()
+
+
+## checks a whole frame of raw rows at once, writing the quarantine file and summary when quarantine_path is given
+## returns the flags and the summary
+def validate(df, continents, pop_dict, quarantine_path = None, tolerance = PER_HUNDRED_TOLERANCE):
+    validator = RowValidator(continents, pop_dict, quarantine_path, tolerance)
+    flags = validator.check(df)
+    return flags, validator.close()
+
+
+## one line for the command line, e.g. '52 of 5972 rows flagged (per_hundred_mismatch: 52)'
+def describe(summary):
+    checks = ', '.join(f'{check}: {count}' for check, count in summary['checks'].items() if count)
+    return f'{summary["flagged_rows"]} of {summary["rows"]} rows flagged' + (f' ({checks})' if checks else '')
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'check the raw vaccination rows, writing the ones that fail to a quarantine file')
+    parser.add_argument('--vaccinations', default = SOURCE_PATHS['vaccinations'])
+    parser.add_argument('--continents', default = SOURCE_PATHS['continents'])
+    parser.add_argument('--population', default = SOURCE_PATHS['population'])
+    parser.add_argument('--quarantine', default = QUARANTINE_PATH)
+    parser.add_argument('--chunksize', type = int, default = None, help = 'check the file this many rows at a time')
+    parser.add_argument('--tolerance', type = float, default = PER_HUNDRED_TOLERANCE)
+    parser.add_argument('--unordered', action = 'store_true', help = 'the file does not list each country in date order (keeps every date seen across chunks)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    validator = RowValidator(pd.read_csv(args.continents), read_population(args.population), args.quarantine, args.tolerance, not args.unordered)
+    chunks = read_vaccinations(args.vaccinations, chunksize = args.chunksize) if args.chunksize else [read_vaccinations(args.vaccinations)]
+    for chunk in chunks:
+        validator.check(chunk)
+    summary = validator.close()
+
+    print(describe(summary))
+    for check, countries in summary['countries'].items():
+        print(f'  {check}: {", ".join(countries[:10])}{" ..." if len(countries) > 10 else ""}')
+    print(f'quarantined rows written to {args.quarantine} ({time.perf_counter() - start:.3f}s)')
+    return summary
+
+
+if __name__ == '__main__':
+    main()